@@ -1,15 +1,4537 @@
+import time
+_IMPORT_START = time.perf_counter()  # Начало импорта модуля (для --profile-startup)
+
 import sys
 import os
+import json
+import re
+import html
+import hashlib
+import argparse
+import functools
+import collections
+import contextlib
+import threading
+import csv
+import atexit
+import shutil
+import tempfile
+import weakref
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, 
                            QLabel, QLineEdit, QPushButton, QTextEdit, QWidget, 
                            QFileDialog, QMessageBox, QComboBox, QGroupBox,
                            QTabWidget, QProgressBar, QSplitter, QInputDialog,
-                           QCheckBox, QDialog, QScrollArea)
-from PyQt5.QtCore import Qt
+                           QCheckBox, QDialog, QScrollArea, QListWidget,
+                           QListWidgetItem, QTableWidget, QTableWidgetItem)
+from PyQt5.QtCore import Qt, QTimer
+
+
+def load_matplotlib_qt():
+    """Отложенный импорт matplotlib: класс Figure и холст Qt5Agg"""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+    return Figure, FigureCanvas
+
+
+# === ИНСТРУМЕНТИРОВАНИЕ ===
+
+def current_memory():
+    """Резидентная память процесса, байт (0, если определить нельзя)"""
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        except ImportError:
+            return 0
+
+
+class Profiler:
+    """Сбор времени, числа вызовов, обработанных точек и памяти по стадиям.
+
+    События сохраняются для трассировки в формате Chrome trace
+    (chrome://tracing, Perfetto); хранятся последние max_events событий.
+    """
+
+    def __init__(self, max_events=100000):
+        self.stats = {}
+        self.events = collections.deque(maxlen=max_events)
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()  # Стадии могут идти в нескольких потоках
+
+    def reset(self):
+        self.stats.clear()
+        self.events.clear()
+
+    @contextlib.contextmanager
+    def stage(self, name, points=0):
+        """Замер стадии; число точек можно уточнить через record['points']"""
+        record = {'points': points}
+        memory_before = current_memory()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            duration = time.perf_counter() - start
+            memory = current_memory()
+            with self._lock:
+                stat = self.stats.setdefault(name, {'calls': 0, 'time': 0.0, 'points': 0,
+                                                    'memory': 0, 'memory_delta': 0})
+                stat['calls'] += 1
+                stat['time'] += duration
+                stat['points'] += record['points']
+                stat['memory'] = memory
+                stat['memory_delta'] += memory - memory_before
+                self.events.append({
+                    'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+                    'ts': (start - self._origin) * 1e6, 'dur': duration * 1e6,
+                    'args': {'points': record['points'], 'memory': memory},
+                })
+
+    def mean_time(self, name, default=None):
+        """Среднее время одного вызова стадии, с"""
+        stat = self.stats.get(name)
+        if not stat or not stat['calls']:
+            return default
+        return stat['time'] / stat['calls']
+
+    def chrome_trace(self):
+        return {'traceEvents': list(self.events), 'displayTimeUnit': 'ms'}
+
+    def save_trace(self, path):
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.chrome_trace(), file)
+
+
+# Общий профилировщик приложения
+PROFILER = Profiler()
+
+
+# === ЧТЕНИЕ ФАЙЛОВ СПЕКТРОВ ===
+
+# Колонки x/y и допустимые разделители для каждого вида спектров
+SPECTRUM_FORMATS = {
+    'emission': (0, 5, (';', ',', '\t', ' ')),
+    'absorption': (0, 1, (',', ';', '\t', ' ')),
+    'response': (0, 1, (',', ';', '\t', ' ')),
+}
+SPECTRUM_EXTENSIONS = {'.tit': 'emission', '.txt': 'absorption'}
+MIN_SERIES_POINTS = 5  # Меньше точек в блоке - не серия, а особенности сетки одного спектра
+
+class ParseCache(collections.OrderedDict):
+    """Кэш разобранных файлов: (хэш содержимого, вид) -> (x, y).
+
+    Ключ по содержимому (см. content_digest): одинаковые файлы под разными
+    именами и путями разбираются один раз. При заданном max_bytes давно не использованные записи удаляются (файлы
+    остаются на диске и будут разобраны заново). В режиме float32 (MEMORY)
+    массивы хранятся в одинарной точности.
+    """
+
+    def __init__(self, max_bytes=None):
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._lock = threading.Lock()  # Архивы разбираются в нескольких потоках
+
+    @staticmethod
+    def _size(value):
+        return sum(item.nbytes for item in value if isinstance(item, np.ndarray))
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self:
+                return default
+            self.move_to_end(key)
+            return super().__getitem__(key)
+
+    def __setitem__(self, key, value):
+        if MEMORY.float32:
+            value = tuple(item.astype(np.float32) if isinstance(item, np.ndarray) else item for item in value)
+        with self._lock:
+            if key in self:
+                self.nbytes -= self._size(super().__getitem__(key))
+            super().__setitem__(key, value)
+            self.nbytes += self._size(value)
+        self.shrink()
+
+    def shrink(self):
+        with self._lock:
+            while self.max_bytes is not None and self.nbytes > self.max_bytes and len(self) > 1:
+                _, value = self.popitem(last=False)
+                self.nbytes -= self._size(value)
+
+    def clear(self):
+        with self._lock:
+            super().clear()
+            self.nbytes = 0
+
+
+# Предел общего кэша разобранных файлов на процесс. Процессы сервиса и
+# пакетной обработки живут долго и без предела держали бы каждый когда-либо
+# разобранный спектр. Переменная окружения наследуется процессами пула.
+PARSE_CACHE_ENV = 'QY_PARSE_CACHE_MB'  # МБ или 'none' - без ограничения
+PARSE_CACHE_MB = 512
+
+
+def parse_cache_limit():
+    """Предел кэша разобранных файлов, байт (None - без ограничения)"""
+    value = os.environ.get(PARSE_CACHE_ENV, '').strip().lower()
+    if value == 'none':
+        return None
+    try:
+        megabytes = float(value) if value else PARSE_CACHE_MB
+    except ValueError:
+        megabytes = PARSE_CACHE_MB
+    return int(megabytes * 2**20)
+
+
+# Общий кэш разобранных файлов
+_spectrum_cache = ParseCache(parse_cache_limit())
+
+CONTENT_HASH_CHUNK = 1 << 20  # Файлы хэшируются блоками, не читаясь целиком
+CONTENT_DIGEST_ENTRIES = 50000  # Запоминаемых хэшей файлов не больше (около 15 МБ)
+
+
+class DigestCache(collections.OrderedDict):
+    """Хэши содержимого по (путь, размер, mtime): неизмененный файл не
+    хэшируется повторно. Сверх max_entries записей давно не использованные
+    удаляются (файл будет хэширован заново), так что записи переименованных
+    и измененных файлов не накапливаются в долго работающем процессе.
+    """
+
+    def __init__(self, max_entries=None):
+        super().__init__()
+        self.max_entries = max_entries
+        self._lock = threading.Lock()  # Файлы архивов хэшируются в нескольких потоках
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self:
+                return default
+            self.move_to_end(key)
+            return super().__getitem__(key)
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            super().__setitem__(key, value)
+            self.move_to_end(key)
+            while self.max_entries is not None and len(self) > self.max_entries:
+                self.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            super().clear()
+
+
+_content_digests = DigestCache(CONTENT_DIGEST_ENTRIES)
+
+
+class DuplicateSpectrumError(ValueError):
+    """Файл совпадает по содержимому с уже прочитанным файлом original"""
+
+    def __init__(self, original):
+        super().__init__(f"duplicate of {original}")
+        self.original = original
+
+
+def content_hasher():
+    """Потоковый хэш содержимого: xxHash (XXH3-128), если установлен, иначе BLAKE2b"""
+    try:
+        import xxhash
+        return xxhash.xxh3_128()
+    except ImportError:
+        return hashlib.blake2b(digest_size=16)
+
+
+def data_digest(data):
+    """Хэш содержимого, уже прочитанного в память (файлы архивов)"""
+    hasher = content_hasher()
+    hasher.update(data)
+    return hasher.hexdigest()
+
+
+def content_digest(path):
+    """Хэш содержимого файла; запоминается по пути, размеру и дате изменения"""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    digest = _content_digests.get(key)
+    if digest is None:
+        hasher = content_hasher()
+        with PROFILER.stage('hash', stat.st_size):
+            with open(path, 'rb') as file:
+                for chunk in iter(lambda: file.read(CONTENT_HASH_CHUNK), b''):
+                    hasher.update(chunk)
+        digest = hasher.hexdigest()
+        _content_digests[key] = digest
+    return digest
+
+
+class SpectrumFormatError(ValueError):
+    """Файл не содержит числовых данных в ожидаемом формате"""
+
+
+def robust_float_conversion(value):
+    """Безопасное преобразование в float"""
+    try:
+        # Убираем возможные пробелы и нечисловые символы
+        cleaned_value = ''.join(c for c in str(value) if c.isdigit() or c in '.-eE')
+        return float(cleaned_value)
+    except (ValueError, TypeError):
+        return None
+
+
+def parse_spectrum_lines(lines, x_col, y_col, separators):
+    """Разбор строк текстового спектра: значения колонок x_col и y_col"""
+    x, y = [], []
+    min_parts = max(x_col, y_col) + 1
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        # Пробуем разные разделители
+        for separator in separators:
+            if separator in line:
+                parts = [part.strip() for part in line.split(separator) if part.strip()]
+                if len(parts) >= min_parts:
+                    x_val = robust_float_conversion(parts[x_col])
+                    y_val = robust_float_conversion(parts[y_col])
+                    if x_val is not None and y_val is not None:
+                        x.append(x_val)
+                        y.append(y_val)
+                        break  # Успешно обработали строку
+    return np.array(x, dtype=np.float64), np.array(y, dtype=np.float64)
+
+
+def split_series(x, y):
+    """Разбиение подряд записанных спектров одного файла на серию.
+
+    Новый спектр начинается там, где длина волны поворачивает против
+    основного направления сетки (снова с начала диапазона). Спектры серии
+    приводятся к сетке первого (интерполяцией, если сетки различаются).
+    Возвращает (сетка, матрица время x длина волны); одиночный спектр -
+    матрица из одной строки.
+    """
+    single = (x, y[None, :])
+    if len(x) < 2 * MIN_SERIES_POINTS:
+        return single
+    steps = np.diff(x)
+    direction = np.sign(np.median(steps))
+    breaks = np.flatnonzero(np.sign(steps) == -direction) + 1
+    if direction == 0 or not len(breaks):
+        return single
+    bounds = np.concatenate(([0], breaks, [len(x)]))
+    lengths = np.diff(bounds)
+    if lengths.min() < MIN_SERIES_POINTS:
+        return single
+    # Возврат к началу диапазона, а не случайный сбой порядка точек
+    spans = np.abs(x[breaks - 1] - x[bounds[:-2]])
+    if (np.abs(x[breaks - 1] - x[breaks]) < 0.5 * spans).any():
+        return single
+
+    grid = x[:lengths[0]]
+    if (lengths == lengths[0]).all():
+        blocks = x.reshape(len(lengths), lengths[0])
+        if np.allclose(blocks, grid[None, :]):
+            return grid, y.reshape(len(lengths), lengths[0])
+    # Сетки спектров различаются - интерполяция на сетку первого спектра
+    order = np.argsort(grid)
+    series = np.empty((len(lengths), len(grid)))
+    for i, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+        block = np.argsort(x[start:end]) + start
+        series[i, order] = np.interp(grid[order], x[block], y[block])
+    return grid, series
+
+
+def read_spectrum_file(filepath, kind):
+    """Чтение файла спектра вида kind с использованием общего кэша.
+
+    Из файла эмиссии с серией спектров (см. split_series) для калибровки
+    берется первый спектр серии; всю серию возвращает read_emission_series.
+    """
+    if os.path.splitext(filepath)[1].lower() in SPECTRUM_READERS:
+        file_kind, x, y = read_typed_spectrum_file(filepath)
+        if file_kind != kind:
+            raise SpectrumFormatError(f"{filepath}: {file_kind} spectrum, expected {kind}")
+        return x, y
+    key = (content_digest(filepath), kind)
+    cached = _spectrum_cache.get(key)
+    if cached is None:
+        x_col, y_col, separators = SPECTRUM_FORMATS[kind]
+        with PROFILER.stage('parse') as record:
+            with open(filepath, 'r', encoding='utf-8', errors='ignore') as file:
+                x, y = parse_spectrum_lines(file, x_col, y_col, separators)
+            record['points'] = len(x)
+        if len(x) == 0:
+            raise SpectrumFormatError(filepath)
+        if kind == 'emission':
+            x, series = split_series(x, y)
+            y = series[0]
+        cached = (x, y)
+        _spectrum_cache[key] = cached
+    return cached
+
+
+def _source_digest(source):
+    """Хэш содержимого файла или файла архива <архив>::<файл> (см.
+    content_digest; файл архива запоминается по дате самого архива).
+    Возвращает (хэш, содержимое файла архива, если его пришлось прочитать)."""
+    path, _, member = source.partition(ARCHIVE_SEPARATOR)
+    if not member:
+        return content_digest(path), None
+    stat = os.stat(path)
+    member_key = (os.path.abspath(path) + ARCHIVE_SEPARATOR + member, stat.st_size, stat.st_mtime_ns)
+    digest = _content_digests.get(member_key)
+    if digest is not None:
+        return digest, None
+    data = read_archive_member(path, member)
+    digest = _content_digests[member_key] = data_digest(data)
+    return digest, data
+
+
+def source_digest(source):
+    """Хэш содержимого файла или файла архива <архив>::<файл>"""
+    return _source_digest(source)[0]
+
+
+def read_emission_series(source):
+    """Серия спектров эмиссии файла (или файла архива <архив>::<файл>):
+    (сетка, матрица время x длина волны) с использованием общего кэша"""
+    path, _, member = source.partition(ARCHIVE_SEPARATOR)
+    digest, data = _source_digest(source)
+    key = (digest, 'series')
+    cached = _spectrum_cache.get(key)
+    if cached is None:
+        if data is None and member:
+            data = read_archive_member(path, member)
+        elif data is None:
+            with open(path, 'rb') as file:
+                data = file.read()
+        x_col, y_col, separators = SPECTRUM_FORMATS['emission']
+        with PROFILER.stage('parse_series') as record:
+            x, y = parse_spectrum_lines(data.decode('utf-8', errors='ignore').splitlines(),
+                                        x_col, y_col, separators)
+            record['points'] = len(x)
+        if len(x) == 0:
+            raise SpectrumFormatError(source)
+        cached = split_series(x, y)
+        _spectrum_cache[key] = cached
+    return cached
+
+
+def read_emission_file(filepath):
+    """Чтение .tit файла эмиссии (колонки 0 и 5)"""
+    return read_spectrum_file(filepath, 'emission')
+
+
+def read_absorption_file(filepath):
+    """Чтение .txt файла абсорбции (колонки 0 и 1)"""
+    return read_spectrum_file(filepath, 'absorption')
+
+
+# === ФОРМАТЫ ПРИБОРОВ: JCAMP-DX И SPC ===
+#
+# Вид спектра (эмиссия или абсорбция) в этих форматах берется из самого
+# файла: DATA TYPE в JCAMP-DX, тип эксперимента fexper в SPC.
+
+# Классы символов сжатых данных JCAMP-DX (ASDF)
+_ASDF_SEPARATOR, _ASDF_DIGIT, _ASDF_DOT, _ASDF_SQZ, _ASDF_DIF, _ASDF_DUP = range(6)
+_ASDF_PLUS, _ASDF_MINUS, _ASDF_MISSING, _ASDF_NEWLINE = range(6, 10)
+# Виды лексем: абсолютное значение, разность, повторение, конец строки
+_TOKEN_ABS, _TOKEN_DIF, _TOKEN_DUP, _TOKEN_NEWLINE = range(4)
+
+
+def _asdf_tables():
+    """Таблицы (по коду байта): класс символа, цифра и знак"""
+    classes = np.full(256, _ASDF_SEPARATOR, dtype=np.int8)
+    digits = np.zeros(256)
+    signs = np.ones(256)
+    for i, c in enumerate('0123456789'):
+        classes[ord(c)], digits[ord(c)] = _ASDF_DIGIT, i
+    for cls, positive, negative in ((_ASDF_SQZ, '@ABCDEFGHI', ' abcdefghi'),
+                                    (_ASDF_DIF, '%JKLMNOPQR', ' jklmnopqr')):
+        for i, (p, n) in enumerate(zip(positive, negative)):
+            classes[ord(p)], digits[ord(p)] = cls, i
+            if n != ' ':
+                classes[ord(n)], digits[ord(n)], signs[ord(n)] = cls, i, -1
+    for i, c in enumerate('STUVWXYZs'):
+        classes[ord(c)], digits[ord(c)] = _ASDF_DUP, i + 1
+    classes[ord('.')] = _ASDF_DOT
+    classes[ord('+')] = _ASDF_PLUS
+    classes[ord('-')], signs[ord('-')] = _ASDF_MINUS, -1
+    classes[ord('?')] = _ASDF_MISSING
+    classes[ord('\n')] = _ASDF_NEWLINE
+    return classes, digits, signs
+
+
+_ASDF_CLASSES, _ASDF_DIGITS, _ASDF_SIGNS = _asdf_tables()
+_ASDF_TOKEN_KIND = np.array([-1, _TOKEN_ABS, _TOKEN_ABS, _TOKEN_ABS, _TOKEN_DIF, _TOKEN_DUP,
+                             _TOKEN_ABS, _TOKEN_ABS, _TOKEN_ABS, _TOKEN_NEWLINE])
+_JCAMP_NUMBER = r'[+-]?(?:\d+\.?\d*|\.\d+)(?:[Ee][+-]?\d+)?'
+
+
+def decode_asdf_tokens(data):
+    """Лексемы сжатых данных JCAMP-DX (SQZ/DIF/DUP) без цикла по символам.
+
+    Каждый байт классифицируется по таблице, начала лексем находятся
+    сравнением с классом предыдущего байта, а значение лексемы собирается
+    как сумма цифр со степенями 10 (np.bincount по номеру лексемы).
+    Возвращает (значения, виды лексем).
+    """
+    codes = np.frombuffer(data.encode('ascii', 'replace'), dtype=np.uint8)
+    classes = _ASDF_CLASSES[codes]
+    numeric = (classes == _ASDF_DIGIT) | (classes == _ASDF_DOT)
+    previous = np.concatenate(([_ASDF_SEPARATOR], classes[:-1]))
+    starts = ((classes >= _ASDF_SQZ) |
+              (numeric & ((previous == _ASDF_SEPARATOR) | (previous >= _ASDF_MISSING))))
+    token = np.cumsum(starts) - 1
+    n_tokens = int(starts.sum())
+    kinds = _ASDF_TOKEN_KIND[classes[starts]]
+    signs = _ASDF_SIGNS[codes[starts]]
+
+    # Цифры лексем: обычные цифры и цифры, закодированные буквой-префиксом
+    has_digit = (classes == _ASDF_DIGIT) | (classes == _ASDF_SQZ) | (classes == _ASDF_DIF) | (classes == _ASDF_DUP)
+    digit_token = token[has_digit]
+    counts = np.bincount(digit_token, minlength=n_tokens)
+    first = np.cumsum(counts) - counts
+    position = np.arange(len(digit_token)) - first[digit_token]
+    # Число цифр до десятичной точки (все цифры, если точки нет)
+    integer_digits = counts.copy()
+    dots = np.nonzero(classes == _ASDF_DOT)[0]
+    if len(dots):
+        digits_before = np.cumsum(has_digit)[dots]
+        integer_digits[token[dots]] = digits_before - first[token[dots]]
+    powers = 10.0 ** (integer_digits[digit_token] - 1 - position)
+    values = signs * np.bincount(digit_token, weights=_ASDF_DIGITS[codes[has_digit]] * powers,
+                                 minlength=n_tokens)
+    values[classes[starts] == _ASDF_MISSING] = np.nan
+    return values, kinds
+
+
+def decode_affn_tokens(data):
+    """Лексемы несжатых данных JCAMP-DX (AFFN): числа и концы строк"""
+    tokens = np.array(re.findall(r'\n|\?|' + _JCAMP_NUMBER, data))
+    newline = tokens == '\n'
+    missing = tokens == '?'
+    values = np.where(newline | missing, 'nan', tokens).astype(np.float64)
+    kinds = np.where(newline, _TOKEN_NEWLINE, _TOKEN_ABS)
+    return values, kinds
+
+
+def jcamp_ordinates(data):
+    """Ординаты таблицы (X++(Y..Y)) JCAMP-DX в любой форме записи.
+
+    Первая лексема каждой строки - абсцисса, она отбрасывается; повторения
+    (DUP) разворачиваются, разности (DIF) накапливаются от последнего
+    абсолютного значения; если строка кончается разностью, первая ордината
+    следующей строки - контрольная копия и тоже отбрасывается.
+    """
+    data = re.sub(r'\$\$[^\n]*', '', data) + '\n'
+    # Буквы сжатия (кроме E/e, которые могут быть показателем степени)
+    if re.search(r'[@A-DF-Ia-df-i%J-Rj-rS-Zs]', data):
+        values, kinds = decode_asdf_tokens(data)
+    else:
+        values, kinds = decode_affn_tokens(data)
+
+    newline = kinds == _TOKEN_NEWLINE
+    line = np.cumsum(newline)[~newline]
+    values, kinds = values[~newline], kinds[~newline]
+    line_start = np.concatenate(([True], line[1:] != line[:-1])) if len(line) else np.zeros(0, dtype=bool)
+    values, kinds, line = values[~line_start], kinds[~line_start], line[~line_start]
+
+    # Разворачивание повторений: DUP n повторяет предыдущую лексему n - 1 раз
+    dup = np.nonzero(kinds == _TOKEN_DUP)[0]
+    if len(dup):
+        if dup[0] == 0 or np.any(kinds[dup - 1] == _TOKEN_DUP):
+            raise SpectrumFormatError("JCAMP-DX: DUP without preceding value")
+        repeats = np.ones(len(values), dtype=np.int64)
+        np.add.at(repeats, dup - 1, values[dup].astype(np.int64) - 1)
+        keep = kinds != _TOKEN_DUP
+        values, kinds, line = (np.repeat(a[keep], repeats[keep]) for a in (values, kinds, line))
+    if len(values) == 0:
+        return values
+
+    # Восстановление ординат: накопленная сумма, сбрасываемая на абсолютных значениях
+    absolute = kinds == _TOKEN_ABS
+    if not absolute[0]:
+        raise SpectrumFormatError("JCAMP-DX: data start with a difference")
+    missing = np.isnan(values)
+    steps = np.where(missing, 0, values)
+    if np.all(steps == np.round(steps)) and np.abs(steps).max(initial=0) < 2 ** 53:
+        steps = steps.astype(np.int64)  # Целые ординаты суммируются точно
+    total = np.cumsum(steps)
+    group = np.cumsum(absolute) - 1
+    y = (total - (total - steps)[absolute][group]).astype(np.float64)
+    y[missing] = np.nan
+
+    # Контрольные ординаты после строк, оканчивающихся разностью
+    first_in_line = np.nonzero(np.concatenate(([True], line[1:] != line[:-1])))[0]
+    last_in_line = np.concatenate((first_in_line[1:] - 1, [len(line) - 1]))
+    checks = first_in_line[1:][kinds[last_in_line[:-1]] == _TOKEN_DIF]
+    return np.delete(y, checks)
+
+
+def _jcamp_records(text):
+    """Записи JCAMP-DX: {метка без пробелов и знаков: значение}; для метки
+    с таблицей данных значение включает строки данных"""
+    records = {}
+    for record in re.split(r'(?m)^\s*##', text)[1:]:
+        label, _, value = record.partition('=')
+        label = re.sub(r'[\s\-_/]', '', label).upper()
+        if label in records:
+            # Следующий блок файла со связанными спектрами - читаем только первый
+            if label == 'TITLE':
+                break
+            continue
+        records[label] = value
+    return records
+
+
+def _to_nanometers(x, y, unit):
+    """Перевод абсцисс в нанометры и упорядочение по возрастанию"""
+    unit = unit.upper()
+    if unit in ('1/CM', 'CM-1', 'WAVENUMBER', 'WAVENUMBERS'):
+        with np.errstate(divide='ignore'):
+            x = 1e7 / x
+    elif unit in ('MICROMETERS', 'MICRONS', 'UM'):
+        x = x * 1000.0
+    if len(x) > 1 and x[0] > x[-1]:
+        x, y = x[::-1], y[::-1]
+    return np.ascontiguousarray(x, dtype=np.float64), np.ascontiguousarray(y, dtype=np.float64)
+
+
+def jcamp_kind(data_type, y_units=''):
+    """Вид спектра по DATA TYPE и YUNITS JCAMP-DX (None - не поддерживается)"""
+    data_type, y_units = data_type.strip().upper(), y_units.strip().upper()
+    if 'FLUORESCENCE' in data_type or 'EMISSION' in data_type:
+        return 'emission'
+    if 'UV' in data_type or 'VIS' in data_type or 'ABSORB' in data_type or 'ABSORBANCE' in y_units:
+        return 'absorption'
+    return None
+
+
+def parse_jcamp(text, filepath='JCAMP-DX'):
+    """Разбор текста JCAMP-DX: (вид спектра, x, y)"""
+    records = _jcamp_records(text)
+
+    def number(label, default=None):
+        value = records.get(label)
+        if value is None:
+            return default
+        match = re.search(_JCAMP_NUMBER, value)
+        return float(match.group()) if match else default
+
+    kind = jcamp_kind(records.get('DATATYPE', ''), records.get('YUNITS', ''))
+    if kind is None:
+        raise SpectrumFormatError(f"{filepath}: unsupported JCAMP-DX data type '{records.get('DATATYPE', '').strip()}'")
+
+    x_factor, y_factor = number('XFACTOR', 1.0), number('YFACTOR', 1.0)
+    if 'XYDATA' in records:
+        _, _, data = records['XYDATA'].partition('\n')
+        y = jcamp_ordinates(data) * y_factor
+        n_points = int(number('NPOINTS', len(y)))
+        if len(y) != n_points:
+            raise SpectrumFormatError(f"{filepath}: {len(y)} ordinates, NPOINTS={n_points}")
+        first_x, last_x = number('FIRSTX'), number('LASTX')
+        if first_x is None or last_x is None:
+            raise SpectrumFormatError(f"{filepath}: FIRSTX/LASTX missing")
+        x = np.linspace(first_x, last_x, n_points)
+    else:
+        table = records.get('XYPOINTS', records.get('PEAKTABLE'))
+        if table is None:
+            raise SpectrumFormatError(f"{filepath}: no XYDATA/XYPOINTS")
+        _, _, data = table.partition('\n')
+        pairs = np.array(re.findall(_JCAMP_NUMBER, re.sub(r'\$\$[^\n]*', '', data)), dtype=np.float64)
+        if len(pairs) % 2:
+            raise SpectrumFormatError(f"{filepath}: odd number of XY values")
+        x, y = pairs[0::2] * x_factor, pairs[1::2] * y_factor
+    if len(x) == 0:
+        raise SpectrumFormatError(filepath)
+    x, y = _to_nanometers(x, y, records.get('XUNITS', 'NANOMETERS').strip())
+    return kind, x, y
+
+
+def read_jcamp_file(filepath):
+    """Чтение файла JCAMP-DX (.jdx, .dx, .jcm): (вид спектра, x, y)"""
+    with open(filepath, 'r', encoding='latin-1') as file:
+        return parse_jcamp(file.read(), filepath)
+
+
+def parse_jcamp_bytes(data, filepath='JCAMP-DX'):
+    return parse_jcamp(data.decode('latin-1'), filepath)
+
+
+# Тип эксперимента SPC (fexper) -> вид спектра
+SPC_EXPERIMENT_KINDS = {12: 'emission', 6: 'absorption'}
+# Единицы оси X SPC (fxtype): 1 - волновые числа, 2 - микрометры, 3 - нанометры
+SPC_X_UNITS = {1: '1/CM', 2: 'MICROMETERS', 3: 'NANOMETERS'}
+SPC_HEADER = np.dtype([('ftflgs', 'u1'), ('fversn', 'u1'), ('fexper', 'u1'), ('fexp', 'i1'),
+                       ('fnpts', 'i4'), ('ffirst', 'f8'), ('flast', 'f8'), ('fnsub', 'i4'),
+                       ('fxtype', 'u1'), ('fytype', 'u1'), ('fztype', 'u1'), ('fpost', 'u1'),
+                       ('fdate', 'i4'), ('fres', 'S9'), ('fsource', 'S9'), ('fpeakpt', 'u2'),
+                       ('fspare', 'S32'), ('fcmnt', 'S130'), ('fcatxt', 'S30'), ('flogoff', 'u4'),
+                       ('fmods', 'u4'), ('fprocs', 'u1'), ('flevel', 'u1'), ('fsampin', 'u2'),
+                       ('ffactor', 'f4'), ('fmethod', 'S48'), ('fzinc', 'f4'), ('fwplanes', 'i4'),
+                       ('fwinc', 'f4'), ('fwtype', 'u1'), ('freserv', 'S187')])
+SPC_SUBHEADER = np.dtype([('subflgs', 'u1'), ('subexp', 'i1'), ('subindx', 'u2'), ('subtime', 'f4'),
+                          ('subnext', 'f4'), ('subnois', 'f4'), ('subnpts', 'u4'), ('subscan', 'u4'),
+                          ('subwlevel', 'f4'), ('subresv', 'S4')])
+SPC_TSPREC, SPC_TMULTI, SPC_TXYXYS, SPC_TXVALS = 0x01, 0x04, 0x40, 0x80
+
+
+def parse_spc(buffer, filepath='SPC'):
+    """Разбор двоичного файла SPC (Galactic/Thermo, новый формат):
+    (вид спектра, x, y) первого подфайла.
+
+    Массивы читаются из буфера напрямую (np.frombuffer), ординаты-целые
+    масштабируются показателем 2^(exp - 32) (2^(exp - 16) для 16 бит).
+    """
+    if len(buffer) < SPC_HEADER.itemsize or buffer[1] not in (0x4B, 0x4C):
+        raise SpectrumFormatError(f"{filepath}: not a new-format SPC file")
+    order = '<' if buffer[1] == 0x4B else '>'
+    header = np.frombuffer(buffer, SPC_HEADER.newbyteorder(order), count=1)[0]
+    kind = SPC_EXPERIMENT_KINDS.get(int(header['fexper']))
+    if kind is None:
+        raise SpectrumFormatError(f"{filepath}: unsupported SPC experiment type {header['fexper']}")
+    flags, n_points = int(header['ftflgs']), int(header['fnpts'])
+    offset = SPC_HEADER.itemsize
+    try:
+        x = None
+        if flags & SPC_TXVALS and not flags & SPC_TXYXYS:
+            x = np.frombuffer(buffer, order + 'f4', count=n_points, offset=offset).astype(np.float64)
+            offset += 4 * n_points
+        sub = np.frombuffer(buffer, SPC_SUBHEADER.newbyteorder(order), count=1, offset=offset)[0]
+        offset += SPC_SUBHEADER.itemsize
+        if flags & SPC_TXYXYS:
+            n_points = int(sub['subnpts'])
+            x = np.frombuffer(buffer, order + 'f4', count=n_points, offset=offset).astype(np.float64)
+            offset += 4 * n_points
+        # В многоспектровых файлах показатель задается для каждого подфайла
+        exponent = int(sub['subexp']) if flags & SPC_TMULTI else int(header['fexp'])
+        if exponent == -128:
+            y = np.frombuffer(buffer, order + 'f4', count=n_points, offset=offset).astype(np.float64)
+        elif flags & SPC_TSPREC:
+            y = np.frombuffer(buffer, order + 'i2', count=n_points, offset=offset) * 2.0 ** (exponent - 16)
+        else:
+            y = np.frombuffer(buffer, order + 'i4', count=n_points, offset=offset) * 2.0 ** (exponent - 32)
+    except ValueError:
+        raise SpectrumFormatError(f"{filepath}: truncated SPC file")
+    if x is None:
+        x = np.linspace(float(header['ffirst']), float(header['flast']), n_points)
+    if n_points == 0:
+        raise SpectrumFormatError(filepath)
+    x, y = _to_nanometers(x, y, SPC_X_UNITS.get(int(header['fxtype']), 'NANOMETERS'))
+    return kind, x, y
+
+
+def read_spc_file(filepath):
+    """Чтение двоичного файла SPC: (вид спектра, x, y)"""
+    with open(filepath, 'rb') as file:
+        return parse_spc(file.read(), filepath)
+
+
+# Форматы, вид спектра в которых задан внутри файла: расширение -> функция чтения
+SPECTRUM_READERS = {'.jdx': read_jcamp_file, '.dx': read_jcamp_file, '.jcm': read_jcamp_file,
+                    '.spc': read_spc_file}
+# Те же форматы из содержимого в памяти (файлы архивов): расширение -> функция разбора
+SPECTRUM_PARSERS = {'.jdx': parse_jcamp_bytes, '.dx': parse_jcamp_bytes, '.jcm': parse_jcamp_bytes,
+                    '.spc': parse_spc}
+
+
+def read_typed_spectrum_file(filepath):
+    """Чтение файла формата из SPECTRUM_READERS с общим кэшем: (вид, x, y)"""
+    key = (content_digest(filepath), 'auto')
+    cached = _spectrum_cache.get(key)
+    if cached is None:
+        reader = SPECTRUM_READERS[os.path.splitext(filepath)[1].lower()]
+        with PROFILER.stage('parse') as record:
+            cached = reader(filepath)
+            record['points'] = len(cached[1])
+        _spectrum_cache[key] = cached
+    return cached
+
+
+# === АРХИВЫ КАК ИСТОЧНИКИ СПЕКТРОВ ===
+
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+ARCHIVE_SEPARATOR = '::'  # Путь файла архива: <архив>::<файл внутри архива>
+ARCHIVE_THREADS = min(8, os.cpu_count() or 1)
+
+
+def archive_extension(path):
+    """Расширение архива (с учетом составных .tar.gz) или None"""
+    lower = path.lower()
+    for ext in sorted(ARCHIVE_EXTENSIONS, key=len, reverse=True):
+        if lower.endswith(ext):
+            return ext
+    return None
+
+
+def is_archive(path):
+    return archive_extension(path) is not None and os.path.isfile(path)
+
+
+def source_name(path):
+    """Имя источника спектров без расширения архива"""
+    base = os.path.basename(os.path.normpath(path)) or path
+    ext = archive_extension(base)
+    return base[:-len(ext)] if ext and os.path.isfile(path) else base
+
+
+def parse_spectrum_data(data, filepath, kind):
+    """Разбор содержимого файла в памяти: (вид, x, y); kind=None - вид
+    определяется содержимым (форматы SPECTRUM_PARSERS)"""
+    if kind is None:
+        return SPECTRUM_PARSERS[os.path.splitext(filepath)[1].lower()](data, filepath)
+    x_col, y_col, separators = SPECTRUM_FORMATS[kind]
+    x, y = parse_spectrum_lines(data.decode('utf-8', errors='ignore').splitlines(), x_col, y_col, separators)
+    if len(x) == 0:
+        raise SpectrumFormatError(filepath)
+    if kind == 'emission':
+        x, series = split_series(x, y)
+        y = series[0]
+    return kind, x, y
+
+
+def read_archive_member(path, member):
+    """Содержимое одного файла архива zip/tar (bytes)"""
+    import tarfile
+    import zipfile
+    if archive_extension(path) == '.zip':
+        with zipfile.ZipFile(path) as archive:
+            return archive.read(member)
+    with tarfile.open(path) as archive:
+        return archive.extractfile(member).read()
+
+
+def _archive_members(path):
+    """Файлы спектров архива: [(имя файла, вид или None)] по имени"""
+    import tarfile
+    import zipfile
+    if archive_extension(path) == '.zip':
+        with zipfile.ZipFile(path) as archive:
+            names = [info.filename for info in archive.infolist() if not info.is_dir()]
+    else:
+        with tarfile.open(path) as archive:
+            names = [member.name for member in archive.getmembers() if member.isfile()]
+    members = []
+    for name in sorted(names):
+        ext = os.path.splitext(name)[1].lower()
+        if ext in SPECTRUM_EXTENSIONS or ext in SPECTRUM_READERS:
+            members.append((name, SPECTRUM_EXTENSIONS.get(ext)))
+    return members
+
+
+def read_archive(path, members=None, digests=None):
+    """Чтение спектров архива zip/tar без распаковки на диск.
+
+    Файлы zip распаковываются и разбираются параллельно (zlib освобождает
+    GIL), tar-архивы читаются последовательно (сжатый поток не допускает
+    произвольного доступа), а разбор идет в пуле потоков. Хэш содержимого
+    файла запоминается по <архив>::<файл> и дате самого архива, разобранные
+    спектры попадают в общий кэш по хэшу (см. content_digest). В словарь
+    digests, если он задан, записываются хэши прочитанных файлов по имени.
+    Возвращает [(имя файла, вид, x, y или исключение)].
+    """
+    import tarfile
+    import zipfile
+    stat = os.stat(path)
+    base = os.path.abspath(path)
+    if members is None:
+        members = _archive_members(path)
+
+    def member_key(name):
+        return (base + ARCHIVE_SEPARATOR + name, stat.st_size, stat.st_mtime_ns)
+
+    if digests is None:
+        digests = {}
+
+    def cached_member(name, kind):
+        digest = _content_digests.get(member_key(name))
+        if digest is None:
+            return None
+        digests[name] = digest
+        return _spectrum_cache.get((digest, kind or 'auto'))
+
+    def parse(name, kind, data):
+        digest = digests[name] = _content_digests[member_key(name)] = data_digest(data)
+        cached = _spectrum_cache.get((digest, kind or 'auto'))
+        if cached is not None:
+            return (kind,) + cached if kind else cached
+        with PROFILER.stage('parse') as record:
+            file_kind, x, y = parse_spectrum_data(data, name, kind)
+            record['points'] = len(x)
+        _spectrum_cache[digest, kind or 'auto'] = (x, y) if kind else (file_kind, x, y)
+        return file_kind, x, y
+
+    results = {}
+    pending = []
+    for name, kind in members:
+        cached = cached_member(name, kind)
+        if cached is not None:
+            results[name] = (kind,) + cached if kind else cached
+        else:
+            pending.append((name, kind))
+
+    with ThreadPoolExecutor(max_workers=ARCHIVE_THREADS) as executor:
+        futures = {}
+        if archive_extension(path) == '.zip':
+            with zipfile.ZipFile(path) as archive:
+                def read_member(name, kind):
+                    return parse(name, kind, archive.read(name))
+                futures = {name: executor.submit(read_member, name, kind) for name, kind in pending}
+                wait_futures(futures.values())
+        elif pending:
+            wanted = dict(pending)
+            with tarfile.open(path) as archive:
+                for member in archive:
+                    if member.name in wanted:
+                        data = archive.extractfile(member).read()
+                        futures[member.name] = executor.submit(parse, member.name, wanted[member.name], data)
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = (None, None, e)
+
+    return [(name,) + results[name] if name in results else (name, None, None, FileNotFoundError(name))
+            for name, _ in members]
+
+
+def load_archive(path, selection=None, keep_duplicates=False):
+    """Чтение спектров архива в компактные хранилища (как load_folder)"""
+    spectra = {'emission': {}, 'absorption': {}}
+    sources = {}
+    problems = []
+    seen = {}
+    members = _archive_members(path)
+    if selection is not None:
+        members = [(name, kind) for name, kind in members if name in selection]
+    digests = {}
+    for member, kind, x, y in read_archive(path, members, digests):
+        source = path + ARCHIVE_SEPARATOR + member
+        if isinstance(y, Exception):
+            problems.append((source, y))
+            continue
+        digest = digests[member]
+        if not keep_duplicates and digest in seen:
+            problems.append((source, DuplicateSpectrumError(seen[digest])))
+            continue
+        seen.setdefault(digest, source)
+        name = os.path.splitext(member)[0]
+        spectra[kind][name] = (x, y)
+        sources[kind, name] = source
+    return _spectrum_stores(spectra, sources, problems)
+
+
+def _spectrum_stores(spectra, sources, problems):
+    return (SpectrumStore.from_dict(spectra['emission'],
+                                    {name: sources['emission', name] for name in spectra['emission']},
+                                    MEMORY.dtype),
+            SpectrumStore.from_dict(spectra['absorption'],
+                                    {name: sources['absorption', name] for name in spectra['absorption']},
+                                    MEMORY.dtype),
+            problems)
+
+
+def load_folder(folder, selection=None, keep_duplicates=False):
+    """Чтение всех спектров папки (или архива zip/tar) в компактные хранилища.
+
+    selection - множество путей файлов относительно папки (поле 'file'
+    индекса scan_folder), которые нужно прочитать; None - все файлы.
+    Файлы, совпадающие по содержимому с уже прочитанными (копии), не
+    читаются и попадают в проблемы с DuplicateSpectrumError, если не задано
+    keep_duplicates.
+    Возвращает (хранилище эмиссии, хранилище абсорбции, список проблем),
+    где проблема - пара (путь к файлу, исключение).
+    """
+    if is_archive(folder):
+        return load_archive(folder, selection, keep_duplicates)
+    spectra = {'emission': {}, 'absorption': {}}
+    sources = {}
+    problems = []
+    seen = {}  # Хэш содержимого -> первый файл с таким содержимым
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for file in sorted(files):
+            stem, ext = os.path.splitext(file)
+            kind = SPECTRUM_EXTENSIONS.get(ext.lower())
+            if kind is None and ext.lower() not in SPECTRUM_READERS:
+                continue
+            file_path = os.path.join(root, file)
+            relative = os.path.relpath(file_path, folder)
+            if selection is not None and relative not in selection:
+                continue
+            name = os.path.splitext(relative)[0]
+            try:
+                digest = content_digest(file_path)
+                if not keep_duplicates and digest in seen:
+                    problems.append((file_path, DuplicateSpectrumError(seen[digest])))
+                    continue
+                seen.setdefault(digest, file_path)
+                if kind is None:
+                    kind, x, y = read_typed_spectrum_file(file_path)
+                    spectra[kind][name] = (x, y)
+                else:
+                    spectra[kind][name] = read_spectrum_file(file_path, kind)
+                sources[kind, name] = file_path
+            except Exception as e:
+                problems.append((file_path, e))
+    return _spectrum_stores(spectra, sources, problems)
+
+
+# === ПРЕДВАРИТЕЛЬНЫЙ ПРОСМОТР ПАПКИ ===
+#
+# Индекс папки строится без полного разбора: размеры и даты файлов и первые
+# SCAN_BYTES байт каждого файла (разделитель, число колонок, оценка числа
+# точек). Полностью читаются только выбранные пользователем файлы.
+
+SCAN_BYTES = 4096
+SCAN_THREADS = 16  # Чтение начала файлов упирается в диск/сеть, а не в процессор
+
+
+def sniff_spectrum(head, size, filepath, kind):
+    """Сведения о файле по его началу head (bytes) полного размера size"""
+    ext = os.path.splitext(filepath)[1].lower()
+    info = {'kind': kind, 'delimiter': None, 'columns': None, 'points': None, 'estimated': False}
+    if ext == '.spc':
+        if len(head) >= SPC_HEADER.itemsize and head[1] in (0x4B, 0x4C):
+            order = '<' if head[1] == 0x4B else '>'
+            header = np.frombuffer(head, SPC_HEADER.newbyteorder(order), count=1)[0]
+            info.update(kind=SPC_EXPERIMENT_KINDS.get(int(header['fexper'])), points=int(header['fnpts']))
+        return info
+    text = head.decode('latin-1')
+    if ext in SPECTRUM_READERS:
+        records = _jcamp_records(text)
+        info['kind'] = jcamp_kind(records.get('DATATYPE', ''), records.get('YUNITS', ''))
+        match = re.search(r'\d+', records.get('NPOINTS', ''))
+        info['points'] = int(match.group()) if match else None
+        return info
+
+    # Текстовые форматы: строки данных - строки с нужными колонками-числами
+    x_col, y_col, separators = SPECTRUM_FORMATS[kind]
+    lines = text.splitlines(keepends=True)
+    complete = len(head) >= size
+    if not complete:
+        lines = lines[:-1]  # Последняя строка может быть обрезана
+    data_bytes, data_lines, first_offset, offset = 0, 0, None, 0
+    for line in lines:
+        stripped = line.strip()
+        for separator in separators:
+            if stripped and not stripped.startswith('#') and separator in stripped:
+                parts = [part.strip() for part in stripped.split(separator) if part.strip()]
+                if (len(parts) > max(x_col, y_col) and robust_float_conversion(parts[x_col]) is not None
+                        and robust_float_conversion(parts[y_col]) is not None):
+                    if info['delimiter'] is None:
+                        info.update(delimiter=separator, columns=len(parts))
+                        first_offset = offset
+                    data_lines += 1
+                    data_bytes += len(line)
+                    break
+        offset += len(line)
+    if data_lines:
+        if complete:
+            info['points'] = data_lines
+        else:
+            info.update(points=int(round((size - first_offset) * data_lines / data_bytes)), estimated=True)
+    return info
+
+
+def _read_head(path, size=SCAN_BYTES):
+    with open(path, 'rb') as file:
+        return file.read(size)
+
+
+def scan_folder(folder):
+    """Индекс файлов спектров папки или архива без полного разбора.
+
+    Элемент индекса - словарь: file (путь относительно папки или имя в
+    архиве), name (имя спектра), path, size, mtime_ns, kind, delimiter,
+    columns, points, estimated (число точек оценено по началу файла), error.
+    """
+    candidates = []
+    if is_archive(folder):
+        import tarfile
+        import zipfile
+        if archive_extension(folder) == '.zip':
+            archive = zipfile.ZipFile(folder)
+            sizes = {info.filename: info.file_size for info in archive.infolist()}
+
+            def head(name):
+                with archive.open(name) as member:
+                    return member.read(SCAN_BYTES)
+        else:
+            archive = None
+            with tarfile.open(folder) as tar:
+                sizes = {member.name: member.size for member in tar.getmembers() if member.isfile()}
+            head = None  # Сжатый tar не читается выборочно - только имена и размеры
+        mtime_ns = os.stat(folder).st_mtime_ns
+        for name, kind in _archive_members(folder):
+            candidates.append((name, folder + ARCHIVE_SEPARATOR + name, kind, sizes[name], mtime_ns,
+                               functools.partial(head, name) if head else None))
+    else:
+        archive = None
+        for root, dirs, files in os.walk(folder):
+            dirs.sort()
+            for file in sorted(files):
+                ext = os.path.splitext(file)[1].lower()
+                if ext not in SPECTRUM_EXTENSIONS and ext not in SPECTRUM_READERS:
+                    continue
+                path = os.path.join(root, file)
+                stat = os.stat(path)
+                candidates.append((os.path.relpath(path, folder), path, SPECTRUM_EXTENSIONS.get(ext),
+                                   stat.st_size, stat.st_mtime_ns, functools.partial(_read_head, path)))
+
+    def describe(candidate):
+        file, path, kind, size, mtime_ns, read_head = candidate
+        entry = {'file': file, 'name': os.path.splitext(file)[0], 'path': path, 'size': size,
+                 'mtime_ns': mtime_ns, 'kind': kind, 'delimiter': None, 'columns': None,
+                 'points': None, 'estimated': False, 'error': None}
+        if read_head is not None:
+            try:
+                entry.update(sniff_spectrum(read_head(), size, file, kind))
+            except Exception as e:
+                entry['error'] = str(e)
+        return entry
+
+    try:
+        with PROFILER.stage('scan', len(candidates)):
+            with ThreadPoolExecutor(max_workers=SCAN_THREADS) as executor:
+                return list(executor.map(describe, candidates))
+    finally:
+        if archive is not None:
+            archive.close()
+
+
+# === КОМПАКТНОЕ ХРАНИЛИЩЕ СПЕКТРОВ ===
+
+class SpectrumStore:
+    """Компактное хранилище набора спектров.
+
+    Точки всех спектров лежат подряд в общих массивах x и y,
+    спектр i занимает срез offsets[i]:offsets[i + 1].
+    sources - пути к исходным файлам спектров (если известны).
+    """
+
+    def __init__(self, names, x, y, offsets, sources=None):
+        self.names = list(names)
+        self.x = x
+        self.y = y
+        self.offsets = offsets
+        self.sources = list(sources) if sources is not None else [None] * len(self.names)
+
+    @classmethod
+    def from_dict(cls, spectra, sources=None, dtype=np.float64):
+        """Создание хранилища из словаря {имя: (x, y)} и путей {имя: файл}"""
+        names = list(spectra)
+        sources = sources or {}
+        xs = [spectra[name][0] for name in names]
+        ys = [spectra[name][1] for name in names]
+        lengths = np.array([len(x) for x in xs], dtype=np.int64)
+        offsets = np.zeros(len(names) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        if names:
+            x = np.concatenate(xs).astype(dtype, copy=False)
+            y = np.concatenate(ys).astype(dtype, copy=False)
+        else:
+            x = np.empty(0, dtype=dtype)
+            y = np.empty(0, dtype=dtype)
+        return cls(names, x, y, offsets, [sources.get(name) for name in names])
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, i):
+        start, stop = self.offsets[i], self.offsets[i + 1]
+        return self.x[start:stop], self.y[start:stop]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    @property
+    def segment_ids(self):
+        """Номер спектра для каждой точки общего массива"""
+        return np.repeat(np.arange(len(self)), self.lengths)
+
+    @property
+    def nbytes(self):
+        return self.x.nbytes + self.y.nbytes + self.offsets.nbytes
+
+    def astype(self, dtype):
+        """Хранилище с точками типа dtype (без копирования, если тип тот же)"""
+        if self.x.dtype == dtype and self.y.dtype == dtype:
+            return self
+        return SpectrumStore(self.names, self.x.astype(dtype), self.y.astype(dtype), self.offsets, self.sources)
+
+    def take(self, indices):
+        """Подмножество спектров с номерами indices"""
+        indices = np.asarray(indices, dtype=np.int64)
+        lengths = self.lengths[indices]
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        # Индексы точек выбранных спектров в общем массиве
+        starts = np.repeat(self.offsets[:-1][indices] - offsets[:-1], lengths)
+        points = np.arange(offsets[-1]) + starts
+        return SpectrumStore([self.names[i] for i in indices],
+                             self.x[points], self.y[points], offsets,
+                             [self.sources[i] for i in indices])
+
+    def trimmed(self, x_min, x_max):
+        """Обрезка всех спектров по диапазону [x_min, x_max] одной маской"""
+        mask = (self.x >= x_min) & (self.x <= x_max)
+        counts = np.bincount(self.segment_ids[mask], minlength=len(self))
+        offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return SpectrumStore(self.names, self.x[mask], self.y[mask], offsets, self.sources)
+
+    @classmethod
+    def concatenate(cls, stores):
+        """Объединение нескольких хранилищ в одно"""
+        stores = list(stores)
+        if not stores:
+            return cls.from_dict({})
+        lengths = np.concatenate([store.lengths for store in stores])
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return cls([name for store in stores for name in store.names],
+                   np.concatenate([store.x for store in stores]),
+                   np.concatenate([store.y for store in stores]),
+                   offsets, [source for store in stores for source in store.sources])
+
+    def padded(self, fill=np.nan):
+        """Спектры в виде матриц (спектр x точка), дополненных значением fill"""
+        lengths = self.lengths
+        width = int(lengths.max()) if len(lengths) else 0
+        X = np.full((len(self), width), fill, dtype=np.float64)
+        Y = np.full((len(self), width), fill, dtype=np.float64)
+        columns = np.arange(len(self.x)) - np.repeat(self.offsets[:-1], lengths)
+        X[self.segment_ids, columns] = self.x
+        Y[self.segment_ids, columns] = self.y
+        return X, Y
+
+
+# === ЧИСЛЕННЫЕ МЕТОДЫ ДЛЯ ВСЕХ СПЕКТРОВ ХРАНИЛИЩА ===
+
+def simpson_weights(x, offsets):
+    """Веса неравномерного метода Симпсона: интеграл спектра = сумма w * f"""
+    lengths = np.diff(offsets)
+    n_panels = np.maximum(lengths - 1, 0)
+    starts = offsets[:-1]
+
+    # Центры пар отрезков: локальные индексы 1, 3, 5, ... < N
+    pairs = n_panels // 2
+    pair_segments = np.repeat(np.arange(len(lengths)), pairs)
+    first_pair = np.repeat(np.cumsum(pairs) - pairs, pairs)
+    centers = starts[pair_segments] + 2 * (np.arange(pairs.sum()) - first_pair) + 1
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        h0 = x[centers] - x[centers - 1]
+        h1 = x[centers + 1] - x[centers]
+        hph, hdh, hmh = h1 + h0, h1 / h0, h1 * h0
+        w = np.bincount(np.concatenate((centers - 1, centers, centers + 1)),
+                        weights=np.concatenate(((hph / 6) * (2 - hdh),
+                                                (hph / 6) * (hph ** 2 / hmh),
+                                                (hph / 6) * (2 - 1 / hdh))),
+                        minlength=len(x)).astype(np.float64, copy=False)
+
+        # Поправка на последний отрезок при нечетном числе отрезков
+        ends = offsets[1:][(n_panels % 2 == 1) & (n_panels >= 3)]
+        h0 = x[ends - 2] - x[ends - 3]
+        h1 = x[ends - 1] - x[ends - 2]
+        w[ends - 1] += (2 * h1 ** 2 + 3 * h0 * h1) / (6 * (h0 + h1))
+        w[ends - 2] += (h1 ** 2 + 3 * h1 * h0) / (6 * h0)
+        w[ends - 3] -= h1 ** 3 / (6 * h0 * (h0 + h1))
+
+    # Единственный отрезок интегрируется методом трапеций
+    single = starts[n_panels == 1]
+    h = x[single + 1] - x[single]
+    w[single] += h / 2
+    w[single + 1] += h / 2
+    return w
+
+
+def segment_simpson(x, y, offsets, jit=True):
+    """Метод Симпсона для неравномерной сетки сразу для всех спектров"""
+    kernels = jit_kernels() if jit else None
+    if kernels is not None:
+        return kernels['simpson'](*_kernel_arrays(x, y, offsets))
+    n = len(offsets) - 1
+    x = np.asarray(x, dtype=np.float64)
+    segments = np.repeat(np.arange(n), np.diff(offsets))
+    return np.bincount(segments, weights=simpson_weights(x, offsets) * y,
+                       minlength=n).astype(np.float64, copy=False)
+
+
+def segment_trapezoid(x, y, offsets, jit=True):
+    """Метод трапеций сразу для всех спектров"""
+    kernels = jit_kernels() if jit else None
+    if kernels is not None:
+        return kernels['trapezoid'](*_kernel_arrays(x, y, offsets))
+    n = len(offsets) - 1
+    if len(x) < 2:
+        return np.zeros(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    panels = np.diff(x) * (y[1:] + y[:-1]) / 2
+    segments = np.repeat(np.arange(n), np.diff(offsets))[:-1]
+    # Отрезки между соседними спектрами не учитываются
+    inner = np.ones(len(panels), dtype=bool)
+    boundaries = offsets[1:-1]
+    boundaries = boundaries[(boundaries > 0) & (boundaries < len(x))]
+    inner[boundaries - 1] = False
+    return np.bincount(segments[inner], weights=panels[inner], minlength=n).astype(np.float64, copy=False)
+
+
+def segment_nearest(x, y, offsets, x0, jit=True):
+    """Значение y в точке, ближайшей к x0, для каждого спектра (NaN - для пустых)"""
+    kernels = jit_kernels() if jit else None
+    if kernels is not None:
+        return kernels['nearest'](*_kernel_arrays(x, y, offsets), float(x0))
+    lengths = np.diff(offsets)
+    segments = np.repeat(np.arange(len(lengths)), lengths)
+    # Сортировка по спектру, затем по расстоянию; при равенстве - первая точка
+    order = np.lexsort((np.abs(x - x0), segments))
+    nearest = np.full(len(lengths), np.nan)
+    if len(order):
+        values = y[order[np.minimum(offsets[:-1], len(order) - 1)]]
+        nearest[lengths > 0] = values[lengths > 0]
+    return nearest
+
+
+def series_weights(x, method):
+    """Веса интегрирования на общей сетке x: интегралы серии = матрица @ веса"""
+    x = np.asarray(x, dtype=np.float64)
+    if len(x) < 2:
+        return np.zeros(len(x))
+    if method == 'simpson':
+        return simpson_weights(x, np.array([0, len(x)]))
+    h = np.diff(x) / 2
+    weights = np.zeros(len(x))
+    weights[:-1] += h
+    weights[1:] += h
+    return weights
+
+
+def integrate_series(x, Y, method='simpson'):
+    """Интегралы всех спектров серии (строки Y на сетке x) одним умножением"""
+    return np.asarray(Y, dtype=np.float64) @ series_weights(x, method)
+
+
+def simpson_nonuniform(x, f):
+    """Метод Симпсона для неравномерной сетки"""
+    if len(x) < 2:
+        return 0.0
+    x = np.asarray(x, dtype=np.float64)
+    return float(segment_simpson(x, np.asarray(f, dtype=np.float64),
+                                 np.array([0, len(x)]))[0])
+
+
+def trapezoid_rule(x, f):
+    """Метод трапеций"""
+    if len(x) < 2:
+        return 0.0
+    x = np.asarray(x, dtype=np.float64)
+    return float(segment_trapezoid(x, np.asarray(f, dtype=np.float64),
+                                   np.array([0, len(x)]))[0])
+
+
+def linear_regression(x, y, jit=True):
+    """Линейная регрессия МНК"""
+    if len(x) < 2:
+        return 0, 0
+
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    y = np.ascontiguousarray(y, dtype=np.float64)
+    n = len(x)
+    kernels = jit_kernels() if jit else None
+    if kernels is not None:
+        sum_x, sum_y, sum_xy, sum_x2 = kernels['regression_sums'](x, y)
+    else:
+        sum_xy = np.dot(x, y)
+        sum_x = x.sum()
+        sum_y = y.sum()
+        sum_x2 = np.dot(x, x)
+
+    denominator = n * sum_x2 - sum_x ** 2
+    if denominator == 0:
+        return 0, 0
+
+    a = (n * sum_xy - sum_x * sum_y) / denominator
+    b = (sum_y - a * sum_x) / n
+
+    return float(a), float(b)
+
+
+# Точка калибровки считается влиятельной, если расстояние Кука больше
+# COOK_FACTOR / n или |стьюдентизированный остаток| больше STUDENTIZED_LIMIT
+COOK_FACTOR = 4.0
+STUDENTIZED_LIMIT = 3.0
+
+
+def regression_diagnostics(x, y):
+    """Диагностика исключения по одной точке (leave-one-out) для прямой y = a*x + b.
+
+    Все величины - в замкнутом виде через диагональ матрицы проекции
+    h_i = 1/n + (x_i - x_mean)^2 / Sxx, за O(n) без n повторных регрессий.
+    Возвращает словарь массивов по точкам: leverage, residual, studentized
+    (внешне стьюдентизированные остатки), cooks, slope/intercept (прямая без
+    точки i) и flagged. Для n < 3 статистики не определены (NaN).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    a, b = linear_regression(x, y)
+    nan = np.full(n, np.nan)
+    diagnostics = {'leverage': nan.copy(), 'residual': y - (a * x + b), 'studentized': nan.copy(),
+                   'cooks': nan.copy(), 'slope': nan.copy(), 'intercept': nan.copy(),
+                   'flagged': np.zeros(n, dtype=bool)}
+    if n < 3:
+        return diagnostics
+
+    x_mean = x.mean()
+    dx = x - x_mean
+    sxx = np.dot(dx, dx)
+    if sxx == 0:
+        return diagnostics
+    e = diagnostics['residual']
+    h = 1 / n + dx ** 2 / sxx
+    s2 = np.dot(e, e) / (n - 2)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Внутренне стьюдентизированный остаток и переход к внешнему:
+        # t_i = r_i * sqrt((n - 3) / (n - 2 - r_i^2)); при n = 3 не определен
+        r = e / np.sqrt(s2 * (1 - h))
+        t = r * np.sqrt((n - 3) / (n - 2 - r ** 2)) if n > 3 else np.full(n, np.nan)
+        cooks = r ** 2 * h / (2 * (1 - h))
+        # Изменение коэффициентов при удалении точки i: (X'X)^-1 x_i e_i / (1 - h_i)
+        shift = e / (1 - h)
+        slope = a - dx / sxx * shift
+        intercept = b - (1 / n - x_mean * dx / sxx) * shift
+
+    diagnostics.update(leverage=h, studentized=t, cooks=cooks, slope=slope, intercept=intercept)
+    diagnostics['flagged'] = ((np.nan_to_num(cooks) > COOK_FACTOR / n) |
+                              (np.abs(np.nan_to_num(t)) > STUDENTIZED_LIMIT))
+    return diagnostics
+
+
+# === УСКОРЕННЫЕ ЯДРА (NUMBA, НЕОБЯЗАТЕЛЬНО) ===
+#
+# Циклические версии ядер для Numba: на малых массивах (одиночные спектры,
+# перебор параметров, бутстрэп) они избавляют от накладных расходов десятка
+# вызовов NumPy. Компилируются при первом обращении, скомпилированный код
+# кэшируется на диске (cache=True). Перед использованием результат сверяется
+# с реализацией на NumPy; при расхождении или без Numba используется NumPy.
+
+JIT_ENV = 'QY_KERNELS'  # 'numpy' - отключить ускоренные ядра
+JIT_TOLERANCE = 1e-10
+_jit_kernels = None  # None - еще не выбраны, {} - недоступны
+
+
+def _simpson_kernel(x, y, offsets):
+    out = np.zeros(len(offsets) - 1)
+    for s in range(len(offsets) - 1):
+        start, end = offsets[s], offsets[s + 1]
+        n_panels = end - start - 1
+        if n_panels == 1:
+            out[s] = (x[end - 1] - x[start]) * (y[start] + y[end - 1]) / 2
+            continue
+        total = 0.0
+        for i in range(start + 1, start + 2 * (n_panels // 2), 2):
+            h0 = x[i] - x[i - 1]
+            h1 = x[i + 1] - x[i]
+            hph, hdh, hmh = h1 + h0, h1 / h0, h1 * h0
+            total += (hph / 6) * ((2 - hdh) * y[i - 1] + (hph ** 2 / hmh) * y[i] + (2 - 1 / hdh) * y[i + 1])
+        if n_panels % 2 == 1 and n_panels >= 3:
+            h0 = x[end - 2] - x[end - 3]
+            h1 = x[end - 1] - x[end - 2]
+            total += ((2 * h1 ** 2 + 3 * h0 * h1) / (6 * (h0 + h1)) * y[end - 1]
+                      + (h1 ** 2 + 3 * h1 * h0) / (6 * h0) * y[end - 2]
+                      - h1 ** 3 / (6 * h0 * (h0 + h1)) * y[end - 3])
+        out[s] = total
+    return out
+
+
+def _trapezoid_kernel(x, y, offsets):
+    out = np.zeros(len(offsets) - 1)
+    for s in range(len(offsets) - 1):
+        total = 0.0
+        for i in range(offsets[s] + 1, offsets[s + 1]):
+            total += (x[i] - x[i - 1]) * (y[i] + y[i - 1]) / 2
+        out[s] = total
+    return out
+
+
+def _nearest_kernel(x, y, offsets, x0):
+    out = np.full(len(offsets) - 1, np.nan)
+    for s in range(len(offsets) - 1):
+        best, best_distance = -1, np.inf
+        for i in range(offsets[s], offsets[s + 1]):
+            distance = abs(x[i] - x0)
+            if distance < best_distance:
+                best, best_distance = i, distance
+        if best >= 0:
+            out[s] = y[best]
+    return out
+
+
+def _regression_sums_kernel(x, y):
+    sum_x = sum_y = sum_xy = sum_x2 = 0.0
+    for i in range(len(x)):
+        sum_x += x[i]
+        sum_y += y[i]
+        sum_xy += x[i] * y[i]
+        sum_x2 += x[i] * x[i]
+    return sum_x, sum_y, sum_xy, sum_x2
+
+
+def _kernel_arrays(x, y, offsets):
+    """Приведение аргументов к одному набору типов (одна компиляция ядра)"""
+    return (np.ascontiguousarray(x, dtype=np.float64), np.ascontiguousarray(y, dtype=np.float64),
+            np.ascontiguousarray(offsets, dtype=np.int64))
+
+
+def _verify_kernels(kernels):
+    """Сверка ускоренных ядер с NumPy на неравномерной сетке с разными длинами"""
+    rng = np.random.default_rng(0)
+    lengths = np.array([1, 2, 0, 3, 4, 5, 6, 7, 50, 51, 0])
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    x = np.concatenate([np.cumsum(rng.uniform(0.5, 1.5, n)) for n in lengths])
+    y = rng.normal(size=len(x))
+    checks = [
+        (kernels['simpson'](x, y, offsets), segment_simpson(x, y, offsets, jit=False)),
+        (kernels['trapezoid'](x, y, offsets), segment_trapezoid(x, y, offsets, jit=False)),
+        (kernels['nearest'](x, y, offsets, 3.3), segment_nearest(x, y, offsets, 3.3, jit=False)),
+        (np.array(kernels['regression_sums'](x, y)), np.array([x.sum(), y.sum(), x @ y, x @ x])),
+    ]
+    return all(np.allclose(fast, reference, rtol=JIT_TOLERANCE, atol=JIT_TOLERANCE, equal_nan=True)
+               for fast, reference in checks)
+
+
+def jit_kernels():
+    """Проверенные ускоренные ядра или None, если используется NumPy"""
+    global _jit_kernels
+    if _jit_kernels is None:
+        _jit_kernels = {}
+        if os.environ.get(JIT_ENV, 'auto').lower() != 'numpy':
+            with PROFILER.stage('jit_load'):
+                try:
+                    import numba
+                    jit = numba.njit(cache=True, nogil=True, error_model='numpy')
+                    kernels = {
+                        'simpson': jit(_simpson_kernel),
+                        'trapezoid': jit(_trapezoid_kernel),
+                        'nearest': jit(_nearest_kernel),
+                        'regression_sums': jit(_regression_sums_kernel),
+                    }
+                    if _verify_kernels(kernels):
+                        _jit_kernels = kernels
+                except Exception:
+                    # Нет Numba или ядро не компилируется - остаемся на NumPy
+                    pass
+    return _jit_kernels or None
+
+
+def kernel_backend():
+    return 'numba' if jit_kernels() is not None else 'numpy'
+
+
+class IntegralIndex:
+    """Кумулятивные интегралы спектров для мгновенной смены диапазона обрезки.
+
+    Для каждого спектра хранятся префиксные суммы отрезков метода трапеций
+    и пар отрезков метода Симпсона (отдельно для пар, начинающихся в четных
+    и нечетных точках). Интеграл по [x_min, x_max] получается двоичным поиском
+    границ, разностью префиксов и поправкой на последний отрезок - с тем же
+    результатом, что обрезка и прямое интегрирование. Требует строго
+    возрастающих x в каждом спектре (см. monotonic).
+    """
+
+    def __init__(self, store):
+        self.store = store
+        x, offsets = store.x.astype(np.float64, copy=False), store.offsets
+        y = store.y.astype(np.float64, copy=False)
+        total = len(x)
+        segments = store.segment_ids
+        lengths = store.lengths
+        local = np.arange(total) - offsets[:-1][segments]
+
+        same_segment = segments[1:] == segments[:-1]
+        self.monotonic = bool(np.all(np.diff(x)[same_segment] > 0))
+
+        # Ключи (спектр, x) для поиска границ всех спектров одним вызовом:
+        # комплексные числа упорядочиваются по действительной части, затем
+        # по мнимой, поэтому массив ключей отсортирован при monotonic
+        self.keys = np.empty(total, dtype=np.complex128)
+        self.keys.real = segments
+        self.keys.imag = x
+
+        # Метод трапеций: prefix[j] - интеграл от начала спектра до точки j
+        panels = np.zeros(total)
+        if total > 1:
+            panels[1:] = np.where(same_segment, np.diff(x) * (y[1:] + y[:-1]) / 2, 0.0)
+        cumulative = np.cumsum(panels)
+        self.trapezoid_prefix = cumulative - cumulative[offsets[:-1][segments]]
+
+        # Метод Симпсона: вклад пары отрезков, начинающейся в точке k
+        pair = np.zeros(total)
+        k = np.nonzero(local + 2 < lengths[segments])[0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            h0 = x[k + 1] - x[k]
+            h1 = x[k + 2] - x[k + 1]
+            hph, hdh, hmh = h1 + h0, h1 / h0, h1 * h0
+            pair[k] = (hph / 6) * ((2 - hdh) * y[k] + (hph ** 2 / hmh) * y[k + 1] + (2 - 1 / hdh) * y[k + 2])
+
+        # Префиксные суммы с шагом 2 внутри спектра (группа = спектр и четность)
+        groups = segments * 2 + local % 2
+        order = np.argsort(groups, kind='stable')
+        inclusive = np.cumsum(pair[order])
+        exclusive = inclusive - pair[order]
+        sorted_groups = groups[order]
+        group_first = np.zeros(total, dtype=np.int64)
+        if total:
+            starts = np.r_[True, sorted_groups[1:] != sorted_groups[:-1]]
+            group_first = np.where(starts, np.arange(total), 0)
+            np.maximum.accumulate(group_first, out=group_first)
+        self.pair_prefix = np.empty(total)
+        self.pair_prefix[order] = inclusive - exclusive[group_first]
+
+    @property
+    def nbytes(self):
+        return (self.store.nbytes + self.trapezoid_prefix.nbytes + self.pair_prefix.nbytes
+                + self.keys.nbytes)
+
+    def bounds(self, x_min, x_max):
+        """Первая и последняя точки каждого спектра внутри [x_min, x_max]"""
+        queries = np.empty((2, len(self.store)), dtype=np.complex128)
+        queries.real = np.arange(len(self.store))
+        queries[0].imag = x_min
+        queries[1].imag = x_max
+        first = np.searchsorted(self.keys, queries[0], side='left')
+        last = np.searchsorted(self.keys, queries[1], side='right') - 1
+        return first.astype(np.int64, copy=False), last.astype(np.int64, copy=False)
+
+    def integrals(self, x_min=-np.inf, x_max=np.inf):
+        """Интегралы (Симпсон, трапеции) всех спектров по диапазону [x_min, x_max].
+
+        Для спектров, у которых в диапазоне меньше двух точек, - NaN.
+        """
+        x, y = self.store.x, self.store.y
+        first, last = self.bounds(x_min, x_max)
+        n_panels = last - first
+        valid = n_panels >= 1
+        i0 = np.where(valid, first, 0)
+        i1 = np.where(valid, last, 0)
+
+        trapezoid = np.full(len(first), np.nan)
+        trapezoid[valid] = self.trapezoid_prefix[i1[valid]] - self.trapezoid_prefix[i0[valid]]
+
+        # Пары отрезков, начинающиеся в i0, i0 + 2, ..., last_pair
+        pairs = np.where(valid, n_panels // 2, 0)
+        last_pair = i0 + 2 * (pairs - 1)
+        before = i0 - 2
+        local_i0 = i0 - self.store.offsets[:-1]
+        has_before = local_i0 >= 2
+        simpson = np.zeros(len(first))
+        with_pairs = pairs > 0
+        simpson[with_pairs] = self.pair_prefix[last_pair[with_pairs]]
+        subtract = with_pairs & has_before
+        simpson[subtract] -= self.pair_prefix[before[subtract]]
+
+        # Поправка на последний отрезок при нечетном числе отрезков
+        odd = valid & (n_panels % 2 == 1) & (n_panels >= 3)
+        e = i1[odd]
+        x0, x1, x2 = (x[i].astype(np.float64) for i in (e - 2, e - 1, e))
+        y0, y1, y2 = (y[i].astype(np.float64) for i in (e - 2, e - 1, e))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            h0 = x1 - x0
+            h1 = x2 - x1
+            simpson[odd] += (y2 * (2 * h1 ** 2 + 3 * h0 * h1) / (6 * (h0 + h1))
+                             + y1 * (h1 ** 2 + 3 * h1 * h0) / (6 * h0)
+                             - y0 * h1 ** 3 / (6 * h0 * (h0 + h1)))
+
+        # Единственный отрезок интегрируется методом трапеций
+        single = valid & (n_panels == 1)
+        simpson[single] = trapezoid[single]
+        simpson[~valid] = np.nan
+        return simpson, trapezoid
+
+
+# === СПЕКТРАЛЬНЫЕ ШКАЛЫ: ВОЛНОВОЕ ЧИСЛО И ЭНЕРГИЯ ===
+#
+# Спектры читаются по длине волны (нм). Для интегрирования по волновому
+# числу (см^-1) или энергии фотона (эВ) ось пересчитывается как k / lambda,
+# а интенсивность умножается на якобиан |d lambda / d nu| = lambda^2 / k,
+# чтобы площадь под каждым участком спектра сохранялась. Новая ось убывает
+# с ростом длины волны, поэтому точки каждого спектра переставляются в
+# обратном порядке. Диапазон обрезки всегда задается в нм.
+
+SPECTRAL_DOMAINS = ('wavelength', 'wavenumber', 'energy')
+DOMAIN_CONSTANTS = {  # k в x = k / lambda[нм]
+    'wavenumber': 1e7,  # см^-1 * нм
+    'energy': 1239.841984,  # эВ * нм (h * c)
+}
+DOMAIN_LABELS = {  # Подписи осей: (ru, en)
+    'wavelength': ('Длина волны (нм)', "Wavelength (nm)"),
+    'wavenumber': ('Волновое число (см⁻¹)', "Wavenumber (cm⁻¹)"),
+    'energy': ('Энергия (эВ)', "Energy (eV)"),
+}
+DOMAIN_UNITS = {  # Единицы оси: (ru, en)
+    'wavelength': ('нм', 'nm'),
+    'wavenumber': ('см⁻¹', 'cm⁻¹'),
+    'energy': ('эВ', 'eV'),
+}
+
+
+def convert_domain(store, domain):
+    """Все спектры хранилища на шкале domain (с якобианом) одной операцией"""
+    if domain == 'wavelength':
+        return store
+    k = DOMAIN_CONSTANTS[domain]
+    x = store.x
+    with np.errstate(divide='ignore'):
+        new_x = k / x
+    new_y = store.y * (x * x / k)
+    # Обращение порядка точек внутри каждого спектра
+    segments = store.segment_ids
+    order = store.offsets[segments] + store.offsets[segments + 1] - 1 - np.arange(len(x))
+    return SpectrumStore(store.names, new_x[order], new_y[order], store.offsets, store.sources)
+
+
+def convert_series(x, Y, domain):
+    """Сетка x и матрица спектров Y (время x длина волны) на шкале domain"""
+    if domain == 'wavelength':
+        return x, Y
+    k = DOMAIN_CONSTANTS[domain]
+    with np.errstate(divide='ignore'):
+        new_x = k / x
+    return new_x[::-1], (Y * (x * x / k))[:, ::-1]
+
+
+def domain_window(window, domain):
+    """Диапазон (от, до) в нм, пересчитанный на шкалу domain; пересчет
+    k / x обратен сам себе, поэтому так же переводится диапазон шкалы в нм"""
+    if window is None or domain == 'wavelength':
+        return window
+    k = DOMAIN_CONSTANTS[domain]
+    low, high = window
+    with np.errstate(divide='ignore'):
+        return float(np.divide(k, high)), float(np.divide(k, low))
+
+
+# === СГЛАЖИВАНИЕ СПЕКТРОВ ===
+
+SMOOTHING_METHODS = ('savgol', 'median', 'whittaker')
+SAVGOL_ORDER = 2  # Степень полинома фильтра Савицкого-Голея
+
+
+def savgol_coefficients(window, order):
+    """Коэффициенты сглаживающего фильтра Савицкого-Голея (значение в центре окна)"""
+    half = window // 2
+    vander = np.vander(np.arange(-half, half + 1, dtype=np.float64), order + 1, increasing=True)
+    return np.linalg.pinv(vander)[0]
+
+
+def second_difference_bands(n):
+    """Диагонали матрицы D'D для вторых разностей: главная, первая и вторая"""
+    if n < 4:
+        D = np.diff(np.eye(n), 2, axis=0)
+        DtD = D.T @ D
+        return np.diag(DtD).copy(), np.diag(DtD, 1).copy(), np.diag(DtD, 2).copy()
+    main = np.full(n, 6.0)
+    main[[0, -1]] = 1.0
+    main[[1, -2]] = 5.0
+    first = np.full(n - 1, -4.0)
+    first[[0, -1]] = -2.0
+    return main, first, np.ones(n - 2)
+
+
+def smooth_rows(Y, method, parameter):
+    """Сглаживание всех строк матрицы Y (спектры одной длины) одним вызовом.
+
+    parameter - ширина окна для 'savgol' и 'median', lambda для 'whittaker'.
+    """
+    n = Y.shape[1]
+    if n < 3:
+        return Y.copy()
+
+    if method in ('savgol', 'median'):
+        # Нечетное окно не длиннее спектра
+        window = max(3, int(parameter) | 1)
+        if window > n:
+            window = n if n % 2 else n - 1
+        half = window // 2
+        padded = np.pad(Y, ((0, 0), (half, half)), mode='reflect')
+        windows = np.lib.stride_tricks.sliding_window_view(padded, window, axis=1)
+        if method == 'median':
+            return np.median(windows, axis=2)
+        return windows @ savgol_coefficients(window, min(SAVGOL_ORDER, window - 1))
+
+    if method == 'whittaker':
+        # (I + lambda D'D) z = y, одна матрица для всех строк
+        lam = float(parameter)
+        main, first, second = second_difference_bands(n)
+        try:
+            from scipy.linalg import solveh_banded
+        except ImportError:
+            A = np.diag(1 + lam * main) + np.diag(lam * first, 1) + np.diag(lam * first, -1)
+            A += np.diag(lam * second, 2) + np.diag(lam * second, -2)
+            return np.linalg.solve(A, Y.T).T
+        bands = np.zeros((3, n))
+        bands[0, 2:] = lam * second
+        bands[1, 1:] = lam * first
+        bands[2] = 1 + lam * main
+        return solveh_banded(bands, Y.T).T
+
+    raise ValueError(f"Unknown smoothing method: {method}")
+
+
+def smooth_store(store, method, parameter):
+    """Сглаживание всех спектров хранилища: спектры одной длины
+    обрабатываются вместе как матрица"""
+    y = np.empty_like(store.y)
+    lengths = store.lengths
+    for n in np.unique(lengths):
+        rows = np.nonzero(lengths == n)[0]
+        points = store.offsets[rows][:, None] + np.arange(n)
+        y[points] = smooth_rows(store.y[points], method, parameter)
+    return SpectrumStore(store.names, store.x, y, store.offsets, store.sources)
+
+
+# === РАЗЛОЖЕНИЕ ПОЛОС ЭМИССИИ ===
+#
+# Каждый спектр описывается суммой K полос (гауссова, лоренцева или
+# псевдо-Фойгта) и постоянной базовой линии. Параметры полосы: площадь A,
+# центр c, ширина на полувысоте w и (для псевдо-Фойгта) доля лоренциана eta.
+# Все спектры набора подгоняются одновременно пакетным методом
+# Левенберга-Марквардта: невязки и аналитические якобианы считаются для
+# матрицы спектров сразу, нормальные уравнения решаются одним вызовом
+# np.linalg.solve для стопки матриц, у каждого спектра свой параметр
+# затухания. Начальное приближение - подгонка самого интенсивного спектра,
+# масштабированная на остальные; неудачные подгонки повторяются от
+# параметров соседнего по поглощению (концентрации) спектра.
+
+BAND_SHAPES = ('gaussian', 'lorentzian', 'pseudo_voigt')
+BAND_FIT_ITERATIONS = 200
+BAND_FIT_TOLERANCE = 1e-9  # Относительное изменение суммы квадратов невязок
+BAND_SHAPE_LABELS = {  # Подписи форм полос: (ru, en)
+    'gaussian': ('Гаусс', 'Gaussian'),
+    'lorentzian': ('Лоренц', 'Lorentzian'),
+    'pseudo_voigt': ('Псевдо-Фойгт', 'Pseudo-Voigt'),
+}
+BAND_REFIT_FACTOR = 2.0  # Невязка выше медианной во столько раз - повторная подгонка
+_GAUSS_K = 4 * np.log(2)
+_GAUSS_NORM = np.sqrt(_GAUSS_K / np.pi)
+
+
+def band_parameter_count(shape):
+    """Число параметров одной полосы"""
+    return 4 if shape == 'pseudo_voigt' else 3
+
+
+def band_profiles(X, A, c, w, eta, shape, jacobian=False):
+    """Полосы на сетках X (спектр x точка) для параметров (спектр x полоса).
+
+    Возвращает значения полос (спектр x точка x полоса) и, при jacobian,
+    производные по A, c, w и eta той же формы.
+    """
+    u = X[:, :, None] - c[:, None, :]
+    w = w[:, None, :]
+    A = A[:, None, :]
+    gauss = lorentz = None
+    if shape != 'lorentzian':
+        exponent = np.exp(-_GAUSS_K * u ** 2 / w ** 2)
+        gauss = _GAUSS_NORM / w * exponent
+    if shape != 'gaussian':
+        q = 1 + 4 * u ** 2 / w ** 2
+        lorentz = 2 / (np.pi * w * q)
+    if shape == 'gaussian':
+        unit = gauss
+    elif shape == 'lorentzian':
+        unit = lorentz
+    else:
+        eta_ = eta[:, None, :]
+        unit = eta_ * lorentz + (1 - eta_) * gauss
+    if not jacobian:
+        return A * unit, None
+
+    derivatives = {'A': unit}
+    if gauss is not None:
+        gauss_dc = gauss * 2 * _GAUSS_K * u / w ** 2
+        gauss_dw = gauss * (2 * _GAUSS_K * u ** 2 / w ** 3 - 1 / w)
+    if lorentz is not None:
+        lorentz_dc = lorentz * 8 * u / (w ** 2 * q)
+        lorentz_dw = -lorentz * (1 - 4 * u ** 2 / w ** 2) / (w * q)
+    if shape == 'gaussian':
+        dc, dw = gauss_dc, gauss_dw
+    elif shape == 'lorentzian':
+        dc, dw = lorentz_dc, lorentz_dw
+    else:
+        dc = eta_ * lorentz_dc + (1 - eta_) * gauss_dc
+        dw = eta_ * lorentz_dw + (1 - eta_) * gauss_dw
+        derivatives['eta'] = A * (lorentz - gauss)
+    derivatives['c'] = A * dc
+    derivatives['w'] = A * dw
+    return A * unit, derivatives
+
+
+def _split_band_parameters(params, shape):
+    """Вектор параметров (спектр x p) -> A, c, w, eta (спектр x полоса), базовая линия"""
+    m = band_parameter_count(shape)
+    bands = params[:, :-1].reshape(len(params), -1, m)
+    eta = bands[:, :, 3] if m == 4 else None
+    return bands[:, :, 0], bands[:, :, 1], bands[:, :, 2], eta, params[:, -1]
+
+
+def band_model(X, params, shape, jacobian=False):
+    """Модель спектров (сумма полос + базовая линия) и якобиан (спектр x точка x p)"""
+    A, c, w, eta, baseline = _split_band_parameters(params, shape)
+    bands, derivatives = band_profiles(X, A, c, w, eta, shape, jacobian)
+    model = bands.sum(axis=2) + baseline[:, None]
+    if not jacobian:
+        return model, None
+    names = ('A', 'c', 'w', 'eta')[:band_parameter_count(shape)]
+    J = np.stack([derivatives[name] for name in names], axis=3).reshape(X.shape + (-1,))
+    return model, np.concatenate((J, np.ones(X.shape + (1,))), axis=2)
+
+
+def _constrain_bands(params, shape, X):
+    """Допустимые параметры: A >= 0, центр в пределах сетки, ширина не меньше
+    шага сетки и не больше диапазона, 0 <= eta <= 1"""
+    m = band_parameter_count(shape)
+    bands = params[:, :-1].reshape(len(params), -1, m)
+    low = np.nanmin(X, axis=1)[:, None]
+    high = np.nanmax(X, axis=1)[:, None]
+    step = np.nanmedian(np.abs(np.diff(X, axis=1)), axis=1)[:, None]
+    np.maximum(bands[:, :, 0], 0, out=bands[:, :, 0])
+    np.clip(bands[:, :, 1], low, high, out=bands[:, :, 1])
+    np.clip(bands[:, :, 2], step, high - low, out=bands[:, :, 2])
+    if m == 4:
+        np.clip(bands[:, :, 3], 0, 1, out=bands[:, :, 3])
+    return params
+
+
+def fit_bands(X, Y, initial, shape, iterations=BAND_FIT_ITERATIONS, tolerance=BAND_FIT_TOLERANCE):
+    """Пакетная подгонка всех спектров методом Левенберга-Марквардта.
+
+    X, Y - матрицы спектров (дополнены NaN), initial - начальные параметры
+    (спектр x p). Возвращает (параметры, СКО невязки, признак сходимости).
+    """
+    valid = np.isfinite(X) & np.isfinite(Y)
+    X = np.where(valid, X, np.nanmean(X, axis=1, keepdims=True))
+    Y = np.where(valid, Y, 0)
+    params = _constrain_bands(np.array(initial, dtype=np.float64), shape, X)
+    n_params = params.shape[1]
+    damping = np.full(len(params), 1e-3)
+    converged = np.zeros(len(params), dtype=bool)
+
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        model, J = band_model(X, params, shape, jacobian=True)
+        residual = np.where(valid, Y - model, 0)
+        cost = (residual ** 2).sum(axis=1)
+        for _ in range(iterations):
+            active = ~converged
+            if not active.any():
+                break
+            J_active = J[active] * valid[active][:, :, None]
+            JTJ = np.einsum('snp,snq->spq', J_active, J_active)
+            gradient = np.einsum('snp,sn->sp', J_active, residual[active])
+            diagonal = np.einsum('spp->sp', JTJ)
+            system = JTJ + (damping[active][:, None] * np.maximum(diagonal, 1e-12))[:, :, None] * np.eye(n_params)
+            try:
+                step = np.linalg.solve(system, gradient[:, :, None])[:, :, 0]
+            except np.linalg.LinAlgError:
+                step = np.linalg.lstsq(system.reshape(-1, n_params), gradient.reshape(-1), rcond=None)[0]
+                step = np.nan_to_num(step.reshape(gradient.shape))
+            trial = _constrain_bands(params[active] + np.nan_to_num(step), shape, X[active])
+            trial_model, trial_J = band_model(X[active], trial, shape, jacobian=True)
+            trial_residual = np.where(valid[active], Y[active] - trial_model, 0)
+            trial_cost = (trial_residual ** 2).sum(axis=1)
+
+            better = np.isfinite(trial_cost) & (trial_cost <= cost[active])
+            rows = np.flatnonzero(active)
+            accepted = rows[better]
+            change = np.abs(cost[accepted] - trial_cost[better]) / np.maximum(cost[accepted], 1e-300)
+            params[accepted] = trial[better]
+            J[accepted] = trial_J[better]
+            residual[accepted] = trial_residual[better]
+            cost[accepted] = trial_cost[better]
+            damping[accepted] = np.maximum(damping[accepted] / 10, 1e-12)
+            damping[rows[~better]] *= 10
+            converged[accepted[change < tolerance]] = True
+            converged[rows[~better][damping[rows[~better]] > 1e12]] = True
+
+    rmse = np.sqrt(cost / np.maximum(valid.sum(axis=1), 1))
+    return params, rmse, converged
+
+
+def initial_band_guess(x, y, n_components, shape):
+    """Начальные параметры одного спектра: центры - в наибольших локальных
+    максимумах сглаженного спектра (недостающие - равномерно по полосе)"""
+    order = np.argsort(x)
+    x, y = x[order], y[order]
+    baseline = np.percentile(y, 10)
+    smooth = np.convolve(y - baseline, np.ones(5) / 5, mode='same')
+    maxima = np.flatnonzero((smooth[1:-1] > smooth[:-2]) & (smooth[1:-1] >= smooth[2:])) + 1
+    maxima = maxima[np.argsort(smooth[maxima])[::-1]][:n_components]
+    above = np.flatnonzero(smooth > 0.1 * smooth.max()) if smooth.max() > 0 else np.arange(len(x))
+    low, high = x[above[0]], x[above[-1]]
+    centers = list(x[maxima])
+    spread = np.linspace(low, high, n_components + 2)[1:-1]
+    for center in spread:
+        if len(centers) >= n_components:
+            break
+        centers.append(center)
+    width = max((high - low) / n_components, 2 * np.median(np.diff(x)))
+    m = band_parameter_count(shape)
+    params = np.zeros(n_components * m + 1)
+    for k, center in enumerate(sorted(centers)):
+        height = max(np.interp(center, x, smooth), 0)
+        params[k * m:k * m + 3] = height * width / _GAUSS_NORM, center, width
+        if m == 4:
+            params[k * m + 3] = 0.5
+    params[-1] = baseline
+    return params
+
+
+def _sort_bands(params, shape):
+    """Полосы каждого спектра в порядке возрастания центра"""
+    m = band_parameter_count(shape)
+    bands = params[:, :-1].reshape(len(params), -1, m)
+    order = np.argsort(bands[:, :, 1], axis=1)
+    bands = np.take_along_axis(bands, order[:, :, None], axis=1)
+    return np.concatenate((bands.reshape(len(params), -1), params[:, -1:]), axis=1)
+
+
+def deconvolve_store(store, n_components, shape='gaussian', order=None):
+    """Разложение всех спектров хранилища на n_components полос формы shape.
+
+    order - порядок спектров по концентрации (например, argsort поглощения)
+    для повторной подгонки от соседних спектров; None - порядок хранилища.
+    Возвращает словарь: 'params' (спектр x p, полосы по возрастанию центра;
+    NaN для спектров, где точек меньше, чем параметров), 'rmse', 'converged',
+    'shape', 'main' - номер полосы с наибольшей площадью в опорном (самом
+    интенсивном) спектре.
+    """
+    if shape not in BAND_SHAPES:
+        raise ValueError(f"Unknown band shape: {shape}")
+    m = band_parameter_count(shape)
+    n_params = n_components * m + 1
+    X, Y = store.padded()
+    if len(store) and X.shape[1] == 0:
+        X = Y = np.full((len(store), 1), np.nan)
+    # Спектры, в которых точек меньше, чем параметров, не подгоняются (NaN)
+    usable = np.isfinite(Y).sum(axis=1) > n_params
+    result = {'params': np.full((len(store), n_params), np.nan), 'rmse': np.full(len(store), np.nan),
+              'converged': np.zeros(len(store), dtype=bool), 'shape': shape, 'main': 0}
+    if not usable.any():
+        return result
+    rows = np.flatnonzero(usable)
+    X, Y = X[rows], Y[rows]
+    n = len(rows)
+    if order is None:
+        order = np.arange(n)
+    else:
+        # Порядок только среди подгоняемых спектров
+        position = np.full(len(store), -1)
+        position[rows] = np.arange(n)
+        order = position[np.asarray(order)]
+        order = order[order >= 0]
+    heights = np.nanmax(Y, axis=1) - np.nanpercentile(Y, 10, axis=1)
+
+    # Опорный спектр: подгонка от эвристического начального приближения
+    reference = int(np.nanargmax(heights))
+    valid = np.isfinite(Y[reference])
+    guess = initial_band_guess(X[reference, valid], Y[reference, valid], n_components, shape)
+    with PROFILER.stage('deconvolution.reference', int(valid.sum())):
+        reference_params, _, _ = fit_bands(X[reference:reference + 1], Y[reference:reference + 1],
+                                           guess[None, :], shape)
+
+    # Остальные - все сразу от опорной формы с площадями по высоте спектра
+    initial = np.repeat(reference_params, n, axis=0)
+    scale = np.divide(heights, heights[reference], out=np.ones(n), where=heights[reference] > 0)
+    initial[:, 0:-1:m] *= scale[:, None]
+    initial[:, -1] = np.nanpercentile(Y, 10, axis=1)
+    with PROFILER.stage('deconvolution.batch', int(np.isfinite(Y).sum())):
+        params, rmse, converged = fit_bands(X, Y, initial, shape)
+
+        # Повторная подгонка неудачных спектров от ближайшего удачного соседа
+        relative = rmse / np.maximum(heights, 1e-300)
+        good = converged & (relative <= BAND_REFIT_FACTOR * np.median(relative))
+        retry = np.flatnonzero(~good)
+        if len(retry) and good.any():
+            rank = np.empty(n, dtype=np.int64)
+            rank[order] = np.arange(n)
+            good_rows = np.flatnonzero(good)
+            neighbours = good_rows[np.abs(rank[good_rows][None, :] - rank[retry][:, None]).argmin(axis=1)]
+            warm = params[neighbours].copy()
+            ratio = np.divide(heights[retry], heights[neighbours], out=np.ones(len(retry)),
+                              where=heights[neighbours] > 0)
+            warm[:, 0:-1:m] *= ratio[:, None]
+            refit, refit_rmse, refit_converged = fit_bands(X[retry], Y[retry], warm, shape)
+            improved = refit_rmse < rmse[retry]
+            params[retry[improved]] = refit[improved]
+            rmse[retry[improved]] = refit_rmse[improved]
+            converged[retry[improved]] = refit_converged[improved]
+
+    params = _sort_bands(params, shape)
+    result['params'][rows] = params
+    result['rmse'][rows] = rmse
+    result['converged'][rows] = converged
+    result['main'] = int(np.argmax(params[reference, 0:-1:m]))
+    return result
+
+
+def band_store(store, fit, component):
+    """Хранилище с кривой одной полосы (номер component) вместо спектров"""
+    A, c, w, eta, _ = _split_band_parameters(fit['params'], fit['shape'])
+    rows = store.segment_ids
+    x = np.asarray(store.x, dtype=np.float64)
+    k = slice(component, component + 1)
+    bands, _ = band_profiles(x[:, None], A[rows, k], c[rows, k], w[rows, k],
+                             eta[rows, k] if eta is not None else None, fit['shape'])
+    return SpectrumStore(store.names, store.x, bands[:, 0, 0], store.offsets, store.sources)
+
+
+# === КОРРЕКЦИЯ СПЕКТРАЛЬНОЙ ЧУВСТВИТЕЛЬНОСТИ ===
+
+class ResponseCorrection:
+    """Кривая коррекции спектральной чувствительности прибора.
+
+    Файл кривой - две колонки: длина волны и множитель коррекции. Множитель
+    интерполируется на сетку длин волн спектров; вне диапазона кривой
+    используются ее крайние значения. Интерполированные векторы кэшируются
+    для каждой уникальной сетки, поэтому серия измерений на одной сетке
+    интерполируется один раз.
+    """
+
+    def __init__(self, x, factor, source=None):
+        order = np.argsort(x, kind='stable')
+        self.x = np.asarray(x, dtype=np.float64)[order]
+        self.factor = np.asarray(factor, dtype=np.float64)[order]
+        self.source = source
+        self._grids = {}
+
+    @classmethod
+    def from_file(cls, path):
+        x, factor = read_spectrum_file(path, 'response')
+        return cls(x, factor, path)
+
+    def on_grid(self, x):
+        """Множитель коррекции на сетке x (с кэшированием по содержимому сетки)"""
+        x = np.ascontiguousarray(x, dtype=np.float64)
+        key = (len(x), hashlib.blake2b(x.tobytes(), digest_size=16).digest())
+        vector = self._grids.get(key)
+        if vector is None:
+            vector = np.interp(x, self.x, self.factor)
+            self._grids[key] = vector
+        return vector
+
+    def apply(self, store):
+        """Скорректированная копия хранилища.
+
+        Спектры одной длины собираются в матрицу, одинаковые сетки находятся
+        одним вызовом np.unique, после чего все спектры группы умножаются
+        на свои векторы коррекции одной операцией.
+        """
+        y = store.y.copy()
+        lengths = store.lengths
+        with PROFILER.stage('response_correction', len(y)):
+            for n in np.unique(lengths):
+                if n == 0:
+                    continue
+                rows = np.nonzero(lengths == n)[0]
+                points = store.offsets[rows][:, None] + np.arange(n)
+                grids, inverse = np.unique(store.x[points], axis=0, return_inverse=True)
+                factors = np.stack([self.on_grid(grid) for grid in grids])
+                block = y[points]
+                block *= factors[inverse.reshape(-1)]
+                y[points] = block
+        return SpectrumStore(store.names, store.x, y, store.offsets, store.sources)
+
+
+# === АВТООПРЕДЕЛЕНИЕ ПОЛОСЫ ЭМИССИИ ===
+
+def detect_emission_bands(store, threshold=0.02, noise_factor=3.0):
+    """Поиск полосы эмиссии и уровня шума всех спектров одним пакетным проходом.
+
+    Базовая линия - 10-й процентиль интенсивности, шум - робастная оценка
+    (MAD) по разностям соседних точек. Полоса - связная область вокруг
+    максимума, где сигнал над базовой линией выше max(threshold * высота
+    пика, noise_factor * шум). Возвращает словарь массивов по спектрам.
+    """
+    X, Y = store.padded()
+    if not len(store):
+        empty = np.empty(0)
+        return {'baseline': empty, 'noise': empty, 'peak': empty, 'left': empty, 'right': empty}
+    rows = np.arange(len(store))
+    columns = np.arange(X.shape[1])
+
+    baseline = np.nanpercentile(Y, 10, axis=1)
+    steps = np.diff(Y, axis=1)
+    if steps.shape[1] and not np.all(np.isnan(steps)):
+        deviation = np.abs(steps - np.nanmedian(steps, axis=1, keepdims=True))
+        noise = 1.4826 * np.nanmedian(deviation, axis=1) / np.sqrt(2)
+    else:
+        noise = np.zeros(len(store))
+    noise = np.nan_to_num(noise)
+
+    signal = Y - baseline[:, None]
+    peak = np.argmax(np.where(np.isnan(signal), -np.inf, signal), axis=1)
+    height = signal[rows, peak]
+    level = np.maximum(threshold * height, noise_factor * noise)
+
+    # Граница полосы - ближайшая к пику точка не выше уровня (дополнение - тоже)
+    below = ~(signal > level[:, None])
+    left = np.where(below & (columns < peak[:, None]), columns, -1).max(axis=1) + 1
+    right = np.where(below & (columns > peak[:, None]), columns, X.shape[1]).min(axis=1) - 1
+    left_x = X[rows, left]
+    right_x = X[rows, right]
+    return {
+        'baseline': baseline,
+        'noise': noise,
+        'peak': X[rows, peak],
+        'left': np.minimum(left_x, right_x),
+        'right': np.maximum(left_x, right_x),
+    }
+
+
+def propose_integration_limits(datasets, threshold=0.02, noise_factor=3.0, margin=0.05):
+    """Границы интегрирования для каждого набора по одному критерию.
+
+    Полосы всех спектров всех наборов ищутся одним пакетным вызовом
+    detect_emission_bands, так что образцы и стандарты обрезаются по одному
+    и тому же относительному уровню. Границы набора охватывают полосы всех
+    его спектров и расширены на margin от ширины. Возвращает
+    {имя набора: (min, max, медианный шум)}.
+    """
+    datasets = list(datasets)
+    stores = [d.corrected_emission().take(d.pairs()[0]) for d in datasets]
+    with PROFILER.stage('detect_bands', sum(len(store.x) for store in stores)):
+        bands = detect_emission_bands(SpectrumStore.concatenate(stores), threshold, noise_factor)
+    limits = {}
+    start = 0
+    for dataset, store in zip(datasets, stores):
+        stop = start + len(store)
+        if stop > start:
+            low = float(bands['left'][start:stop].min())
+            high = float(bands['right'][start:stop].max())
+            width = high - low
+            limits[dataset.name] = (low - margin * width, high + margin * width,
+                                    float(np.median(bands['noise'][start:stop])))
+        start = stop
+    return limits
+
+
+# === БЮДЖЕТ ПАМЯТИ ===
+
+class MemoryBudget:
+    """Бюджет памяти спектров рабочего пространства.
+
+    Наборы данных отслеживаются в порядке последнего обращения. При
+    превышении бюджета исходные спектры давно не использованных наборов
+    (и производные от них: коррекция, сглаживание, индексы интегралов)
+    выгружаются во временный файл и читаются из него при следующем
+    обращении; результаты расчета (интегралы, ex_pic) остаются в памяти.
+    Кэш разобранных файлов ограничивается четвертью бюджета. Режим float32
+    хранит спектры в одинарной точности - вдвое меньше памяти, расчеты
+    по-прежнему ведутся в двойной.
+    """
+
+    def __init__(self, budget=None, float32=False):
+        self.budget = budget  # Байт; None - без ограничения
+        self.float32 = float32
+        self.evictions = 0
+        self._datasets = collections.OrderedDict()  # id -> weakref на Dataset
+        self._spill_dir = None
+
+    @property
+    def dtype(self):
+        return np.float32 if self.float32 else np.float64
+
+    def configure(self, budget=None, float32=None):
+        """Новый бюджет (байт, None - без ограничения) и режим хранения"""
+        self.budget = budget
+        if float32 is not None and float32 != self.float32:
+            self.float32 = float32
+            for dataset in self.datasets():
+                if dataset.loaded:
+                    dataset.convert(self.dtype)
+        _spectrum_cache.max_bytes = budget // 4 if budget is not None else parse_cache_limit()
+        _spectrum_cache.shrink()
+        self.enforce()
+
+    def prepare(self, store):
+        return store.astype(self.dtype)
+
+    def touch(self, dataset):
+        key = id(dataset)
+        if key in self._datasets:
+            self._datasets.move_to_end(key)
+        else:
+            self._datasets[key] = weakref.ref(dataset)
+
+    def datasets(self):
+        """Отслеживаемые наборы, от давно не использованных к недавним"""
+        alive = []
+        for key, ref in list(self._datasets.items()):
+            dataset = ref()
+            if dataset is None:
+                del self._datasets[key]
+            else:
+                alive.append(dataset)
+        return alive
+
+    def spill_path(self, dataset):
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(prefix='qy_spill_')
+            atexit.register(shutil.rmtree, self._spill_dir, True)
+        return os.path.join(self._spill_dir, f'{uuid.uuid4().hex}.npz')
+
+    def usage(self):
+        """Текущее использование памяти, байт, и число выгруженных наборов"""
+        datasets = self.datasets()
+        usage = {'raw': 0, 'derived': 0, 'results': 0}
+        for dataset in datasets:
+            for key, value in dataset.memory_usage().items():
+                usage[key] += value
+        usage['parse_cache'] = _spectrum_cache.nbytes
+        usage['total'] = usage['raw'] + usage['derived'] + usage['results'] + usage['parse_cache']
+        usage['budget'] = self.budget
+        usage['loaded'] = sum(dataset.loaded for dataset in datasets)
+        usage['spilled'] = sum(dataset.spilled for dataset in datasets)
+        usage['evictions'] = self.evictions
+        return usage
+
+    def enforce(self, keep=None):
+        """Выгрузка наборов (кроме keep) до соблюдения бюджета"""
+        if self.budget is None:
+            return
+        _spectrum_cache.shrink()
+        datasets = self.datasets()
+        total = sum(sum(dataset.memory_usage().values()) for dataset in datasets) + _spectrum_cache.nbytes
+        for dataset in datasets:
+            if total <= self.budget:
+                break
+            if dataset is keep or not dataset.loaded:
+                continue
+            usage = dataset.memory_usage()
+            with PROFILER.stage('evict', usage['raw']):
+                dataset.evict(self)
+            total -= usage['raw'] + usage['derived']
+            self.evictions += 1
+
+
+# Общий бюджет памяти приложения (настраивается на вкладке диагностики и --memory-budget)
+MEMORY = MemoryBudget()
+
+
+# === РАБОЧЕЕ ПРОСТРАНСТВО: НАБОРЫ ДАННЫХ ===
+
+# Допустимый относительный разброс QY образца между разными стандартами
+QY_CONSISTENCY_TOLERANCE = 0.10
+
+
+class Dataset:
+    """Набор данных (папка со спектрами) с ролью 'sample' или 'standard'.
+
+    Спектры читаются лениво - при первом обращении к emission/absorption.
+    loader - функция, возвращающая (эмиссия, абсорбция, проблемы) вместо
+    чтения папки (например, из бинарного файла сессии).
+    """
+
+    def __init__(self, name, role, folder, loader=None):
+        self.name = name
+        self.role = role
+        self.folder = folder
+        self.problems = []
+        self.results = {}
+        self.trim = None  # Собственный диапазон интегрирования (см. effective_trim)
+        self.correction = None  # ResponseCorrection для спектров эмиссии
+        self.selection = None  # Выбранные файлы папки (см. load_folder); None - все
+        self.excluded = set()  # Спектры, исключенные из калибровки (см. calibration_points)
+        self.keep_duplicates = False  # Читать ли копии файлов как отдельные спектры (см. load_folder)
+        self._loader = loader
+        self._emission = None
+        self._absorption = None
+        self._corrected = None
+        self._smoothed = {}
+        self._domains = {}  # Спектры на шкалах волнового числа и энергии (см. domain_emission)
+        self._indexes = {}
+        self._bands = {}  # Разложения полос (см. band_fit) по параметрам расчета
+        self._spill = None  # Файл, в который выгружены спектры (см. MemoryBudget)
+
+    @property
+    def loaded(self):
+        return self._emission is not None
+
+    @property
+    def spilled(self):
+        return not self.loaded and self._spill is not None
+
+    @property
+    def duplicates(self):
+        """Пропущенные копии файлов: [(путь копии, путь исходного файла)]"""
+        return [(path, error.original) for path, error in self.problems
+                if isinstance(error, DuplicateSpectrumError)]
+
+    def load(self):
+        """Чтение спектров папки (если еще не прочитаны)"""
+        if not self.loaded:
+            loader = self._loader or (lambda: load_folder(self.folder, self.selection, self.keep_duplicates))
+            emission, absorption, self.problems = loader()
+            self._emission, self._absorption = MEMORY.prepare(emission), MEMORY.prepare(absorption)
+            self._loader = None
+            MEMORY.touch(self)
+            MEMORY.enforce(keep=self)
+        else:
+            MEMORY.touch(self)
+        return self
+
+    def reload(self):
+        self._emission = self._absorption = None
+        self._loader = None
+        self.results = {}
+        self.invalidate()
+        self._drop_spill()
+        return self.load()
+
+    def memory_usage(self):
+        """Память набора, байт: исходные спектры, производные спектры и индексы, результаты"""
+        raw = derived = 0
+        if self.loaded:
+            raw = self._emission.nbytes + self._absorption.nbytes
+        if self._corrected is not None:
+            derived += self._corrected.nbytes
+        derived += sum(store.nbytes for store in self._smoothed.values())
+        derived += sum(store.nbytes for store in self._domains.values())
+        derived += sum(index.nbytes for _, index in self._indexes.values())
+        derived += sum(store.nbytes + fit['params'].nbytes for _, store, fit in self._bands.values())
+        results = sum(value.nbytes for value in self.results.values() if isinstance(value, np.ndarray))
+        return {'raw': raw, 'derived': derived, 'results': results}
+
+    def evict(self, memory):
+        """Выгрузка спектров во временный файл; результаты остаются в памяти"""
+        if not self.loaded:
+            return
+        if self._spill is None:
+            path = memory.spill_path(self)
+            arrays = {}
+            for kind, store in (('emission', self._emission), ('absorption', self._absorption)):
+                arrays.update({kind + '_x': store.x, kind + '_y': store.y, kind + '_offsets': store.offsets})
+            with open(path, 'wb') as file:
+                np.savez(file, **arrays)
+            self._spill = (path, {kind: (store.names, store.sources) for kind, store in
+                                  (('emission', self._emission), ('absorption', self._absorption))})
+        path, meta = self._spill
+
+        def loader():
+            with np.load(path) as payload:
+                stores = [SpectrumStore(meta[kind][0], payload[kind + '_x'], payload[kind + '_y'],
+                                        payload[kind + '_offsets'], meta[kind][1])
+                          for kind in ('emission', 'absorption')]
+            return stores[0], stores[1], self.problems
+
+        self._emission = self._absorption = None
+        self._loader = loader
+        self.invalidate()
+
+    def _drop_spill(self):
+        if self._spill is not None:
+            try:
+                os.remove(self._spill[0])
+            except OSError:
+                pass
+            self._spill = None
+
+    def convert(self, dtype):
+        """Смена точности хранения загруженных спектров"""
+        self._emission = self._emission.astype(dtype)
+        self._absorption = self._absorption.astype(dtype)
+        self.invalidate()
+        self._drop_spill()
+
+    def invalidate(self):
+        """Сброс производных спектров (коррекция, сглаживание, индексы)"""
+        self._corrected = None
+        self._smoothed = {}
+        self._domains = {}
+        self._indexes = {}
+        self._bands = {}
+
+    def set_correction(self, correction):
+        if correction is not self.correction:
+            self.correction = correction
+            self.invalidate()
+
+    def manifest(self):
+        """Список исходных файлов набора с размерами, датами и хэшами (для
+        файлов архивов - размер и дата самого архива)"""
+        files = []
+        for kind, store in (('emission', self.emission), ('absorption', self.absorption)):
+            for name, source in zip(store.names, store.sources):
+                entry = {'kind': kind, 'name': name, 'path': source}
+                if source is not None:
+                    try:
+                        stat = os.stat(source.partition(ARCHIVE_SEPARATOR)[0])
+                        entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns, hash=source_digest(source))
+                    except (OSError, KeyError):
+                        pass
+                files.append(entry)
+        return files
+
+    def changed_files(self, manifest):
+        """Файлы манифеста, изменившиеся или пропавшие с момента сохранения"""
+        changed = []
+        for entry in manifest:
+            path = entry.get('path')
+            if path is None or 'hash' not in entry:
+                continue
+            try:
+                stat = os.stat(path.partition(ARCHIVE_SEPARATOR)[0])
+                # Хэш пересчитывается только если изменились размер или дата
+                if ((stat.st_size, stat.st_mtime_ns) != (entry['size'], entry['mtime_ns'])
+                        and source_digest(path) != entry['hash']):
+                    changed.append(path)
+            except (OSError, KeyError):
+                changed.append(path)
+        return changed
+
+    @property
+    def emission(self):
+        return self.load()._emission
+
+    @property
+    def absorption(self):
+        return self.load()._absorption
+
+    def pairs(self):
+        """Номера спектров эмиссии и абсорбции с одинаковыми именами"""
+        absorption_index = {name: i for i, name in enumerate(self.absorption.names)}
+        emission_idx, absorption_idx = [], []
+        for i, name in enumerate(self.emission.names):
+            j = absorption_index.get(name)
+            if j is not None:
+                emission_idx.append(i)
+                absorption_idx.append(j)
+        return (np.array(emission_idx, dtype=np.int64),
+                np.array(absorption_idx, dtype=np.int64))
+
+    def compute(self, hv, trim=None, smoothing=None, deconvolution=None, domain='wavelength'):
+        """Расчет ex_pic и интегралов для всех пар спектров.
+
+        smoothing - (метод, параметр) сглаживания эмиссии или None; при
+        сглаживании сохраняются и интегралы исходных спектров (*_raw).
+        deconvolution - (форма, число полос, номер полосы или None - основная)
+        или None; при разложении интегралами считаются интегралы выбранной
+        полосы, интегралы всего спектра сохраняются как *_total.
+        domain - шкала интегрирования (см. SPECTRAL_DOMAINS); trim - в нм.
+        """
+        if domain not in SPECTRAL_DOMAINS:
+            raise ValueError(f"Unknown spectral domain: {domain}")
+        trim = self.effective_trim(trim)
+        emission_idx, absorption_idx = self.pairs()
+        names, integrals_simpson, integrals_trapezoid = self.integrate(emission_idx, trim, smoothing, domain)
+
+        absorption = self.absorption
+        with PROFILER.stage('ex_pic', len(absorption.x)):
+            ex_pic = segment_nearest(absorption.x, absorption.y, absorption.offsets, hv)[absorption_idx]
+
+        self.results = {
+            'names': names,
+            'trim': list(trim) if trim is not None else None,
+            'smoothing': list(smoothing) if smoothing is not None else None,
+            'domain': domain,
+            'ex_pic': ex_pic,
+            'integrals_simpson': integrals_simpson,
+            'integrals_trapezoid': integrals_trapezoid,
+        }
+        if smoothing is not None:
+            _, raw_simpson, raw_trapezoid = self.integrate(emission_idx, trim, None, domain)
+            self.results['integrals_simpson_raw'] = raw_simpson
+            self.results['integrals_trapezoid_raw'] = raw_trapezoid
+        if deconvolution is not None:
+            shape, n_components, component = deconvolution
+            bands, fit = self.band_fit(emission_idx, ex_pic, trim, smoothing, shape, n_components, domain)
+            component = int(fit['main'] if component is None else component)
+            if not 0 <= component < n_components:
+                raise ValueError(f"Band {component} does not exist ({n_components} bands)")
+            with PROFILER.stage('integrate_band', len(bands.x)):
+                band = band_store(bands, fit, component)
+                band_simpson = segment_simpson(band.x, band.y, band.offsets)
+                band_trapezoid = segment_trapezoid(band.x, band.y, band.offsets)
+            missing = ~np.isfinite(integrals_simpson) | ~np.isfinite(fit['rmse'])
+            band_simpson[missing] = np.nan
+            band_trapezoid[missing] = np.nan
+            _, centers, widths, _, _ = _split_band_parameters(fit['params'], shape)
+            self.results.update({
+                'deconvolution': [shape, n_components, component],
+                'integrals_simpson_total': integrals_simpson,
+                'integrals_trapezoid_total': integrals_trapezoid,
+                'integrals_simpson': band_simpson,
+                'integrals_trapezoid': band_trapezoid,
+                'band_center': centers[:, component],
+                'band_width': widths[:, component],
+                'band_rmse': fit['rmse'],
+            })
+        MEMORY.enforce(keep=self)
+        return self.results
+
+    def band_fit(self, emission_idx, ex_pic, trim, smoothing, shape, n_components, domain='wavelength'):
+        """Разложение спектров эмиссии с номерами emission_idx на полосы
+        (см. deconvolve_store) на шкале domain в диапазоне trim (нм);
+        кэшируется по параметрам.
+
+        Возвращает (обрезанное хранилище спектров, результат подгонки).
+        """
+        key = (tuple(trim) if trim is not None else None, tuple(smoothing) if smoothing is not None else None,
+               shape, n_components, domain)
+        cached = self._bands.get(key)
+        if cached is None or not np.array_equal(cached[0], emission_idx):
+            emission = self.domain_emission(smoothing, domain).take(emission_idx)
+            if trim is not None:
+                emission = emission.trimmed(*domain_window(trim, domain))
+            # Порядок по поглощению - для повторной подгонки от соседних концентраций
+            fit = deconvolve_store(emission, n_components, shape, np.argsort(ex_pic, kind='stable'))
+            cached = (emission_idx, emission, fit)
+            self._bands[key] = cached
+        return cached[1], cached[2]
+
+    def selected_band(self):
+        """Кривые полосы, интегрированной в последнем расчете, или None"""
+        if 'deconvolution' not in self.results:
+            return None
+        shape, n_components, component = self.results['deconvolution']
+        trim, smoothing = self.results['trim'], self.results['smoothing']
+        cached = self._bands.get((tuple(trim) if trim is not None else None,
+                                  tuple(smoothing) if smoothing is not None else None, shape, n_components,
+                                  self.results.get('domain', 'wavelength')))
+        if cached is None:
+            return None
+        return band_store(cached[1], cached[2], component)
+
+    def integrate(self, emission_idx, trim, smoothing=None, domain='wavelength'):
+        """Интегралы (Симпсон, трапеции) спектров эмиссии с номерами emission_idx
+        на шкале domain; trim - в нм"""
+        index = self.integral_index(emission_idx, smoothing, domain)
+        trim = domain_window(trim, domain)
+        emission = index.store
+        if index.monotonic:
+            with PROFILER.stage('integrate_indexed', len(emission)):
+                integrals_simpson, integrals_trapezoid = index.integrals(*(trim or ()))
+            return emission.names, integrals_simpson, integrals_trapezoid
+
+        if trim is not None:
+            with PROFILER.stage('trim', len(emission.x)):
+                emission = emission.trimmed(*trim)
+
+        with PROFILER.stage('integrate', len(emission.x)):
+            integrals_simpson = segment_simpson(emission.x, emission.y, emission.offsets)
+            integrals_trapezoid = segment_trapezoid(emission.x, emission.y, emission.offsets)
+        # Спектры, от которых после обрезки осталось меньше двух точек, не учитываются
+        too_short = emission.lengths < 2
+        integrals_simpson[too_short] = np.nan
+        integrals_trapezoid[too_short] = np.nan
+        return emission.names, integrals_simpson, integrals_trapezoid
+
+    def effective_trim(self, trim):
+        """Диапазон интегрирования набора: собственный (автоопределенный), если
+        обрезка включена и он задан, иначе общий"""
+        if trim is not None and self.trim is not None:
+            return tuple(self.trim)
+        return trim
+
+    def corrected_emission(self):
+        """Спектры эмиссии с коррекцией чувствительности прибора (если задана)"""
+        if self.correction is None:
+            return self.emission
+        if self._corrected is None:
+            self._corrected = self.correction.apply(self.emission)
+        return self._corrected
+
+    def smoothed_emission(self, smoothing):
+        """Сглаженные спектры эмиссии; кэшируются для каждого набора параметров"""
+        if smoothing is None:
+            return self.corrected_emission()
+        smoothing = tuple(smoothing)
+        if smoothing not in self._smoothed:
+            emission = self.corrected_emission()
+            with PROFILER.stage('smooth', len(emission.x)):
+                self._smoothed[smoothing] = smooth_store(emission, *smoothing)
+        return self._smoothed[smoothing]
+
+    def domain_emission(self, smoothing=None, domain='wavelength'):
+        """Спектры эмиссии (сглаженные) на шкале domain; пересчет кэшируется,
+        поэтому переключение шкал не требует повторного чтения и пересчета"""
+        if domain == 'wavelength':
+            return self.smoothed_emission(smoothing)
+        key = (tuple(smoothing) if smoothing is not None else None, domain)
+        if key not in self._domains:
+            emission = self.smoothed_emission(smoothing)
+            with PROFILER.stage('convert_domain', len(emission.x)):
+                self._domains[key] = convert_domain(emission, domain)
+        return self._domains[key]
+
+    def integral_index(self, emission_idx, smoothing=None, domain='wavelength'):
+        """Кумулятивный индекс интегралов спектров эмиссии, имеющих пару"""
+        key = (tuple(smoothing) if smoothing is not None else None, domain)
+        cached = self._indexes.get(key)
+        if cached is None or not np.array_equal(cached[0], emission_idx):
+            emission = self.domain_emission(smoothing, domain).take(emission_idx)
+            with PROFILER.stage('build_index', len(emission.x)):
+                cached = (emission_idx, IntegralIndex(emission))
+            self._indexes[key] = cached
+        return cached[1]
+
+    def series(self):
+        """Серии спектров эмиссии (файлы с несколькими спектрами, см. split_series):
+        {имя спектра: (сетка, матрица время x длина волны)}"""
+        series = {}
+        for name, source in zip(self.emission.names, self.emission.sources):
+            if source is None or os.path.splitext(source)[1].lower() not in SPECTRUM_EXTENSIONS:
+                continue
+            try:
+                x, Y = read_emission_series(source)
+            except (OSError, KeyError, ValueError):
+                continue
+            if len(Y) > 1:
+                series[name] = (x, Y)
+        return series
+
+    def kinetics(self, hv, method='simpson', trim=None, smoothing=None, domain='wavelength'):
+        """Интегральная интенсивность каждого спектра серий во времени.
+
+        Коррекция, сглаживание и обрезка применяются ко всей матрице серии,
+        интегралы находятся одним умножением на веса (integrate_series).
+        Возвращает {имя спектра: {'integrals': по спектрам серии,
+        'ex_pic': поглощение парного спектра абсорбции на hv или NaN}}.
+        """
+        trim = self.effective_trim(trim)
+        absorption = self.absorption
+        ex_pic = (segment_nearest(absorption.x, absorption.y, absorption.offsets, hv)
+                  if len(absorption) else np.empty(0))
+        absorption_index = {name: i for i, name in enumerate(absorption.names)}
+        kinetics = {}
+        for name, (x, Y) in self.series().items():
+            if self.correction is not None:
+                Y = Y * self.correction.on_grid(x)
+            if smoothing is not None:
+                Y = smooth_rows(Y, *smoothing)
+            if trim is not None:
+                mask = (x >= trim[0]) & (x <= trim[1])
+                x, Y = x[mask], Y[:, mask]
+            x, Y = convert_series(x, Y, domain)
+            with PROFILER.stage('kinetics', Y.size):
+                integrals = integrate_series(x, Y, method)
+            kinetics[name] = {'integrals': integrals,
+                              'ex_pic': float(ex_pic[absorption_index[name]]) if name in absorption_index else np.nan}
+        return kinetics
+
+    def calibration_table(self, method):
+        """Все точки калибровки без пропусков: (имена, ex_pic, интегралы, маска исключенных)"""
+        if not self.results:
+            return [], np.empty(0), np.empty(0), np.zeros(0, dtype=bool)
+        x = self.results['ex_pic']
+        y = self.results['integrals_' + method]
+        valid = np.isfinite(x) & np.isfinite(y)
+        names = [name for name, keep in zip(self.results['names'], valid) if keep]
+        excluded = np.array([name in self.excluded for name in names], dtype=bool)
+        return names, x[valid], y[valid], excluded
+
+    def calibration_points(self, method):
+        """Точки калибровки (ex_pic, интеграл) выбранного метода без пропусков
+        и без исключенных пользователем спектров"""
+        _, x, y, excluded = self.calibration_table(method)
+        return x[~excluded], y[~excluded]
+
+    def diagnostics(self, method):
+        """Диагностика влияния точек калибровки (см. regression_diagnostics).
+
+        Возвращает имена учтенных спектров и словарь массивов по ним.
+        """
+        names, x, y, excluded = self.calibration_table(method)
+        with PROFILER.stage('diagnostics', len(x)):
+            diagnostics = regression_diagnostics(x[~excluded], y[~excluded])
+        return [name for name, skip in zip(names, excluded) if not skip], diagnostics
+
+    def toggle_excluded(self, name):
+        """Исключение спектра из калибровки или возврат исключенного"""
+        if name in self.excluded:
+            self.excluded.discard(name)
+        else:
+            self.excluded.add(name)
+
+    def regression(self, method):
+        """Наклон и сдвиг калибровочной прямой"""
+        x, y = self.calibration_points(method)
+        with PROFILER.stage('regression', len(x)):
+            return linear_regression(x, y)
+
+
+class Workspace:
+    """Рабочее пространство: произвольное число образцов и стандартов"""
+
+    def __init__(self):
+        self.datasets = {}
+        self.correction = None
+
+    def __len__(self):
+        return len(self.datasets)
+
+    def __iter__(self):
+        return iter(self.datasets.values())
+
+    def __getitem__(self, name):
+        return self.datasets[name]
+
+    def add(self, folder, role, selection=None):
+        """Добавление папки; повторная загрузка той же папки заменяет набор.
+
+        selection - файлы папки для чтения (см. load_folder), None - все.
+        """
+        selection = set(selection) if selection is not None else None
+        for dataset in self.datasets.values():
+            if dataset.folder == folder and dataset.role == role:
+                dataset.selection = selection
+                return dataset.reload()
+        base = source_name(folder)
+        name, counter = base, 2
+        while name in self.datasets:
+            name = f"{base} ({counter})"
+            counter += 1
+        dataset = Dataset(name, role, folder)
+        dataset.correction = self.correction
+        dataset.selection = selection
+        self.datasets[name] = dataset
+        return dataset
+
+    def set_correction(self, correction):
+        """Коррекция чувствительности для всех наборов (None - без коррекции)"""
+        self.correction = correction
+        for dataset in self.datasets.values():
+            dataset.set_correction(correction)
+
+    def remove(self, name):
+        dataset = self.datasets.pop(name, None)
+        if dataset is not None:
+            dataset._drop_spill()
+
+    def by_role(self, role):
+        return [d for d in self.datasets.values() if d.role == role]
+
+    def compute(self, hv, trim=None, smoothing=None, deconvolution=None, domain='wavelength'):
+        """Расчет ex_pic и интегралов для всех наборов"""
+        for dataset in self.datasets.values():
+            dataset.compute(hv, trim, smoothing, deconvolution, domain)
+
+    def quantum_yield_matrix(self, method, qy_standards, refractive):
+        """Квантовые выходы всех пар образец x стандарт одним векторным расчетом.
+
+        qy_standards - {имя стандарта: QY, %}, refractive - {имя набора: n}.
+        """
+        samples = self.by_role('sample')
+        standards = self.by_role('standard')
+
+        a_s = np.array([d.regression(method)[0] for d in samples], dtype=np.float64)
+        a_t = np.array([d.regression(method)[0] for d in standards], dtype=np.float64)
+        qy_t = np.array([qy_standards[d.name] for d in standards], dtype=np.float64)
+        n_s = np.array([refractive[d.name] for d in samples], dtype=np.float64)
+        n_t = np.array([refractive[d.name] for d in standards], dtype=np.float64)
+
+        def relative_qy(a, n):
+            # QY = QY_st * (a / a_st) * (n / n_st)^2; при a_st = 0 результат 0
+            ratio = np.divide(a[:, None], a_t[None, :], out=np.zeros((len(a), len(a_t))),
+                              where=a_t[None, :] != 0)
+            return qy_t[None, :] * ratio * (n[:, None] / n_t[None, :]) ** 2
+
+        qy = relative_qy(a_s, n_s)
+
+        # Согласованность: разброс QY образца по разным стандартам
+        valid = a_t != 0
+        used = qy[:, valid]
+        if used.shape[1] >= 2:
+            mean = used.mean(axis=1)
+            spread = np.divide(used.std(axis=1), np.abs(mean),
+                               out=np.zeros_like(mean), where=mean != 0)
+        else:
+            mean = used[:, 0] if used.shape[1] else np.zeros(len(samples))
+            spread = np.zeros(len(samples))
+
+        # Перекрестная проверка стандартов: QY стандарта j по стандарту k
+        cross = relative_qy(a_t, n_t)
+        cross_deviation = np.divide(cross - qy_t[:, None], qy_t[:, None],
+                                    out=np.zeros_like(cross), where=qy_t[:, None] != 0)
+        cross_deviation[:, ~valid] = 0
+
+        return {
+            'samples': [d.name for d in samples],
+            'standards': [d.name for d in standards],
+            'qy': qy,
+            'mean': mean,
+            'spread': spread,
+            'consistent': spread <= QY_CONSISTENCY_TOLERANCE,
+            'standards_deviation': cross_deviation,
+            'standards_consistent': np.abs(cross_deviation) <= QY_CONSISTENCY_TOLERANCE,
+        }
+
+    def kinetics(self, hv, method='simpson', trim=None, smoothing=None, domain='wavelength'):
+        """Кинетика серий спектров всех наборов: {имя набора: Dataset.kinetics}"""
+        kinetics = {}
+        for dataset in self:
+            series = dataset.kinetics(hv, method, trim, smoothing, domain)
+            if series:
+                kinetics[dataset.name] = series
+        return kinetics
+
+    def kinetics_quantum_yield(self, kinetics, method, qy_standards, refractive):
+        """QY каждого спектра серий образцов по каждому стандарту.
+
+        Одноточечный относительный метод: QY = QY_st * (I / A) / a_st *
+        (n / n_st)^2, где I / A - интеграл спектра серии на единицу
+        поглощения, a_st - наклон калибровки стандарта. Возвращает
+        {'standards': имена, 'qy': {(набор, спектр): матрица время x стандарт}}.
+        """
+        standards = self.by_role('standard')
+        a_t = np.array([d.regression(method)[0] for d in standards], dtype=np.float64)
+        qy_t = np.array([qy_standards[d.name] for d in standards], dtype=np.float64)
+        n_t = np.array([refractive[d.name] for d in standards], dtype=np.float64)
+        qy = {}
+        for name, series in kinetics.items():
+            if self[name].role != 'sample':
+                continue
+            n_s = refractive[name]
+            for spectrum, entry in series.items():
+                # Без поглощения на hv (ноль, NaN) QY спектра не определен
+                integrals = np.asarray(entry['integrals'], dtype=np.float64)
+                absorbs = bool(np.isfinite(entry['ex_pic']) and entry['ex_pic'] != 0)
+                per_absorbance = np.divide(integrals, entry['ex_pic'], out=np.full(len(integrals), np.nan),
+                                           where=absorbs)
+                ratio = np.divide(per_absorbance[:, None], a_t[None, :],
+                                  out=np.full((len(integrals), len(a_t)), 0.0 if absorbs else np.nan),
+                                  where=absorbs & (a_t[None, :] != 0))
+                qy[name, spectrum] = qy_t[None, :] * ratio * (n_s / n_t[None, :]) ** 2
+        return {'standards': [d.name for d in standards], 'qy': qy}
+
+    def leave_one_out(self, method, qy_result=None):
+        """Диагностика точек калибровки всех наборов и QY при исключении каждой точки.
+
+        QY пропорционален a_s / a_st, поэтому QY без точки получается из
+        готовой матрицы qy_result (см. quantum_yield_matrix) заменой наклона
+        на наклон без этой точки. Возвращает {имя набора: словарь} с именами
+        точек, массивами regression_diagnostics и, при заданном qy_result,
+        'qy' - матрицей (точка x партнер) и 'partners' - именами партнеров:
+        стандартов для образца, образцов для стандарта.
+        """
+        diagnostics = {}
+        for dataset in self:
+            names, values = dataset.diagnostics(method)
+            entry = dict(values, names=names)
+            if qy_result is not None and dataset.name in qy_result['samples'] + qy_result['standards']:
+                slope = dataset.regression(method)[0]
+                loo_slope = values['slope']
+                if dataset.role == 'sample':
+                    base = qy_result['qy'][qy_result['samples'].index(dataset.name)]
+                    scale = np.divide(loo_slope, slope, out=np.full(len(names), np.nan), where=slope != 0)
+                    entry['partners'] = qy_result['standards']
+                else:
+                    base = qy_result['qy'][:, qy_result['standards'].index(dataset.name)]
+                    scale = np.divide(slope, loo_slope, out=np.full(len(names), np.nan), where=loo_slope != 0)
+                    entry['partners'] = qy_result['samples']
+                entry['qy'] = scale[:, None] * base[None, :]
+            diagnostics[dataset.name] = entry
+        return diagnostics
+
+
+
+# === ЭКСПОРТ РЕЗУЛЬТАТОВ ===
+
+EXPORT_FORMATS = {'.csv': 'csv', '.parquet': 'parquet', '.h5': 'hdf5', '.hdf5': 'hdf5'}
+
+
+def results_tables(workspace, trim=None, qy_result=None, method='simpson'):
+    """Таблицы результатов в виде колонок - массивов NumPy.
+
+    'spectra' - по строке на каждый спектр калибровки, 'datasets' - регрессии
+    каждого набора обоими методами, 'quantum_yield' - QY пар образец/стандарт.
+    """
+    datasets = [d for d in workspace if d.results]
+    counts = np.array([len(d.results['ex_pic']) for d in datasets], dtype=np.int64)
+
+    def concat(key):
+        # Отсутствующие у набора колонки (например, *_raw без сглаживания) - NaN
+        if not datasets:
+            return np.empty(0)
+        return np.concatenate([np.asarray(d.results.get(key, np.full(count, np.nan)), dtype=np.float64)
+                               for d, count in zip(datasets, counts)])
+
+    ex_pic = concat('ex_pic')
+    spectra = {
+        'dataset': np.repeat(np.array([d.name for d in datasets], dtype=object), counts),
+        'role': np.repeat(np.array([d.role for d in datasets], dtype=object), counts),
+        'domain': np.repeat(np.array([d.results.get('domain', 'wavelength') for d in datasets], dtype=object), counts),
+        'file': np.array([name for d in datasets for name in d.results['names']], dtype=object),
+        'excluded': np.array([name in d.excluded for d in datasets for name in d.results['names']], dtype=bool),
+        'ex_pic': ex_pic,
+        'integral_simpson': concat('integrals_simpson'),
+        'integral_trapezoid': concat('integrals_trapezoid'),
+        'integral_simpson_raw': concat('integrals_simpson_raw'),
+        'integral_trapezoid_raw': concat('integrals_trapezoid_raw'),
+        'integral_simpson_total': concat('integrals_simpson_total'),
+        'integral_trapezoid_total': concat('integrals_trapezoid_total'),
+        'band_center': concat('band_center'),
+        'band_width': concat('band_width'),
+        'band_rmse': concat('band_rmse'),
+        'trim_min': np.repeat([(d.results.get('trim') or (np.nan, np.nan))[0] for d in datasets], counts),
+        'trim_max': np.repeat([(d.results.get('trim') or (np.nan, np.nan))[1] for d in datasets], counts),
+    }
+
+    regression_rows = {'dataset': [], 'role': [], 'method': [], 'slope': [], 'intercept': [],
+                       'n_points': [], 'r_squared': []}
+    for method_name in ('simpson', 'trapezoid'):
+        fits = [d.regression(method_name) for d in datasets]
+        slopes = np.array([fit[0] for fit in fits], dtype=np.float64)
+        intercepts = np.array([fit[1] for fit in fits], dtype=np.float64)
+        y = spectra['integral_' + method_name]
+        residuals = y - (np.repeat(slopes, counts) * ex_pic + np.repeat(intercepts, counts))
+        spectra['residual_' + method_name] = residuals
+
+        # R^2 по наборам через суммы по сегментам
+        segments = np.repeat(np.arange(len(datasets)), counts)
+        valid = np.isfinite(residuals) & ~spectra['excluded']
+        n = np.bincount(segments[valid], minlength=len(datasets))
+        ss_res = np.bincount(segments[valid], weights=residuals[valid] ** 2, minlength=len(datasets))
+        mean_y = np.divide(np.bincount(segments[valid], weights=y[valid], minlength=len(datasets)), n,
+                           out=np.zeros(len(datasets)), where=n > 0)
+        ss_tot = np.bincount(segments[valid], weights=(y[valid] - mean_y[segments[valid]]) ** 2,
+                             minlength=len(datasets))
+        unexplained = np.divide(ss_res, ss_tot, out=np.ones(len(datasets)), where=ss_tot > 0)
+
+        regression_rows['dataset'].append(np.array([d.name for d in datasets], dtype=object))
+        regression_rows['role'].append(np.array([d.role for d in datasets], dtype=object))
+        regression_rows['method'].append(np.full(len(datasets), method_name, dtype=object))
+        regression_rows['slope'].append(slopes)
+        regression_rows['intercept'].append(intercepts)
+        regression_rows['n_points'].append(n)
+        regression_rows['r_squared'].append(1 - unexplained)
+    regressions = {key: np.concatenate(parts) for key, parts in regression_rows.items()}
+
+    if qy_result is not None and len(qy_result['samples']) and len(qy_result['standards']):
+        qy = np.asarray(qy_result['qy'], dtype=np.float64)
+        n_samples, n_standards = qy.shape
+        quantum_yield = {
+            'sample': np.repeat(np.array(qy_result['samples'], dtype=object), n_standards),
+            'standard': np.tile(np.array(qy_result['standards'], dtype=object), n_samples),
+            'method': np.full(qy.size, method, dtype=object),
+            'qy': qy.ravel(),
+            'sample_mean_qy': np.repeat(np.asarray(qy_result['mean'], dtype=np.float64), n_standards),
+            'sample_spread': np.repeat(np.asarray(qy_result['spread'], dtype=np.float64), n_standards),
+        }
+    else:
+        quantum_yield = {'sample': np.empty(0, dtype=object), 'standard': np.empty(0, dtype=object),
+                         'method': np.empty(0, dtype=object), 'qy': np.empty(0),
+                         'sample_mean_qy': np.empty(0), 'sample_spread': np.empty(0)}
+
+    return {'spectra': spectra, 'datasets': regressions, 'quantum_yield': quantum_yield}
+
+
+def _write_csv(path, columns):
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(list(columns))
+        writer.writerows(zip(*(column.tolist() for column in columns.values())))
+
+
+def _write_parquet(path, columns):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet export requires pyarrow (pip install pyarrow)")
+    # Числовые колонки передаются в Arrow без копирования построчно
+    table = pa.table({name: pa.array(column, type=pa.string()) if column.dtype == object else column
+                      for name, column in columns.items()})
+    pq.write_table(table, path)
+
+
+def export_results(path, tables):
+    """Запись таблиц результатов; формат определяется расширением path.
+
+    CSV и Parquet: по файлу на таблицу (<имя>.<таблица>.<расширение>),
+    HDF5: один файл с группой на таблицу и набором данных на колонку.
+    Возвращает список записанных файлов.
+    """
+    base, ext = os.path.splitext(path)
+    kind = EXPORT_FORMATS.get(ext.lower())
+    if kind is None:
+        raise ValueError(f"Unsupported export format: {ext}")
+
+    if kind == 'hdf5':
+        try:
+            import h5py
+        except ImportError:
+            raise ImportError("HDF5 export requires h5py (pip install h5py)")
+        with h5py.File(path, 'w') as file:
+            for table_name, columns in tables.items():
+                group = file.create_group(table_name)
+                for name, column in columns.items():
+                    if column.dtype == object:
+                        group.create_dataset(name, data=column.astype(str).astype(object),
+                                             dtype=h5py.string_dtype())
+                    else:
+                        group.create_dataset(name, data=column)
+        return [path]
+
+    writer = _write_csv if kind == 'csv' else _write_parquet
+    written = []
+    for table_name, columns in tables.items():
+        table_path = f"{base}.{table_name}{ext}"
+        writer(table_path, columns)
+        written.append(table_path)
+    return written
+
+
+# === СЕССИИ ===
+
+SESSION_VERSION = 1
+SESSION_EXTENSION = '.qysession'
+
+
+def _json_ready(value):
+    """Преобразование массивов NumPy в списки для записи в JSON"""
+    if isinstance(value, dict):
+        return {key: _json_ready(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_ready(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def save_session(path, workspace, parameters):
+    """Сохранение сессии в один файл.
+
+    Файл - архив .npz: описание сессии (параметры, манифест файлов с хэшами,
+    регрессии, QY) хранится в JSON под ключом 'session', спектры и
+    результаты - отдельными массивами, которые читаются по требованию.
+    """
+    arrays = {}
+    datasets = []
+    for i, dataset in enumerate(workspace):
+        prefix = f'd{i}_'
+        for kind, store in (('emission', dataset.emission), ('absorption', dataset.absorption)):
+            arrays[prefix + kind + '_x'] = store.x
+            arrays[prefix + kind + '_y'] = store.y
+            arrays[prefix + kind + '_offsets'] = store.offsets
+        results = {}
+        for key, value in dataset.results.items():
+            if isinstance(value, np.ndarray):
+                arrays[prefix + key] = value
+            else:
+                results[key] = value
+        datasets.append({
+            'name': dataset.name,
+            'role': dataset.role,
+            'folder': dataset.folder,
+            'trim': list(dataset.trim) if dataset.trim is not None else None,
+            'selection': sorted(dataset.selection) if dataset.selection is not None else None,
+            'keep_duplicates': dataset.keep_duplicates,
+            'excluded': sorted(dataset.excluded),
+            'emission_names': dataset.emission.names,
+            'absorption_names': dataset.absorption.names,
+            'manifest': dataset.manifest(),
+            'results': results,
+            'result_arrays': [key for key, value in dataset.results.items() if isinstance(value, np.ndarray)],
+            'regression': {method: dataset.regression(method) for method in ('simpson', 'trapezoid')},
+        })
+
+    correction = workspace.correction
+    if correction is not None:
+        arrays['correction_x'] = correction.x
+        arrays['correction_factor'] = correction.factor
+
+    session = {'version': SESSION_VERSION, 'parameters': _json_ready(parameters), 'datasets': datasets,
+               'correction': correction.source if correction is not None else None}
+    arrays['session'] = np.frombuffer(json.dumps(session, ensure_ascii=False).encode('utf-8'), dtype=np.uint8)
+
+    # Запись через временный файл, чтобы не повредить прежнюю сессию при сбое
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        np.savez(file, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_session(path):
+    """Открытие сессии: возвращает (рабочее пространство, параметры, изменившиеся файлы).
+
+    Спектры не читаются сразу: наборы получают загрузчики, обращающиеся
+    к бинарным массивам файла только при первой необходимости.
+    """
+    # Файл открывается только на время чтения: открытый NpzFile держал бы
+    # дескриптор и (в Windows) мешал сохранить сессию поверх этого файла
+    with np.load(path, allow_pickle=False) as payload:
+        session = json.loads(payload['session'].tobytes().decode('utf-8'))
+        if session.get('version') != SESSION_VERSION:
+            raise ValueError(f"Unsupported session version: {session.get('version')}")
+        correction = ((payload['correction_x'], payload['correction_factor'])
+                      if 'correction_x' in payload.files else None)
+        result_arrays = [{key: payload[f'd{i}_{key}'] for key in entry['result_arrays']}
+                         for i, entry in enumerate(session['datasets'])]
+
+    def make_loader(prefix, entry):
+        def loader():
+            stores = []
+            with np.load(path, allow_pickle=False) as payload:
+                for kind in ('emission', 'absorption'):
+                    names = entry[kind + '_names']
+                    sources = {file['name']: file['path'] for file in entry['manifest'] if file['kind'] == kind}
+                    stores.append(SpectrumStore(names, payload[prefix + kind + '_x'],
+                                                payload[prefix + kind + '_y'],
+                                                payload[prefix + kind + '_offsets'],
+                                                [sources.get(name) for name in names]))
+            return stores[0], stores[1], []
+        return loader
+
+    workspace = Workspace()
+    if correction is not None:
+        workspace.correction = ResponseCorrection(*correction, session.get('correction'))
+    changed = []
+    for i, entry in enumerate(session['datasets']):
+        prefix = f'd{i}_'
+        dataset = Dataset(entry['name'], entry['role'], entry['folder'], make_loader(prefix, entry))
+        dataset.results = dict(entry['results'])
+        dataset.trim = entry['trim']
+        dataset.correction = workspace.correction
+        if entry.get('selection') is not None:
+            dataset.selection = set(entry['selection'])
+        dataset.excluded = set(entry.get('excluded', []))
+        dataset.keep_duplicates = entry.get('keep_duplicates', False)
+        dataset.results.update(result_arrays[i])
+        workspace.datasets[dataset.name] = dataset
+        changed.extend(dataset.changed_files(entry['manifest']))
+    return workspace, session['parameters'], changed
+
+
+# === РЕЖИМ СЕРВИСА: HTTP/JSON API ===
+#
+# python spectroscopy_app.py --serve [--host H] [--port P] [--workers N]
+#
+#   POST /jobs              задание (JSON, см. normalize_job) -> {"id": ...}
+#   GET  /jobs              состояние всех заданий
+#   GET  /jobs/<id>         состояние задания, результат или ошибка
+#   GET  /jobs/<id>/events  поток состояний (по JSON-объекту в строке) до завершения
+#   GET  /health            состояние сервиса
+#
+# Задания выполняются в пуле процессов. Процессы пула живут все время работы
+# сервиса, поэтому их кэши разобранных файлов (_spectrum_cache) сохраняются
+# между заданиями. Кэш у каждого процесса свой, поэтому задание направляется
+# в процесс по набору своих папок (см. job_affinity): повторный расчет тех же
+# папок попадает в процесс, который их уже разобрал, и только проверяет даты
+# файлов. Если этот процесс занят, а другой свободен, задание уходит в
+# свободный - ожидание в очереди дольше повторного разбора.
+
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 8765
+SERVICE_JOB_HISTORY = 1000  # Сколько завершенных заданий хранить
+JOB_FINISHED = ('done', 'failed')
+
+
+class JobError(ValueError):
+    """Некорректное задание или невозможность его выполнить"""
+
+
+def normalize_job(payload):
+    """Проверка задания и приведение к стандартному виду.
+
+    Поля: samples, standards - списки папок; hv - длина волны возбуждения;
+    method - 'simpson' или 'trapezoid'; trim - [от, до] или null; smoothing -
+    [метод, параметр] или null; qy_standards - {стандарт: QY, %};
+    refractive - {набор: n} (по умолчанию 1); correction - файл кривой
+    коррекции или null; deconvolution - {"shape": форма полос, "components":
+    число полос, "component": номер интегрируемой полосы или null} или null
+    (см. deconvolve_store); domain - шкала интегрирования (см.
+    SPECTRAL_DOMAINS, по умолчанию 'wavelength'); keep_duplicates - читать
+    копии файлов как отдельные спектры (по умолчанию false). Наборы в qy_standards и refractive задаются именем
+    (имя папки) или путем к папке.
+    """
+    if not isinstance(payload, dict):
+        raise JobError("job must be a JSON object")
+    job = {}
+    for key in ('samples', 'standards'):
+        folders = payload.get(key) or []
+        if isinstance(folders, str):
+            folders = [folders]
+        if not isinstance(folders, list) or not all(isinstance(folder, str) for folder in folders):
+            raise JobError(f"'{key}' must be a folder or a list of folders")
+        for folder in folders:
+            if not (os.path.isdir(folder) or is_archive(folder)):
+                raise JobError(f"not a folder or archive: {folder}")
+        job[key] = [str(folder) for folder in folders]
+    if not job['samples']:
+        raise JobError("'samples' must list at least one folder")
+    for key in ('qy_standards', 'refractive', 'deconvolution'):
+        if payload.get(key) is not None and not isinstance(payload[key], dict):
+            raise JobError(f"'{key}' must be a JSON object")
+
+    try:
+        job['hv'] = float(payload['hv'])
+        trim = payload.get('trim')
+        job['trim'] = (float(trim[0]), float(trim[1])) if trim is not None else None
+        smoothing = payload.get('smoothing')
+        job['smoothing'] = (str(smoothing[0]), float(smoothing[1])) if smoothing is not None else None
+        job['qy_standards'] = {str(k): float(v) for k, v in (payload.get('qy_standards') or {}).items()}
+        job['refractive'] = {str(k): float(v) for k, v in (payload.get('refractive') or {}).items()}
+        deconvolution = payload.get('deconvolution')
+        if deconvolution is not None:
+            component = deconvolution.get('component')
+            deconvolution = (str(deconvolution.get('shape', 'gaussian')), int(deconvolution.get('components', 1)),
+                             int(component) if component is not None else None)
+        job['deconvolution'] = deconvolution
+    except KeyError as e:
+        raise JobError(f"missing field: {e.args[0]}")
+    except (TypeError, ValueError, IndexError) as e:
+        raise JobError(f"invalid job parameters: {e}")
+
+    job['method'] = payload.get('method', 'simpson')
+    if job['method'] not in ('simpson', 'trapezoid'):
+        raise JobError(f"unknown method: {job['method']}")
+    if job['smoothing'] is not None and job['smoothing'][0] not in SMOOTHING_METHODS:
+        raise JobError(f"unknown smoothing method: {job['smoothing'][0]}")
+    job['domain'] = payload.get('domain', 'wavelength')
+    job['keep_duplicates'] = bool(payload.get('keep_duplicates', False))
+    if job['domain'] not in SPECTRAL_DOMAINS:
+        raise JobError(f"unknown spectral domain: {job['domain']}")
+    if job['deconvolution'] is not None:
+        shape, n_components, component = job['deconvolution']
+        if shape not in BAND_SHAPES:
+            raise JobError(f"unknown band shape: {shape}")
+        if n_components < 1 or component is not None and not 0 <= component < n_components:
+            raise JobError(f"invalid band selection: {component} of {n_components}")
+    job['correction'] = payload.get('correction')
+    if job['correction'] is not None and not isinstance(job['correction'], str):
+        raise JobError("'correction' must be a file path")
+    if job['correction'] is not None and not os.path.isfile(job['correction']):
+        raise JobError(f"not a file: {job['correction']}")
+    return job
+
+
+def solve_job(job, progress=None):
+    """Расчет задания без интерфейса - та же последовательность, что в
+    perform_calculation: интегралы, регрессии, матрица квантовых выходов.
+
+    Возвращает (рабочее пространство, результат quantum_yield_matrix или
+    None). progress(стадия, доля) вызывается по ходу расчета.
+    """
+    report = progress or (lambda stage, fraction: None)
+    workspace = Workspace()
+    if job.get('correction'):
+        workspace.set_correction(ResponseCorrection.from_file(job['correction']))
+    aliases = {}
+    for role, key in (('sample', 'samples'), ('standard', 'standards')):
+        for folder in job[key]:
+            aliases[folder] = workspace.add(folder, role).name
+
+    report('load', 0.0)
+    datasets = list(workspace)
+    for i, dataset in enumerate(datasets):
+        dataset.keep_duplicates = job.get('keep_duplicates', False)
+        dataset.load()
+        report('load', 0.5 * (i + 1) / len(datasets))
+
+    with PROFILER.stage('calculation.compute'):
+        workspace.compute(job['hv'], job['trim'], job['smoothing'], job.get('deconvolution'),
+                          job.get('domain', 'wavelength'))
+    report('compute', 0.8)
+
+    method = job['method']
+    with PROFILER.stage('calculation.regression'):
+        for dataset in workspace.by_role('sample'):
+            if len(dataset.calibration_points(method)[0]) < 2:
+                raise JobError(f"not enough data for sample regression {dataset.name}")
+        regressions = {dataset.name: dataset.regression(method) for dataset in datasets}
+    report('regression', 0.9)
+
+    qy_result = None
+    standards = workspace.by_role('standard')
+    if any(regressions[d.name][0] != 0 for d in standards):
+        qy_standards = {aliases.get(k, k): v for k, v in job['qy_standards'].items()}
+        missing = [d.name for d in standards if d.name not in qy_standards]
+        if missing:
+            raise JobError(f"missing standard QY for: {', '.join(missing)}")
+        refractive = {d.name: 1.0 for d in datasets}
+        refractive.update({aliases.get(k, k): v for k, v in job['refractive'].items()})
+        qy_result = workspace.quantum_yield_matrix(method, qy_standards, refractive)
+    report('quantum_yield', 1.0)
+    return workspace, qy_result
+
+
+def run_job(job, progress=None):
+    """Расчет задания (см. solve_job); результат - словарь, готовый для JSON"""
+    workspace, qy_result = solve_job(job, progress)
+    method = job['method']
+    datasets = list(workspace)
+    regressions = {dataset.name: dataset.regression(method) for dataset in datasets}
+    return _json_ready({
+        'datasets': [{
+            'name': dataset.name,
+            'role': dataset.role,
+            'folder': dataset.folder,
+            'slope': regressions[dataset.name][0],
+            'intercept': regressions[dataset.name][1],
+            'points': len(dataset.calibration_points(method)[0]),
+            'problems': [path for path, error in dataset.problems
+                         if not isinstance(error, DuplicateSpectrumError)],
+            'duplicates': [[path, original] for path, original in dataset.duplicates],
+        } for dataset in datasets],
+        'quantum_yield': qy_result,
+    })
+
+
+def job_affinity(job, workers):
+    """Номер процесса сервиса для задания: одинаковые наборы папок - один процесс"""
+    folders = '\n'.join(sorted(job['samples'] + job['standards']))
+    digest = hashlib.blake2b(folders.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') % workers
+
+
+def _service_worker(job_id, job, updates):
+    """Выполнение задания в процессе пула с передачей прогресса в очередь"""
+    return run_job(job, lambda stage, fraction: updates.put((job_id, stage, fraction)))
+
+
+class QYService:
+    """Очередь заданий на пуле процессов с отслеживанием их состояния.
+
+    Пул - набор исполнителей с одним процессом, чтобы задание можно было
+    направить в определенный процесс (см. job_affinity).
+    """
+
+    def __init__(self, workers=None):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        self.workers = workers or os.cpu_count() or 1
+        self.executors = [ProcessPoolExecutor(max_workers=1) for _ in range(self.workers)]
+        self.pending = [0] * self.workers  # Заданий в очереди и в работе у каждого процесса
+        self.manager = multiprocessing.Manager()
+        self.updates = self.manager.Queue()
+        self.jobs = collections.OrderedDict()
+        self.condition = threading.Condition()
+        self._drain = threading.Thread(target=self._drain_updates, daemon=True)
+        self._drain.start()
+
+    def submit(self, payload):
+        job = normalize_job(payload)
+        job_id = uuid.uuid4().hex[:12]
+        with self.condition:
+            self.jobs[job_id] = {'id': job_id, 'status': 'queued', 'stage': None, 'progress': 0.0,
+                                 'submitted': time.time(), 'result': None, 'error': None, 'version': 0}
+            self._prune()
+            worker = self._choose_worker(job)
+            self.pending[worker] += 1
+        future = self.executors[worker].submit(_service_worker, job_id, job, self.updates)
+        future.add_done_callback(functools.partial(self._finished, job_id, worker))
+        return self.snapshot(job_id)
+
+    def _choose_worker(self, job):
+        """Процесс задания: по его папкам, а если тот занят - свободный"""
+        worker = job_affinity(job, self.workers)
+        if self.pending[worker] and 0 in self.pending:
+            worker = self.pending.index(0)
+        return worker
+
+    def _prune(self):
+        finished = [job_id for job_id, record in self.jobs.items() if record['status'] in JOB_FINISHED]
+        for job_id in finished[:max(0, len(finished) - SERVICE_JOB_HISTORY)]:
+            del self.jobs[job_id]
+
+    def _update(self, job_id, **changes):
+        with self.condition:
+            record = self.jobs.get(job_id)
+            if record is None:
+                return
+            # Запоздавший прогресс не должен отменять завершение
+            if record['status'] in JOB_FINISHED and changes.get('status') == 'running':
+                return
+            record.update(changes)
+            record['version'] += 1
+            self.condition.notify_all()
+
+    def _drain_updates(self):
+        while True:
+            try:
+                item = self.updates.get()
+            except (EOFError, OSError):
+                return
+            if item is None:
+                return
+            job_id, stage, fraction = item
+            self._update(job_id, status='running', stage=stage, progress=fraction)
+
+    def _finished(self, job_id, worker, future):
+        with self.condition:
+            self.pending[worker] -= 1
+        error = future.exception()
+        if error is not None:
+            self._update(job_id, status='failed', error=f"{type(error).__name__}: {error}")
+        else:
+            self._update(job_id, status='done', stage=None, progress=1.0, result=future.result())
+
+    def snapshot(self, job_id):
+        with self.condition:
+            record = self.jobs.get(job_id)
+            return dict(record) if record is not None else None
+
+    def list_jobs(self):
+        with self.condition:
+            return [{key: value for key, value in record.items() if key != 'result'}
+                    for record in self.jobs.values()]
+
+    def events(self, job_id, timeout=None):
+        """Состояния задания при каждом изменении, последнее - завершенное"""
+        version = -1
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            with self.condition:
+                record = self.jobs.get(job_id)
+                while record is not None and record['version'] == version:
+                    remaining = deadline - time.monotonic() if deadline is not None else None
+                    if remaining is not None and remaining <= 0:
+                        return
+                    self.condition.wait(remaining)
+                    record = self.jobs.get(job_id)
+                if record is None:
+                    return
+                version = record['version']
+                snapshot = dict(record)
+            yield snapshot
+            if snapshot['status'] in JOB_FINISHED:
+                return
+
+    def shutdown(self):
+        for executor in self.executors:
+            executor.shutdown(wait=True, cancel_futures=True)
+        self.updates.put(None)
+        self._drain.join(timeout=5)
+        self.manager.shutdown()
+
+
+class ServiceRequestHandler:
+    """Обработчик HTTP-запросов сервиса. Класс-примесь: serve добавляет к нему
+    BaseHTTPRequestHandler и service, http.server импортируется только там"""
+    service = None
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parts = [part for part in self.path.split('?')[0].split('/') if part]
+        if parts == ['health']:
+            self.send_json(200, {'status': 'ok', 'kernels': kernel_backend(),
+                                 'workers': self.service.workers})
+        elif parts == ['jobs']:
+            self.send_json(200, self.service.list_jobs())
+        elif len(parts) == 2 and parts[0] == 'jobs':
+            snapshot = self.service.snapshot(parts[1])
+            if snapshot is None:
+                self.send_json(404, {'error': f"unknown job: {parts[1]}"})
+            else:
+                self.send_json(200, snapshot)
+        elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'events':
+            if self.service.snapshot(parts[1]) is None:
+                self.send_json(404, {'error': f"unknown job: {parts[1]}"})
+                return
+            # Поток без Content-Length: по JSON-объекту в строке до завершения задания
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.end_headers()
+            for snapshot in self.service.events(parts[1]):
+                self.wfile.write(json.dumps(snapshot, ensure_ascii=False).encode('utf-8') + b'\n')
+                self.wfile.flush()
+        else:
+            self.send_json(404, {'error': f"unknown path: {self.path}"})
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/jobs':
+            self.send_json(404, {'error': f"unknown path: {self.path}"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length).decode('utf-8'))
+            snapshot = self.service.submit(payload)
+        except (JobError, ValueError) as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        except (AttributeError, TypeError) as e:
+            # Последняя защита: поток обработчика не должен падать без ответа
+            self.send_json(400, {'error': f"invalid job: {e}"})
+            return
+        self.send_json(202, snapshot)
+
+
+def serve(host=SERVICE_HOST, port=SERVICE_PORT, workers=None):
+    """Запуск HTTP-сервиса до прерывания (Ctrl+C или SIGTERM)"""
+    import signal
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    # SIGTERM (kill, systemd, docker stop) завершает сервис как Ctrl+C, иначе
+    # процессы пула и менеджера очереди остаются сиротами
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    service = QYService(workers)
+    handler = type('Handler', (ServiceRequestHandler, BaseHTTPRequestHandler), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    print(f"Serving QY API on http://{host}:{server.server_address[1]}/", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+class QYServiceClient:
+    """Клиент HTTP API сервиса"""
+
+    def __init__(self, url=f'http://{SERVICE_HOST}:{SERVICE_PORT}', timeout=30):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def _request(self, path, payload=None):
+        import urllib.error
+        import urllib.request
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        request = urllib.request.Request(self.url + path, data=data,
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read().decode('utf-8'))['error']
+            except (ValueError, KeyError):
+                message = str(e)
+            raise JobError(message) from None
+
+    def submit(self, job):
+        """Отправка задания; возвращает его идентификатор"""
+        with self._request('/jobs', job) as response:
+            return json.loads(response.read().decode('utf-8'))['id']
+
+    def status(self, job_id):
+        with self._request(f'/jobs/{job_id}') as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    def events(self, job_id):
+        with self._request(f'/jobs/{job_id}/events') as response:
+            for line in response:
+                if line.strip():
+                    yield json.loads(line.decode('utf-8'))
+
+    def wait(self, job_id):
+        """Ожидание завершения задания; возвращает последнее состояние"""
+        snapshot = None
+        for snapshot in self.events(job_id):
+            pass
+        return snapshot
+
+    def calculate(self, job):
+        snapshot = self.wait(self.submit(job))
+        if snapshot['status'] != 'done':
+            raise JobError(snapshot['error'])
+        return snapshot['result']
+
+
+class LocalQYClient(QYServiceClient):
+    """Замена клиента для тестов: тот же интерфейс, задания выполняются
+    сразу в текущем процессе без HTTP и пула"""
+
+    def __init__(self):
+        self.jobs = {}
+
+    def submit(self, job):
+        job = normalize_job(job)
+        job_id = uuid.uuid4().hex[:12]
+        record = {'id': job_id, 'status': 'running', 'stage': None, 'progress': 0.0,
+                  'submitted': time.time(), 'result': None, 'error': None, 'version': 0}
+        history = []
+
+        def progress(stage, fraction):
+            record.update(stage=stage, progress=fraction, version=record['version'] + 1)
+            history.append(dict(record))
+
+        try:
+            record.update(status='done', stage=None, progress=1.0, result=run_job(job, progress))
+        except Exception as e:
+            record.update(status='failed', error=f"{type(e).__name__}: {e}")
+        record['version'] += 1
+        history.append(dict(record))
+        self.jobs[job_id] = history
+        return job_id
+
+    def status(self, job_id):
+        if job_id not in self.jobs:
+            raise JobError(f"unknown job: {job_id}")
+        return dict(self.jobs[job_id][-1])
+
+    def events(self, job_id):
+        if job_id not in self.jobs:
+            raise JobError(f"unknown job: {job_id}")
+        return iter([dict(snapshot) for snapshot in self.jobs[job_id]])
+
+
+# === ПАКЕТНАЯ ОБРАБОТКА ЧЕРЕЗ ОБЩИЙ КАТАЛОГ ===
+#
+# Манифест кампании (JSON): {"defaults": {...}, "jobs": [...]}, где задание -
+# объект в формате normalize_job (недостающие поля берутся из defaults) или
+# строка - папка образца. Каталог очереди на общем диске:
+#
+#   campaign.json          defaults и число шардов
+#   shards/<шард>.json     задания шарда (с номерами в манифесте)
+#   locks/<шард>.lock      захват шарда исполнителем (O_CREAT | O_EXCL)
+#   results/<шард>.partial.jsonl  записи уже посчитанных заданий шарда (по строке)
+#   results/<шард>.json    результаты шарда (атомарная запись через os.replace)
+#
+# Исполнители на любых машинах забирают шарды без результатов. Фоновый поток
+# исполнителя обновляет дату его замка каждые stale_after / 4 секунд, в том
+# числе во время долгого задания; замок, не обновлявшийся дольше stale_after
+# секунд (или, в POSIX, принадлежащий завершившемуся процессу этой же
+# машины), считается брошенным и перехватывается. В замок записывается
+# уникальный токен владельца: исполнитель, у которого замок перехватили,
+# замечает это по токену и бросает шард, не трогая чужой замок. Запись
+# каждого задания дописывается в .partial.jsonl сразу после расчета, поэтому
+# новый владелец шарда пропускает уже посчитанные задания.
+
+BATCH_SHARD_SIZE = 100
+BATCH_STALE_AFTER = 600.0  # Секунд без обновления замка до перехвата шарда
+BATCH_HEARTBEATS = 4  # Обновлений замка за время stale_after
+
+
+def _write_json_atomic(path, payload):
+    """Запись JSON через временный файл и os.replace (читатель видит
+    либо прежний файл, либо полностью записанный новый)"""
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(payload, file, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def prepare_batch(manifest_path, queue_dir, shard_size=BATCH_SHARD_SIZE):
+    """Разбиение манифеста кампании на шарды в каталоге очереди.
+
+    Возвращает число шардов. Существующие результаты не затрагиваются,
+    поэтому повторная подготовка той же кампании безопасна.
+    """
+    defaults, jobs = load_campaign(manifest_path)
+    for subdir in ('shards', 'locks', 'results'):
+        os.makedirs(os.path.join(queue_dir, subdir), exist_ok=True)
+    shard_count = (len(jobs) + shard_size - 1) // shard_size
+    for shard in range(shard_count):
+        entries = [{'index': index, 'job': jobs[index]}
+                   for index in range(shard * shard_size, min(len(jobs), (shard + 1) * shard_size))]
+        _write_json_atomic(os.path.join(queue_dir, 'shards', f'shard-{shard:05d}.json'), entries)
+    _write_json_atomic(os.path.join(queue_dir, 'campaign.json'),
+                       {'manifest': os.path.abspath(manifest_path), 'defaults': defaults,
+                        'shards': shard_count, 'jobs': len(jobs)})
+    return shard_count
+
+
+def _host_name():
+    """Имя этой машины для записи в замок (os.uname в Windows нет)"""
+    import socket
+    return socket.gethostname()
+
+
+def _process_exists(pid):
+    """Жив ли процесс этой машины; None - проверить нельзя.
+
+    Проверка только в POSIX: сигнал 0 ничего не делает с процессом, а в
+    Windows os.kill(pid, 0) завершает процесс.
+    """
+    if os.name != 'posix':
+        return None
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (OSError, TypeError, ValueError):
+        return None
+    return True
+
+
+class ShardLock:
+    """Замок шарда, захваченный этим исполнителем.
+
+    Перед обновлением даты и удалением замка проверяется токен владельца,
+    так что перехваченный другим исполнителем замок не трогается.
+    """
+
+    def __init__(self, shard, path, token):
+        self.shard = shard
+        self.path = path
+        self.token = token
+        self.lost = threading.Event()  # Замок перехвачен или исчез
+        self._stop = threading.Event()
+        self._thread = None
+
+    def owned(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                return json.load(file).get('token') == self.token
+        except (OSError, ValueError):
+            return False
+
+    def touch(self):
+        """Обновление даты замка; False - замок больше не принадлежит исполнителю"""
+        if not self.owned():
+            return False
+        try:
+            os.utime(self.path)
+        except OSError:
+            return False
+        return True
+
+    def release(self):
+        if self.owned():
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def start_heartbeat(self, interval):
+        """Фоновое обновление даты замка каждые interval секунд"""
+        def beat():
+            while not self._stop.wait(interval):
+                if not self.touch():
+                    self.lost.set()
+                    return
+        self._thread = threading.Thread(target=beat, name=f'heartbeat-{self.shard}', daemon=True)
+        self._thread.start()
+
+    def stop_heartbeat(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def _lock_is_stale(lock_path, stale_after):
+    try:
+        age = time.time() - os.stat(lock_path).st_mtime
+        with open(lock_path, 'r', encoding='utf-8') as file:
+            owner = json.load(file)
+    except (OSError, ValueError):
+        # Замок исчез или еще дописывается - не трогаем
+        return False
+    if age > stale_after:
+        return True
+    # Вне POSIX остается только проверка по дате замка
+    return owner.get('host') == _host_name() and _process_exists(owner.get('pid')) is False
+
+
+def claim_shard(queue_dir, stale_after=BATCH_STALE_AFTER):
+    """Захват первого свободного шарда без результатов: ShardLock или None,
+    если все шарды разобраны"""
+    for file in sorted(os.listdir(os.path.join(queue_dir, 'shards'))):
+        shard = os.path.splitext(file)[0]
+        if os.path.exists(os.path.join(queue_dir, 'results', shard + '.json')):
+            continue
+        lock_path = os.path.join(queue_dir, 'locks', shard + '.lock')
+        if os.path.exists(lock_path):
+            if not _lock_is_stale(lock_path, stale_after):
+                continue
+            # Переименование удается только одному из исполнителей
+            stale_path = f"{lock_path}.{uuid.uuid4().hex}.stale"
+            try:
+                os.rename(lock_path, stale_path)
+            except OSError:
+                continue
+            os.remove(stale_path)
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            continue
+        lock = ShardLock(shard, lock_path, uuid.uuid4().hex)
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            json.dump({'host': _host_name(), 'pid': os.getpid(), 'token': lock.token,
+                       'claimed': time.time()}, file)
+        # Шард мог быть завершен другим исполнителем между проверкой и захватом
+        if os.path.exists(os.path.join(queue_dir, 'results', shard + '.json')):
+            lock.release()
+            continue
+        return lock
+    return None
+
+
+def _read_partial_results(path):
+    """Записи заданий из .partial.jsonl: {номер задания: запись}.
+
+    Строка, оборванная сбоем исполнителя, отбрасывается; тогда файл
+    переписывается без нее, чтобы следующие записи начинались с новой строки.
+    """
+    records = {}
+    damaged = False
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                    records[record['index']] = record
+                except (ValueError, KeyError, TypeError):
+                    damaged = True
+                    continue
+                damaged = damaged or not line.endswith('\n')
+    except FileNotFoundError:
+        return records
+    if damaged:
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.writelines(json.dumps(record, ensure_ascii=False) + '\n' for record in records.values())
+        os.replace(tmp_path, path)
+    return records
+
+
+def _append_partial_result(path, record):
+    """Дописывание записи задания одной строкой с fsync: после сбоя строка
+    либо есть целиком, либо оборвана и отбрасывается при чтении"""
+    with open(path, 'a', encoding='utf-8') as file:
+        file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def run_shard(queue_dir, lock, defaults, stale_after=BATCH_STALE_AFTER):
+    """Расчет заданий шарда; ошибки отдельных заданий записываются в результат.
+
+    Задания, записи которых уже есть в .partial.jsonl (шард перехвачен у
+    завершившегося исполнителя), не пересчитываются. Возвращает записи
+    результатов или None, если замок шарда перехвачен (тогда шард
+    бросается: его досчитает новый владелец).
+    """
+    shard = lock.shard
+    with open(os.path.join(queue_dir, 'shards', shard + '.json'), 'r', encoding='utf-8') as file:
+        entries = json.load(file)
+    partial_path = os.path.join(queue_dir, 'results', shard + '.partial.jsonl')
+    done = _read_partial_results(partial_path)
+    lock.start_heartbeat(stale_after / BATCH_HEARTBEATS)
+    try:
+        for entry in entries:
+            if entry['index'] in done:
+                continue
+            if lock.lost.is_set():
+                return None
+            record = {'index': entry['index'], 'samples': entry['job'].get('samples')}
+            try:
+                record['result'] = run_job(normalize_job({**defaults, **entry['job']}))
+                record['status'] = 'done'
+            except Exception as e:
+                record.update(status='failed', error=f"{type(e).__name__}: {e}")
+            if not lock.owned():
+                return None
+            _append_partial_result(partial_path, record)
+            done[entry['index']] = record
+        if not lock.owned():
+            return None
+        results = [done[entry['index']] for entry in entries]
+        _write_json_atomic(os.path.join(queue_dir, 'results', shard + '.json'), results)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(partial_path)
+    finally:
+        lock.stop_heartbeat()
+    lock.release()
+    return results
+
+
+def batch_worker(queue_dir, stale_after=BATCH_STALE_AFTER):
+    """Обработка шардов очереди, пока есть свободные; возвращает число шардов"""
+    with open(os.path.join(queue_dir, 'campaign.json'), 'r', encoding='utf-8') as file:
+        defaults = json.load(file)['defaults']
+    processed = 0
+    while True:
+        lock = claim_shard(queue_dir, stale_after)
+        if lock is None:
+            return processed
+        if run_shard(queue_dir, lock, defaults, stale_after) is not None:
+            processed += 1
+
+
+def run_batch_workers(queue_dir, workers=None, stale_after=BATCH_STALE_AFTER):
+    """Запуск нескольких исполнителей на этой машине"""
+    from concurrent.futures import ProcessPoolExecutor
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(batch_worker, queue_dir, stale_after) for _ in range(workers)]
+        return sum(future.result() for future in futures)
+
+
+def batch_status(queue_dir):
+    """Число шардов: всего, завершено, захвачено"""
+    shards = os.listdir(os.path.join(queue_dir, 'shards'))
+    done = [f for f in os.listdir(os.path.join(queue_dir, 'results')) if f.endswith('.json')]
+    locked = [f for f in os.listdir(os.path.join(queue_dir, 'locks')) if f.endswith('.lock')]
+    return {'shards': len(shards), 'done': len(done), 'locked': len(locked)}
+
+
+def merge_batch(queue_dir, output):
+    """Сведение результатов шардов в таблицы (формат - по расширению output).
+
+    Таблицы: quantum_yield (образец x стандарт в каждом задании), datasets
+    (регрессии наборов) и errors (задания, завершившиеся ошибкой).
+    """
+    qy_rows, dataset_rows, error_rows = [], [], []
+    results_dir = os.path.join(queue_dir, 'results')
+    for file in sorted(os.listdir(results_dir)):
+        if not file.endswith('.json'):
+            continue
+        with open(os.path.join(results_dir, file), 'r', encoding='utf-8') as handle:
+            records = json.load(handle)
+        for record in records:
+            if record['status'] != 'done':
+                error_rows.append((record['index'], ';'.join(record['samples'] or []), record['error']))
+                continue
+            result = record['result']
+            folders = {d['name']: d['folder'] for d in result['datasets']}
+            for d in result['datasets']:
+                dataset_rows.append((record['index'], d['name'], d['role'], d['folder'],
+                                     d['slope'], d['intercept'], d['points']))
+            qy = result['quantum_yield']
+            if qy is None:
+                continue
+            for i, sample in enumerate(qy['samples']):
+                for j, standard in enumerate(qy['standards']):
+                    qy_rows.append((record['index'], sample, folders[sample], standard, qy['qy'][i][j],
+                                    qy['mean'][i], qy['spread'][i], qy['consistent'][i]))
+
+    def columns(rows, spec):
+        return {name: np.array([row[k] for row in rows], dtype=dtype)
+                for k, (name, dtype) in enumerate(spec)}
+
+    tables = {
+        'quantum_yield': columns(qy_rows, [('job', np.int64), ('sample', object), ('sample_folder', object),
+                                           ('standard', object), ('qy_percent', np.float64),
+                                           ('qy_mean', np.float64), ('qy_spread', np.float64),
+                                           ('consistent', bool)]),
+        'datasets': columns(dataset_rows, [('job', np.int64), ('dataset', object), ('role', object),
+                                           ('folder', object), ('slope', np.float64),
+                                           ('intercept', np.float64), ('points', np.int64)]),
+        'errors': columns(error_rows, [('job', np.int64), ('samples', object), ('error', object)]),
+    }
+    return export_results(output, tables)
+
+
+# === ГРАФИКИ И ТЕКСТ РЕЗУЛЬТАТОВ ===
+#
+# Функции рисуют на переданной фигуре matplotlib и не зависят от окна:
+# их используют вкладки интерфейса (холст Qt) и генератор отчетов (Agg).
+
+METHOD_LABELS = {'simpson': ("Метод Симпсона", "Simpson's Method"),
+                 'trapezoid': ("Метод трапеций", "Trapezoidal Method")}
+
+
+def trim_spectrum(x, y, window=None):
+    """Обрезка спектра по диапазону window = (min, max); None - без обрезки"""
+    if window is None:
+        return x, y
+    x = np.asarray(x)
+    y = np.asarray(y)
+    mask = (x >= window[0]) & (x <= window[1])
+    return x[mask], y[mask]
+
+
+def draw_spectra(figure, dataset, window=None, smoothing=None, language='ru', domain='wavelength'):
+    """Спектры эмиссии (с обрезкой и сглаживанием) и абсорбции набора на
+    шкале domain; window - в нм.
+
+    Возвращает оси спектров эмиссии или None, если спектров нет.
+    """
+    ru = language == 'ru'
+    emission = dataset.domain_emission(None, domain)
+    absorption = dataset.absorption
+    window = domain_window(dataset.effective_trim(window), domain)
+    smoothed = dataset.domain_emission(smoothing, domain) if smoothing is not None else None
+    if not (len(emission) and len(absorption)):
+        return None
+
+    ax1 = figure.add_subplot(121)
+    for i, (x, y) in enumerate(emission):
+        # Применяем обрезку если включена
+        x_trimmed, y_trimmed = trim_spectrum(x, y, window)
+        if smoothed is None:
+            ax1.plot(x_trimmed, y_trimmed, label=f'Эмиссия {i+1}' if ru else f'Emission {i+1}')
+            continue
+        # Исходный спектр бледно, сглаженный - поверх тем же цветом
+        raw, = ax1.plot(x_trimmed, y_trimmed, alpha=0.35, linewidth=0.8)
+        x_smooth, y_smooth = trim_spectrum(*smoothed[i], window)
+        ax1.plot(x_smooth, y_smooth, color=raw.get_color(), label=f'Эмиссия {i+1}' if ru else f'Emission {i+1}')
+    band = dataset.selected_band()
+    if band is not None:
+        # Интегрируемая полоса разложения - пунктиром поверх спектров
+        for i, (x, y) in enumerate(band):
+            ax1.plot(x, y, 'k--', linewidth=0.8,
+                     label=None if i else ('Полоса разложения' if ru else "Fitted band"))
+    ax1.set_xlabel(DOMAIN_LABELS[domain][0 if ru else 1])
+    ax1.set_ylabel('Абсолютная интенсивность' if ru else "Absolute intensity")
+    ax1.set_title(f'Спектры эмиссии ({dataset.name})' if ru else f'Emission spectra ({dataset.name})')
+    ax1.legend()
+    ax1.grid(True, alpha=0.3)
+
+    ax2 = figure.add_subplot(122)
+    for i, (x, y) in enumerate(absorption):
+        # Оптическая плотность - не спектральная плотность: пересчитывается только ось
+        x = DOMAIN_CONSTANTS[domain] / x if domain != 'wavelength' else x
+        ax2.plot(x, y, label=f'Абсорбция {i+1}' if ru else f"Absorption {i+1}")
+    ax2.set_xlabel(DOMAIN_LABELS[domain][0 if ru else 1])
+    ax2.set_ylabel('Оптическая плотность' if ru else "Optical density")
+    ax2.set_title(f'Спектры абсорбции ({dataset.name})' if ru else f"Absorption spectra ({dataset.name})")
+    ax2.legend()
+    ax2.grid(True, alpha=0.3)
+    return ax1
+
+
+def draw_integrals(figure, workspace, language='ru'):
+    """Интегралы эмиссии обоими методами против поглощения: образцы и стандарты"""
+    ru = language == 'ru'
+    simpson, trapezoid = (label[0 if ru else 1] for label in METHOD_LABELS.values())
+    for position, role in ((121, 'sample'), (122, 'standard')):
+        datasets = [d for d in workspace.by_role(role) if d.results]
+        if not datasets:
+            continue
+        ax = figure.add_subplot(position)
+        for dataset in datasets:
+            ex_pic = dataset.results['ex_pic']
+            integrals_s = dataset.results['integrals_simpson']
+            integrals_t = dataset.results['integrals_trapezoid']
+            # При нескольких наборах подписываем кривые именем набора
+            prefix = f'{dataset.name}: ' if len(datasets) > 1 else ''
+            if len(datasets) > 1:
+                line, = ax.plot(ex_pic, integrals_s, 'o-', label=prefix + simpson)
+                ax.plot(ex_pic, integrals_t, 's--', color=line.get_color(), label=prefix + trapezoid)
+            else:
+                ax.plot(ex_pic, integrals_s, 'ro-', label=simpson)
+                ax.plot(ex_pic, integrals_t, 'bo-', label=trapezoid)
+        ax.set_xlabel('Интенсивность поглощения' if ru else "Absorbtion intensity")
+        ax.set_ylabel('Интегральная интенсивность эмиссии' if ru else "Integral emission intensity")
+        if role == 'sample':
+            ax.set_title('Образец' if ru else "Sample")
+        else:
+            ax.set_title('Стандарт' if ru else "Standard")
+        ax.legend()
+        ax.grid(True, alpha=0.3)
+
+
+def draw_calibration(figure, workspace, method, language='ru', picker=None):
+    """Калибровочные прямые с влиятельными и исключенными точками.
+
+    picker - допуск выбора точек щелчком (пикселей) или None. Возвращает
+    {линия точек: (имя набора, имена спектров точек)}.
+    """
+    ru = language == 'ru'
+    pick = {'picker': picker} if picker is not None else {}
+    artists = {}
+    for position, role in ((121, 'sample'), (122, 'standard')):
+        datasets = [d for d in workspace.by_role(role) if d.results]
+        if not datasets:
+            continue
+        ax = figure.add_subplot(position)
+        for dataset in datasets:
+            names, x_all, y_all, excluded = dataset.calibration_table(method)
+            if len(x_all) == 0:
+                continue
+            used_names, diagnostics = dataset.diagnostics(method)
+            x, y = x_all[~excluded], y_all[~excluded]
+            prefix = f'{dataset.name}: ' if len(datasets) > 1 else ''
+
+            points, = ax.plot(x, y, 'o', **pick,
+                              label=prefix + ('Экспериментальные точки' if ru else "Experimental points"))
+            artists[points] = (dataset.name, used_names)
+            if excluded.any():
+                skipped, = ax.plot(x_all[excluded], y_all[excluded], 'x', color='gray', **pick,
+                                   label=prefix + ('Исключенные точки' if ru else "Excluded points"))
+                artists[skipped] = (dataset.name, [n for n, e in zip(names, excluded) if e])
+
+            # Влиятельные точки (расстояние Кука, стьюдентизированный остаток)
+            flagged = diagnostics['flagged']
+            if flagged.any():
+                ax.plot(x[flagged], y[flagged], 'o', markersize=12, markerfacecolor='none',
+                        markeredgecolor='red', markeredgewidth=1.5,
+                        label=prefix + ('Влиятельные точки' if ru else "Influential points"))
+                for xi, yi, name in zip(x[flagged], y[flagged], np.array(used_names, dtype=object)[flagged]):
+                    ax.annotate(name, (xi, yi), textcoords='offset points', xytext=(6, 6),
+                                fontsize=8, color='red')
+
+            # Линия регрессии
+            if len(x) == 0:
+                continue
+            a, b = dataset.regression(method)
+            x_line = np.array([0, x.max()])
+            y_line = a * x_line + b
+            ax.plot(x_line, y_line, '-', color=points.get_color(), label=prefix + f'y = {a:.4f}x + {b:.4f}')
+
+        ax.set_xlabel('Интенсивность поглощения' if ru else "Absorbtion intensity")
+        ax.set_ylabel('Интегральная интенсивность эмиссии' if ru else "Integral emission intensity")
+        if role == 'sample':
+            ax.set_title('Калибровка: Образец' if ru else "Calibration: Sample")
+        else:
+            ax.set_title('Калибровка: Стандарт' if ru else "Calibration: Standard")
+        ax.legend()
+        ax.grid(True, alpha=0.3)
+    return artists
+
+
+def draw_kinetics(figure, kinetics, kinetics_qy=None, interval=None, language='ru'):
+    """Интегральная интенсивность (и QY, если задан kinetics_qy) спектров серий во времени.
+
+    kinetics - Workspace.kinetics, kinetics_qy - Workspace.kinetics_quantum_yield
+    (QY усредняется по стандартам), interval - время между спектрами серии, с
+    (None - по оси номер спектра).
+    """
+    ru = language == 'ru'
+    qy = kinetics_qy['qy'] if kinetics_qy is not None and kinetics_qy['standards'] else {}
+    ax1 = figure.add_subplot(121 if qy else 111)
+    ax2 = figure.add_subplot(122) if qy else None
+    for name, series in kinetics.items():
+        prefix = f'{name}: ' if len(kinetics) > 1 else ''
+        for spectrum, entry in series.items():
+            steps = np.arange(len(entry['integrals']))
+            time_axis = steps * interval if interval else steps
+            line, = ax1.plot(time_axis, entry['integrals'], '.-', label=prefix + spectrum)
+            if (name, spectrum) in qy:
+                ax2.plot(time_axis, qy[name, spectrum].mean(axis=1), '.-', color=line.get_color(),
+                         label=prefix + spectrum)
+    for ax in (ax1, ax2):
+        if ax is None:
+            continue
+        ax.set_xlabel(('Время, с' if ru else "Time, s") if interval else
+                      ('Номер спектра серии' if ru else "Spectrum number"))
+        ax.legend()
+        ax.grid(True, alpha=0.3)
+    ax1.set_ylabel('Интегральная интенсивность эмиссии' if ru else "Integral emission intensity")
+    ax1.set_title('Кинетика интенсивности' if ru else "Intensity kinetics")
+    if ax2 is not None:
+        ax2.set_ylabel('Квантовый выход, %' if ru else "Quantum yield, %")
+        ax2.set_title('Кинетика квантового выхода' if ru else "Quantum yield kinetics")
+
+
+def format_results(workspace, hv, method, qy_result, trim=None, language='ru', interactive=False):
+    """Текст результатов расчета.
+
+    trim - общий диапазон интегрирования или None; interactive - добавить
+    подсказку об исключении точек щелчком (вкладка калибровки).
+    """
+    ru = language == 'ru'
+    method_label = METHOD_LABELS[method][0 if ru else 1]
+    results_text = "=== РЕЗУЛЬТАТЫ РАСЧЕТА ===\n\n" if ru else "=== CALCULATION RESULTS ===\n\n"
+    results_text += f"Длина волны возбуждения: {hv} нм\n" if ru else f"Excitation wavelength: {hv} nm\n"
+    results_text += (f"Метод интегрирования: {method_label}\n" if ru
+                     else f"Integration method: {method_label}\n")
+    domain = next((d.results['domain'] for d in workspace if 'domain' in d.results), 'wavelength')
+    if domain != 'wavelength':
+        domain_label = DOMAIN_LABELS[domain][0 if ru else 1]
+        results_text += (f"Шкала интегрирования: {domain_label}\n" if ru
+                         else f"Integration axis: {domain_label}\n")
+    if workspace.correction is not None:
+        source = os.path.basename(workspace.correction.source or '')
+        results_text += (f"Коррекция чувствительности: {source}\n" if ru
+                         else f"Response correction: {source}\n")
+
+    if trim is not None:
+        results_text += (f"Обрезка данных: {trim[0]:g} - {trim[1]:g} нм\n" if ru
+                         else f"Data trimming: {trim[0]:g} - {trim[1]:g} nm\n")
+        # Автоопределенные диапазоны отдельных наборов
+        for dataset in workspace:
+            if dataset.trim is not None:
+                low, high = dataset.trim
+                results_text += (f"  {dataset.name}: {low:.1f} - {high:.1f} нм\n" if ru
+                                 else f"  {dataset.name}: {low:.1f} - {high:.1f} nm\n")
+
+    for role in ('sample', 'standard'):
+        for dataset in workspace.by_role(role):
+            a, b = dataset.regression(method)
+            if role == 'sample':
+                results_text += f"\nОБРАЗЕЦ {dataset.name}:\n" if ru else f"\nSAMPLE {dataset.name}:\n"
+            else:
+                results_text += f"\nСТАНДАРТ {dataset.name}:\n" if ru else f"\nSTANDARD {dataset.name}:\n"
+            results_text += (f"Уравнение регрессии: y = {a:.6f}x + {b:.6f}\n" if ru
+                             else f"Regression equation: y = {a:.6f}x + {b:.6f}\n")
+            results_text += f"Коэффициент наклона: {a:.6f}\n" if ru else f"Slope coefficient: {a:.6f}\n"
+
+            # Влияние сглаживания на интегралы (всего спектра, если он разложен на полосы)
+            raw_key = 'integrals_' + method + '_raw'
+            if raw_key in dataset.results:
+                smoothed = dataset.results.get('integrals_' + method + '_total',
+                                               dataset.results['integrals_' + method])
+                raw = dataset.results[raw_key]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    change = 100 * (smoothed - raw) / np.abs(raw)
+                change = change[np.isfinite(change)]
+                if len(change):
+                    results_text += (f"Сглаживание: изменение интегралов {change.mean():+.2f} % "
+                                     f"(от {change.min():+.2f} до {change.max():+.2f} %)\n" if ru
+                                     else f"Smoothing: integral change {change.mean():+.2f} % "
+                                     f"({change.min():+.2f} to {change.max():+.2f} %)\n")
+            results_text += format_deconvolution(dataset, method, language)
+    results_text += "\n"
+
+    if qy_result is not None:
+        results_text += "КВАНТОВЫЙ ВЫХОД:\n" if ru else "QUANTUM YIELD:\n"
+        for i, sample in enumerate(qy_result['samples']):
+            for j, standard in enumerate(qy_result['standards']):
+                results_text += (f"QY({sample} / {standard}) = {qy_result['qy'][i, j]:.2f} %\n" if len(qy_result['standards']) > 1
+                                 or len(qy_result['samples']) > 1 else f"QY = {qy_result['qy'][i, j]:.2f} %\n")
+            if len(qy_result['standards']) > 1:
+                flag = "" if qy_result['consistent'][i] else (" (!) расхождение между стандартами" if ru
+                                                              else " (!) standards disagree")
+                results_text += (f"{sample}: среднее {qy_result['mean'][i]:.2f} %, разброс {100 * qy_result['spread'][i]:.1f} %{flag}\n" if ru
+                                 else f"{sample}: mean {qy_result['mean'][i]:.2f} %, spread {100 * qy_result['spread'][i]:.1f} %{flag}\n")
+
+        # Перекрестная проверка стандартов друг по другу
+        standards = qy_result['standards']
+        if len(standards) > 1:
+            results_text += "\nПРОВЕРКА СТАНДАРТОВ:\n" if ru else "\nSTANDARDS CROSS-CHECK:\n"
+            for j, standard in enumerate(standards):
+                for k, reference in enumerate(standards):
+                    if j == k:
+                        continue
+                    deviation = 100 * qy_result['standards_deviation'][j, k]
+                    flag = "" if qy_result['standards_consistent'][j, k] else " (!)"
+                    results_text += (f"{standard} по {reference}: отклонение {deviation:+.1f} %{flag}\n" if ru
+                                     else f"{standard} vs {reference}: deviation {deviation:+.1f} %{flag}\n")
+        results_text += "\n"
+
+    results_text += format_diagnostics(workspace, method, qy_result, language, interactive)
+
+    if ru:
+        results_text += "Разработчики: Шулепов Ростислав Русланович\n"
+        results_text += "Кафедра общей и неорганической химии СПбГУ"
+    else:
+        results_text += "Developers: Shulepov Rostislav Ruslanovich\n"
+        results_text += "Department of General and Inorganic Chemistry SPbSU"
+    return results_text
+
+
+def format_deconvolution(dataset, method, language='ru'):
+    """Строка о разложении спектров набора на полосы (пустая без разложения)"""
+    ru = language == 'ru'
+    if 'deconvolution' not in dataset.results:
+        return ""
+    shape, n_components, component = dataset.results['deconvolution']
+    shape_label = BAND_SHAPE_LABELS[shape][0 if ru else 1]
+    unit = DOMAIN_UNITS[dataset.results.get('domain', 'wavelength')][0 if ru else 1]
+    band = dataset.results['integrals_' + method]
+    total = dataset.results['integrals_' + method + '_total']
+    center = dataset.results['band_center']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share = 100 * band / total
+    valid = np.isfinite(share) & np.isfinite(center)
+    if not valid.any():
+        return ("Разложение на полосы: подгонка не удалась\n" if ru
+                else "Band deconvolution: fit failed\n")
+    return (f"Разложение на полосы ({shape_label}, {n_components}): полоса {component + 1}, "
+            f"центр {np.mean(center[valid]):.4g} {unit}, доля интеграла {np.mean(share[valid]):.1f} %\n" if ru
+            else f"Band deconvolution ({shape_label}, {n_components}): band {component + 1}, "
+            f"center {np.mean(center[valid]):.4g} {unit}, share of integral {np.mean(share[valid]):.1f} %\n")
+
+
+def format_diagnostics(workspace, method, qy_result, language='ru', interactive=False):
+    """Текст о влиятельных и исключенных точках калибровки"""
+    ru = language == 'ru'
+    lines = []
+    for name, entry in workspace.leave_one_out(method, qy_result).items():
+        for i in np.flatnonzero(entry['flagged']):
+            line = (f"{name}: {entry['names'][i]} - расстояние Кука {entry['cooks'][i]:.2f}" if ru
+                    else f"{name}: {entry['names'][i]} - Cook's distance {entry['cooks'][i]:.2f}")
+            if np.isfinite(entry['studentized'][i]):
+                line += (f", стьюдентизированный остаток {entry['studentized'][i]:+.2f}" if ru
+                         else f", studentized residual {entry['studentized'][i]:+.2f}")
+            if 'qy' in entry:
+                values = entry['qy'][i]
+                if len(values) == 1:
+                    qy_text = f"{values[0]:.2f} %"
+                else:
+                    qy_text = ", ".join(f"{partner}: {value:.2f} %"
+                                        for partner, value in zip(entry['partners'], values))
+                line += f"; QY без точки {qy_text}" if ru else f"; QY without it {qy_text}"
+            lines.append(line + "\n")
+        dataset = workspace[name]
+        if dataset.excluded:
+            skipped = ", ".join(sorted(dataset.excluded))
+            lines.append(f"{name}: исключены {skipped}\n" if ru else f"{name}: excluded {skipped}\n")
+    if not lines:
+        return ""
+    text = ("ДИАГНОСТИКА КАЛИБРОВКИ:\n" if ru else "CALIBRATION DIAGNOSTICS:\n") + "".join(lines)
+    if interactive:
+        text += ("Щелчок по точке на вкладке калибровки исключает ее из расчета или возвращает\n" if ru
+                 else "Click a point on the calibration tab to exclude it or bring it back\n")
+    return text + "\n"
+
+
+# === ОТЧЕТЫ (БЕЗ ИНТЕРФЕЙСА) ===
+#
+# python spectroscopy_app.py --report campaign.json --report-dir reports [--workers N]
+#
+# Манифест - тот же, что в пакетном режиме. Каждое задание (образец)
+# рассчитывается и рисуется в отдельном процессе пула на холсте Agg без
+# окна: многостраничный PDF (сводка, спектры наборов, интегралы,
+# калибровка) и PNG калибровки для оглавления. index.html кампании
+# содержит таблицу QY со ссылками на отчеты.
+
+REPORT_PAGE_SIZE = (11.69, 8.27)  # A4, альбомная ориентация, дюймы
+REPORT_TEXT_LINES = 48  # Строк сводки на странице
+REPORT_THUMBNAIL_DPI = 60
+
+
+def report_figure():
+    """Фигура с холстом Agg (без pyplot и без окна - безопасно в процессах пула)"""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    figure = Figure(figsize=REPORT_PAGE_SIZE)
+    FigureCanvasAgg(figure)
+    return figure
+
+
+def write_report(path, workspace, hv, method, qy_result, trim=None, smoothing=None,
+                 language='ru', thumbnail=None, domain='wavelength'):
+    """Многостраничный PDF-отчет рабочего пространства.
+
+    Страницы: сводка результатов, спектры каждого набора, интегралы,
+    калибровка и кинетика серий спектров (если есть). thumbnail - путь PNG с графиком калибровки или None.
+    """
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    text = format_results(workspace, hv, method, qy_result, trim, language).splitlines()
+    pages = []
+    for start in range(0, len(text), REPORT_TEXT_LINES):
+        figure = report_figure()
+        figure.text(0.05, 0.95, "\n".join(text[start:start + REPORT_TEXT_LINES]),
+                    va='top', family='monospace', fontsize=9)
+        pages.append(figure)
+    for dataset in workspace:
+        figure = report_figure()
+        if draw_spectra(figure, dataset, trim, smoothing, language, domain) is not None:
+            figure.tight_layout()
+            pages.append(figure)
+    figure = report_figure()
+    draw_integrals(figure, workspace, language)
+    figure.tight_layout()
+    pages.append(figure)
+    calibration = report_figure()
+    draw_calibration(calibration, workspace, method, language)
+    calibration.tight_layout()
+    pages.append(calibration)
+    kinetics = workspace.kinetics(float(hv), method, trim, smoothing, domain)
+    if kinetics:
+        figure = report_figure()
+        draw_kinetics(figure, kinetics, language=language)
+        figure.tight_layout()
+        pages.append(figure)
+
+    tmp_path = path + '.tmp'
+    with PROFILER.stage('report.pdf', len(pages)):
+        with PdfPages(tmp_path) as pdf:
+            for figure in pages:
+                pdf.savefig(figure)
+    os.replace(tmp_path, path)
+    if thumbnail is not None:
+        calibration.savefig(thumbnail, dpi=REPORT_THUMBNAIL_DPI)
+    return path
+
+
+def load_campaign(manifest_path):
+    """Манифест кампании: (defaults, список заданий); строка - папка образца"""
+    with open(manifest_path, 'r', encoding='utf-8') as file:
+        manifest = json.load(file)
+    if isinstance(manifest, list):
+        manifest = {'jobs': manifest}
+    jobs = [{'samples': [job]} if isinstance(job, str) else job for job in manifest['jobs']]
+    return manifest.get('defaults', {}), jobs
+
+
+def report_job(index, job, output_dir, language='ru'):
+    """Расчет задания и его отчет (выполняется в процессе пула).
+
+    Возвращает запись для оглавления; ошибка задания не прерывает кампанию.
+    """
+    name = "-".join(source_name(folder) for folder in job.get('samples') or []) or 'job'
+    base = f"{index:05d}-" + re.sub(r'[^\w.-]+', '_', name)
+    record = {'index': index, 'name': name, 'pdf': base + '.pdf', 'png': base + '.png'}
+    try:
+        job = normalize_job(job)
+        workspace, qy_result = solve_job(job)
+        write_report(os.path.join(output_dir, record['pdf']), workspace, job['hv'], job['method'],
+                     qy_result, job['trim'], job['smoothing'], language,
+                     thumbnail=os.path.join(output_dir, record['png']), domain=job['domain'])
+        record['status'] = 'done'
+        record['quantum_yield'] = _json_ready(qy_result)
+    except Exception as e:
+        record.update(status='failed', error=f"{type(e).__name__}: {e}")
+    return record
+
+
+def write_report_index(path, records, title, language='ru'):
+    """Оглавление кампании (HTML): QY каждого задания, миниатюра и ссылка на PDF"""
+    ru = language == 'ru'
+    rows = []
+    for record in records:
+        label = html.escape(record['name'])
+        if record['status'] != 'done':
+            rows.append(f"<tr><td>{record['index']}</td><td>{label}</td>"
+                        f"<td colspan=\"2\" class=\"error\">{html.escape(record['error'])}</td></tr>")
+            continue
+        qy = record['quantum_yield']
+        if qy is None:
+            values = "—"
+        else:
+            values = "<br>".join(
+                f"{html.escape(sample)}: {qy['mean'][i]:.2f} %" + ("" if qy['consistent'][i] else " (!)")
+                for i, sample in enumerate(qy['samples']))
+        rows.append(f"<tr><td>{record['index']}</td><td><a href=\"{html.escape(record['pdf'])}\">{label}</a></td>"
+                    f"<td>{values}</td><td><a href=\"{html.escape(record['pdf'])}\">"
+                    f"<img src=\"{html.escape(record['png'])}\" alt=\"\"></a></td></tr>")
+    header = ("<tr><th>№</th><th>Образец</th><th>QY</th><th>Калибровка</th></tr>" if ru
+              else "<tr><th>#</th><th>Sample</th><th>QY</th><th>Calibration</th></tr>")
+    failed = sum(record['status'] != 'done' for record in records)
+    summary = (f"Отчетов: {len(records) - failed}, ошибок: {failed}" if ru
+               else f"Reports: {len(records) - failed}, failed: {failed}")
+    page = (f"<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>{html.escape(title)}</title>\n"
+            "<style>body{font-family:sans-serif} table{border-collapse:collapse} "
+            "td,th{border:1px solid #ccc;padding:4px 8px;vertical-align:middle} "
+            "img{height:120px} .error{color:#b00}</style></head><body>\n"
+            f"<h1>{html.escape(title)}</h1>\n<p>{summary}</p>\n<table>\n{header}\n"
+            + "\n".join(rows) + "\n</table>\n</body></html>\n")
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(page)
+    return path
+
+
+def generate_reports(manifest_path, output_dir, workers=None, language='ru'):
+    """Отчеты всех заданий кампании в пуле процессов и оглавление index.html.
+
+    Возвращает записи оглавления в порядке заданий.
+    """
+    defaults, jobs = load_campaign(manifest_path)
+    os.makedirs(output_dir, exist_ok=True)
+    from concurrent.futures import ProcessPoolExecutor
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(report_job, index, {**defaults, **job}, output_dir, language)
+                   for index, job in enumerate(jobs)]
+        records = [future.result() for future in futures]
+    title = os.path.splitext(os.path.basename(manifest_path))[0]
+    write_report_index(os.path.join(output_dir, 'index.html'), records, title, language)
+    return records
+
 
 class InstructionDialog(QDialog):
     def __init__(self, language='ru', parent=None):
@@ -44,12 +4566,15 @@ class InstructionDialog(QDialog):
             </ul>
             
             <p><b>Важно:</b> Имена файлов эмиссии и абсорбции должны совпадать (например: sample1.tit и sample1.txt)</p>
+            <p>Можно загрузить несколько папок образцов и стандартов: квантовый выход рассчитывается
+            для каждой пары образец/стандарт, а результаты разных стандартов сравниваются между собой.</p>
             
             <h3>2. Настройка параметров</h3>
             <ul>
             <li><b>Длина волны возбуждения:</b> Укажите длину волны, используемую для возбуждения образца</li>
             <li><b>Метод интегрирования:</b> Выберите между методом Симпсона и методом трапеций </li>
-            <li><b>Обрезка данных:</b> При необходимости укажите диапазон длин волн для интегрирования</li>
+            <li><b>Обрезка данных:</b> При необходимости укажите диапазон длин волн для интегрирования
+            или выделите его мышью на графике эмиссии - интегралы, калибровка и QY пересчитываются сразу</li>
             </ul>
             
             <h3>3. Расчет и результаты</h3>
@@ -85,12 +4610,15 @@ class InstructionDialog(QDialog):
             </ul>
             
             <p><b>Important:</b> Emission and absorption filenames must match (e.g.: sample1.tit and sample1.txt)</p>
+            <p>Several sample and standard folders can be loaded: quantum yield is calculated
+            for every sample/standard pair, and the results of different standards are cross-checked.</p>
             
             <h3>2. Parameter Setup</h3>
             <ul>
             <li><b>Excitation wavelength:</b> Specify the wavelength used for sample excitation</li>
             <li><b>Integration method:</b> Choose between Simpson's method and trapezoidal method </li>
-            <li><b>Data trimming:</b> If needed, specify wavelength range for integration</li>
+            <li><b>Data trimming:</b> If needed, specify wavelength range for integration
+            or drag it on the emission plot - integrals, calibration and QY update immediately</li>
             </ul>
             
             <h3>3. Calculation and Results</h3>
@@ -131,18 +4659,110 @@ class InstructionDialog(QDialog):
         
         self.setLayout(layout)
 
+class ScanDialog(QDialog):
+    """Выбор файлов папки по предварительному индексу (scan_folder)"""
+
+    def __init__(self, folder, index, language='ru', parent=None):
+        super().__init__(parent)
+        self.index = index
+        self.language = language
+        ru = language == 'ru'
+        self.setWindowTitle(("Содержимое: " if ru else "Contents: ") + source_name(folder))
+        self.setGeometry(200, 200, 760, 520)
+        layout = QVBoxLayout()
+
+        emission = {e['name'] for e in index if e['kind'] == 'emission'}
+        absorption = {e['name'] for e in index if e['kind'] == 'absorption'}
+        total = sum(e['size'] for e in index) / 2 ** 20
+        summary = (f"Файлов: {len(index)}, пар эмиссия/абсорбция: {len(emission & absorption)}, {total:.1f} МБ"
+                   if ru else
+                   f"Files: {len(index)}, emission/absorption pairs: {len(emission & absorption)}, {total:.1f} MB")
+        layout.addWidget(QLabel(summary))
+
+        self.files_list = QListWidget()
+        for entry in index:
+            item = QListWidgetItem(self.describe(entry))
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            usable = entry['kind'] is not None and entry['error'] is None
+            item.setCheckState(Qt.Checked if usable else Qt.Unchecked)
+            item.setData(Qt.UserRole, entry['file'])
+            self.files_list.addItem(item)
+        layout.addWidget(self.files_list)
+
+        buttons = QHBoxLayout()
+        for text, handler in ((("Выбрать все" if ru else "Select all"), lambda: self.check(lambda e: True)),
+                              (("Снять все" if ru else "Clear all"), lambda: self.check(lambda e: False)),
+                              (("Только пары" if ru else "Pairs only"),
+                               lambda: self.check(lambda e: e['name'] in emission & absorption))):
+            button = QPushButton(text)
+            button.clicked.connect(handler)
+            buttons.addWidget(button)
+        buttons.addStretch()
+        ok_btn = QPushButton("Загрузить выбранные" if ru else "Load selected")
+        ok_btn.clicked.connect(self.accept)
+        buttons.addWidget(ok_btn)
+        cancel_btn = QPushButton("Отмена" if ru else "Cancel")
+        cancel_btn.clicked.connect(self.reject)
+        buttons.addWidget(cancel_btn)
+        layout.addLayout(buttons)
+        self.setLayout(layout)
+
+    def describe(self, entry):
+        ru = self.language == 'ru'
+        kinds = {'emission': "эмиссия" if ru else "emission", 'absorption': "абсорбция" if ru else "absorption"}
+        parts = [entry['file'], f"[{kinds.get(entry['kind'], '?')}]"]
+        if entry['points'] is not None:
+            approx = '~' if entry['estimated'] else ''
+            parts.append(f"{approx}{entry['points']} " + ("точек" if ru else "points"))
+        if entry['delimiter'] is not None:
+            parts.append(f"'{entry['delimiter']}' x {entry['columns']}")
+        parts.append(f"{entry['size'] / 1024:.1f} KB")
+        if entry['error']:
+            parts.append(entry['error'])
+        return "   ".join(parts)
+
+    def check(self, predicate):
+        for i, entry in enumerate(self.index):
+            self.files_list.item(i).setCheckState(Qt.Checked if predicate(entry) else Qt.Unchecked)
+
+    def selection(self):
+        """Отмеченные файлы; None - отмечены все"""
+        checked = {self.files_list.item(i).data(Qt.UserRole) for i in range(self.files_list.count())
+                   if self.files_list.item(i).checkState() == Qt.Checked}
+        return None if len(checked) == len(self.index) else checked
+
+
+def tab_plot(key):
+    """Декоратор построения графика вкладки key.
+
+    Пока вкладка скрыта, построение откладывается до ее открытия;
+    время построения учитывается профилировщиком как стадия plot_<key>.
+    """
+    def decorator(plot):
+        @functools.wraps(plot)
+        def wrapper(self, *args):
+            if self.defer_plot(key, getattr(self, plot.__name__), *args):
+                return
+            with PROFILER.stage('plot_' + key):
+                return plot(self, *args)
+        return wrapper
+    return decorator
+
+
+# Стадии основного расчета, по измеренной длительности которых движется прогресс-бар
+CALCULATION_STAGES = ('calculation.compute', 'calculation.plot_integrals',
+                      'calculation.regression', 'calculation.plot_calibration')
+DUPLICATES_SHOWN = 10  # Сколько копий файлов перечислять в сообщении о дубликатах
+
+
 class SpectroscopyApp(QMainWindow):
     def __init__(self):
         super().__init__() #наследование из родительских классов
         self.language = 'ru'  # ru / en
-        self.data = {
-            'sample': {'emission_x': [], 'emission_y': [], 'absorption_x': [], 
-                      'absorption_y': [], 'ex_pic': [], 'integrals_simpson': [], 
-                      'integrals_trapezoid': []},
-            'standard': {'emission_x': [], 'emission_y': [], 'absorption_x': [], 
-                        'absorption_y': [], 'ex_pic': [], 'integrals_simpson': [], 
-                        'integrals_trapezoid': []}
-        }
+        self.workspace = Workspace()  # Все загруженные образцы и стандарты
+        # Последние введенные параметры QY: {имя стандарта: QY} и {имя набора: n}
+        self.qy_parameters = {'qy_standards': {}, 'refractive': {}}
+        self.qy_result = None
         self.current_method = 'simpson'
         self.trim_data = False
         self.trim_min = 0
@@ -151,6 +4771,20 @@ class SpectroscopyApp(QMainWindow):
         # Создаем ссылки на элементы для удобного доступа при переводе
         self.ui_elements = {}
         
+        # Лениво создаваемые холсты графиков, отложенные построения и диалоги инструкции
+        self.canvases = {}
+        self.pending_plots = {}
+        self.instruction_dialogs = {}
+        
+        # Выделение диапазона мышью на графике эмиссии и отложенный живой пересчет
+        self.span_selector = None
+        self.calibration_pick_cid = None
+        self.calibration_artists = {}  # Точки графика калибровки -> (набор, имена спектров)
+        self.live_timer = QTimer(self)
+        self.live_timer.setSingleShot(True)
+        self.live_timer.setInterval(30)
+        self.live_timer.timeout.connect(self.update_live_results)
+        
         self.initUI()
         self.apply_language()  # Применяем язык по умолчанию
     
@@ -223,10 +4857,25 @@ class SpectroscopyApp(QMainWindow):
         self.ui_elements['method_combo'] = self.method_combo
         params_layout.addLayout(method_layout)
         
+        # Шкала интегрирования: длина волны, волновое число или энергия
+        domain_layout = QHBoxLayout()
+        self.domain_label = QLabel("Шкала интегрирования:")
+        domain_layout.addWidget(self.domain_label)
+        self.ui_elements['domain_label'] = self.domain_label
+        
+        self.domain_combo = QComboBox()
+        self.domain_combo.addItems([DOMAIN_LABELS[domain][0] for domain in SPECTRAL_DOMAINS])
+        self.domain_combo.currentIndexChanged.connect(self.on_domain_changed)
+        domain_layout.addWidget(self.domain_combo)
+        self.ui_elements['domain_combo'] = self.domain_combo
+        params_layout.addLayout(domain_layout)
+        
         # Обрезка данных
         trim_layout = QHBoxLayout()
         self.trim_checkbox = QCheckBox("Обрезка данных для интегрирования")
         self.trim_checkbox.stateChanged.connect(self.toggle_trimming)
+        # Включение/выключение обрезки вручную тоже заменяет автоопределенные диапазоны
+        self.trim_checkbox.clicked.connect(lambda checked: self.clear_dataset_trims())
         trim_layout.addWidget(self.trim_checkbox)
         self.ui_elements['trim_checkbox'] = self.trim_checkbox
         params_layout.addLayout(trim_layout)
@@ -239,6 +4888,12 @@ class SpectroscopyApp(QMainWindow):
         update_layout.addWidget(self.update_btn)
         self.ui_elements['update_btn'] = self.update_btn
         
+        # Автоматический выбор границ интегрирования по полосе эмиссии
+        self.auto_trim_btn = QPushButton("Автоопределение границ")
+        self.auto_trim_btn.clicked.connect(self.auto_detect_limits)
+        update_layout.addWidget(self.auto_trim_btn)
+        self.ui_elements['auto_trim_btn'] = self.auto_trim_btn
+        
         params_layout.addLayout(update_layout)
         
         self.params_group.setLayout(params_layout)
@@ -254,6 +4909,7 @@ class SpectroscopyApp(QMainWindow):
         self.trim_min_input = QLineEdit()
         self.trim_min_input.setText("0")
         self.trim_min_input.setEnabled(False)
+        self.trim_min_input.textEdited.connect(self.on_trim_edited)
         trim_range_layout.addWidget(self.trim_min_input)
         
         self.trim_max_label = QLabel("До:")
@@ -263,9 +4919,58 @@ class SpectroscopyApp(QMainWindow):
         self.trim_max_input = QLineEdit()
         self.trim_max_input.setText("1000")
         self.trim_max_input.setEnabled(False)
+        self.trim_max_input.textEdited.connect(self.on_trim_edited)
         trim_range_layout.addWidget(self.trim_max_input)
         params_layout.addLayout(trim_range_layout)
         
+        # Сглаживание спектров эмиссии
+        smoothing_layout = QHBoxLayout()
+        self.smoothing_label = QLabel("Сглаживание:")
+        smoothing_layout.addWidget(self.smoothing_label)
+        self.ui_elements['smoothing_label'] = self.smoothing_label
+        
+        self.smoothing_combo = QComboBox()
+        self.smoothing_combo.addItems(["Нет", "Савицкий-Голей", "Медианное", "Уиттекер"])
+        smoothing_layout.addWidget(self.smoothing_combo)
+        self.ui_elements['smoothing_combo'] = self.smoothing_combo
+        
+        self.smoothing_param_label = QLabel("Окно / λ:")
+        smoothing_layout.addWidget(self.smoothing_param_label)
+        self.ui_elements['smoothing_param_label'] = self.smoothing_param_label
+        
+        self.smoothing_param_input = QLineEdit()
+        self.smoothing_param_input.setText("11")
+        smoothing_layout.addWidget(self.smoothing_param_input)
+        params_layout.addLayout(smoothing_layout)
+        
+        # Разложение спектров эмиссии на полосы
+        bands_layout = QHBoxLayout()
+        self.bands_label = QLabel("Разложение полос:")
+        bands_layout.addWidget(self.bands_label)
+        self.ui_elements['bands_label'] = self.bands_label
+        
+        self.bands_combo = QComboBox()
+        self.bands_combo.addItems(["Нет"] + [BAND_SHAPE_LABELS[shape][0] for shape in BAND_SHAPES])
+        bands_layout.addWidget(self.bands_combo)
+        self.ui_elements['bands_combo'] = self.bands_combo
+        
+        self.bands_count_label = QLabel("Полос:")
+        bands_layout.addWidget(self.bands_count_label)
+        self.ui_elements['bands_count_label'] = self.bands_count_label
+        
+        self.bands_count_input = QLineEdit()
+        self.bands_count_input.setText("2")
+        bands_layout.addWidget(self.bands_count_input)
+        
+        self.band_component_label = QLabel("Полоса №:")
+        bands_layout.addWidget(self.band_component_label)
+        self.ui_elements['band_component_label'] = self.band_component_label
+        
+        self.band_component_input = QLineEdit()
+        self.band_component_input.setPlaceholderText("основная")
+        bands_layout.addWidget(self.band_component_input)
+        params_layout.addLayout(bands_layout)
+        
         self.params_group.setLayout(params_layout)
         left_layout.addWidget(self.params_group)
         self.ui_elements['params_group'] = self.params_group
@@ -296,6 +5001,39 @@ class SpectroscopyApp(QMainWindow):
         standard_layout.addWidget(self.standard_label)
         data_layout.addLayout(standard_layout)
         
+        # Загрузка образца или стандарта из архива zip/tar без распаковки
+        self.archive_btn = QPushButton("Загрузить из архива")
+        self.archive_btn.clicked.connect(self.load_archive_data)
+        data_layout.addWidget(self.archive_btn)
+        self.ui_elements['archive_btn'] = self.archive_btn
+        
+        # Список загруженных наборов данных
+        self.datasets_list = QListWidget()
+        self.datasets_list.setMaximumHeight(120)
+        self.datasets_list.currentItemChanged.connect(self.on_dataset_selected)
+        data_layout.addWidget(self.datasets_list)
+        
+        self.remove_dataset_btn = QPushButton("Удалить выбранный набор")
+        self.remove_dataset_btn.clicked.connect(self.remove_selected_dataset)
+        data_layout.addWidget(self.remove_dataset_btn)
+        self.ui_elements['remove_dataset_btn'] = self.remove_dataset_btn
+        
+        # Кривая коррекции спектральной чувствительности прибора
+        correction_layout = QHBoxLayout()
+        self.correction_btn = QPushButton("Кривая коррекции")
+        self.correction_btn.clicked.connect(self.load_correction)
+        correction_layout.addWidget(self.correction_btn)
+        self.ui_elements['correction_btn'] = self.correction_btn
+        
+        self.clear_correction_btn = QPushButton("Без коррекции")
+        self.clear_correction_btn.clicked.connect(self.clear_correction)
+        correction_layout.addWidget(self.clear_correction_btn)
+        self.ui_elements['clear_correction_btn'] = self.clear_correction_btn
+        
+        self.correction_label = QLabel("Не загружено" if self.language == 'ru' else "Not uploaded")
+        correction_layout.addWidget(self.correction_label)
+        data_layout.addLayout(correction_layout)
+        
         self.data_group.setLayout(data_layout)
         left_layout.addWidget(self.data_group)
         self.ui_elements['data_group'] = self.data_group
@@ -309,10 +5047,28 @@ class SpectroscopyApp(QMainWindow):
         calc_layout.addWidget(self.calculate_btn)
         self.ui_elements['calculate_btn'] = self.calculate_btn
         
+        # Повторное использование введенных параметров QY без диалогов
+        self.reuse_qy_checkbox = QCheckBox("Использовать сохраненные параметры QY")
+        calc_layout.addWidget(self.reuse_qy_checkbox)
+        self.ui_elements['reuse_qy_checkbox'] = self.reuse_qy_checkbox
+        
         # Прогресс-бар
         self.progress_bar = QProgressBar()
         calc_layout.addWidget(self.progress_bar)
         
+        # Сохранение и открытие сессии
+        session_layout = QHBoxLayout()
+        self.save_session_btn = QPushButton("Сохранить сессию")
+        self.save_session_btn.clicked.connect(self.save_session)
+        session_layout.addWidget(self.save_session_btn)
+        self.ui_elements['save_session_btn'] = self.save_session_btn
+        
+        self.open_session_btn = QPushButton("Открыть сессию")
+        self.open_session_btn.clicked.connect(self.open_session)
+        session_layout.addWidget(self.open_session_btn)
+        self.ui_elements['open_session_btn'] = self.open_session_btn
+        calc_layout.addLayout(session_layout)
+        
         self.calc_group.setLayout(calc_layout)
         left_layout.addWidget(self.calc_group)
         self.ui_elements['calc_group'] = self.calc_group
@@ -325,6 +5081,16 @@ class SpectroscopyApp(QMainWindow):
         self.results_text.setMaximumHeight(200)
         results_layout.addWidget(self.results_text)
         
+        self.export_btn = QPushButton("Экспорт результатов")
+        self.export_btn.clicked.connect(self.export_results)
+        results_layout.addWidget(self.export_btn)
+        self.ui_elements['export_btn'] = self.export_btn
+        
+        self.report_btn = QPushButton("Отчет PDF")
+        self.report_btn.clicked.connect(self.save_report)
+        results_layout.addWidget(self.report_btn)
+        self.ui_elements['report_btn'] = self.report_btn
+        
         self.results_group.setLayout(results_layout)
         left_layout.addWidget(self.results_group)
         self.ui_elements['results_group'] = self.results_group
@@ -340,36 +5106,98 @@ class SpectroscopyApp(QMainWindow):
         
         # === ПРАВАЯ ПАНЕЛЬ ===
         
-        # Создаем вкладки для графиков
+        # Создаем вкладки для графиков. Фигуры и холсты создаются лениво
+        # (см. plot_canvas), графики скрытых вкладок строятся при их открытии
         self.tabs = QTabWidget()
         
         # Вкладка 1: Исходные спектры
         self.spectra_tab = QWidget()
-        spectra_layout = QVBoxLayout()
-        self.spectra_figure = Figure(figsize=(10, 6))
-        self.spectra_canvas = FigureCanvas(self.spectra_figure)
-        spectra_layout.addWidget(self.spectra_canvas)
-        self.spectra_tab.setLayout(spectra_layout)
+        self.spectra_tab.setLayout(QVBoxLayout())
         
         # Вкладка 2: Интегралы
         self.integrals_tab = QWidget()
-        integrals_layout = QVBoxLayout()
-        self.integrals_figure = Figure(figsize=(10, 6))
-        self.integrals_canvas = FigureCanvas(self.integrals_figure)
-        integrals_layout.addWidget(self.integrals_canvas)
-        self.integrals_tab.setLayout(integrals_layout)
+        self.integrals_tab.setLayout(QVBoxLayout())
         
         # Вкладка 3: Калибровочные кривые
         self.calibration_tab = QWidget()
-        calibration_layout = QVBoxLayout()
-        self.calibration_figure = Figure(figsize=(10, 6))
-        self.calibration_canvas = FigureCanvas(self.calibration_figure)
-        calibration_layout.addWidget(self.calibration_canvas)
-        self.calibration_tab.setLayout(calibration_layout)
+        self.calibration_tab.setLayout(QVBoxLayout())
+        
+        # Вкладка 4: Кинетика серий спектров (файлы с несколькими спектрами)
+        self.kinetics_tab = QWidget()
+        kinetics_layout = QVBoxLayout()
+        interval_layout = QHBoxLayout()
+        self.kinetics_interval_label = QLabel("Интервал между спектрами серии, с:")
+        interval_layout.addWidget(self.kinetics_interval_label)
+        self.ui_elements['kinetics_interval_label'] = self.kinetics_interval_label
+        self.kinetics_interval_input = QLineEdit()
+        self.kinetics_interval_input.setMaximumWidth(80)
+        self.kinetics_interval_input.editingFinished.connect(self.plot_kinetics)
+        interval_layout.addWidget(self.kinetics_interval_input)
+        interval_layout.addStretch()
+        kinetics_layout.addLayout(interval_layout)
+        self.kinetics_tab.setLayout(kinetics_layout)
+        
+        self.plot_tabs = {'spectra': self.spectra_tab, 'integrals': self.integrals_tab,
+                          'calibration': self.calibration_tab, 'kinetics': self.kinetics_tab}
         
         self.tabs.addTab(self.spectra_tab, "Спектры")
         self.tabs.addTab(self.integrals_tab, "Интегралы")
         self.tabs.addTab(self.calibration_tab, "Калибровка")
+        self.tabs.addTab(self.kinetics_tab, "Кинетика")
+        
+        # Вкладка 5: Диагностика - время и память по стадиям расчета
+        self.diagnostics_tab = QWidget()
+        diagnostics_layout = QVBoxLayout()
+        self.diagnostics_table = QTableWidget(0, 7)
+        self.diagnostics_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        diagnostics_layout.addWidget(self.diagnostics_table)
+        
+        diagnostics_buttons = QHBoxLayout()
+        self.refresh_diagnostics_btn = QPushButton("Обновить")
+        self.refresh_diagnostics_btn.clicked.connect(self.refresh_diagnostics)
+        diagnostics_buttons.addWidget(self.refresh_diagnostics_btn)
+        self.ui_elements['refresh_diagnostics_btn'] = self.refresh_diagnostics_btn
+        
+        self.reset_diagnostics_btn = QPushButton("Сбросить")
+        self.reset_diagnostics_btn.clicked.connect(self.reset_diagnostics)
+        diagnostics_buttons.addWidget(self.reset_diagnostics_btn)
+        self.ui_elements['reset_diagnostics_btn'] = self.reset_diagnostics_btn
+        
+        self.save_trace_btn = QPushButton("Сохранить трассировку (JSON)")
+        self.save_trace_btn.clicked.connect(self.save_trace)
+        diagnostics_buttons.addWidget(self.save_trace_btn)
+        self.ui_elements['save_trace_btn'] = self.save_trace_btn
+        diagnostics_layout.addLayout(diagnostics_buttons)
+        
+        # Бюджет памяти спектров
+        memory_layout = QHBoxLayout()
+        self.memory_label = QLabel()
+        memory_layout.addWidget(self.memory_label)
+        memory_layout.addStretch()
+        self.memory_budget_label = QLabel("Бюджет, МБ:")
+        memory_layout.addWidget(self.memory_budget_label)
+        self.ui_elements['memory_budget_label'] = self.memory_budget_label
+        
+        self.memory_budget_input = QLineEdit()
+        self.memory_budget_input.setMaximumWidth(80)
+        self.memory_budget_input.setPlaceholderText("∞")
+        if MEMORY.budget is not None:
+            self.memory_budget_input.setText(f"{MEMORY.budget / 2**20:g}")
+        memory_layout.addWidget(self.memory_budget_input)
+        
+        self.float32_checkbox = QCheckBox("float32")
+        self.float32_checkbox.setChecked(MEMORY.float32)
+        memory_layout.addWidget(self.float32_checkbox)
+        
+        self.apply_memory_btn = QPushButton("Применить")
+        self.apply_memory_btn.clicked.connect(self.apply_memory_settings)
+        memory_layout.addWidget(self.apply_memory_btn)
+        self.ui_elements['apply_memory_btn'] = self.apply_memory_btn
+        diagnostics_layout.addLayout(memory_layout)
+        self.diagnostics_tab.setLayout(diagnostics_layout)
+        
+        self.tabs.addTab(self.diagnostics_tab, "Диагностика")
+        self.tabs.currentChanged.connect(self.on_tab_changed)
         
         right_layout.addWidget(self.tabs)
         
@@ -400,31 +5228,64 @@ class SpectroscopyApp(QMainWindow):
         self.method_label.setText("Метод интегрирования:")
         self.method_combo.setItemText(0, "Метод Симпсона")
         self.method_combo.setItemText(1, "Метод трапеций")
+        self.domain_label.setText("Шкала интегрирования:")
+        for i, domain in enumerate(SPECTRAL_DOMAINS):
+            self.domain_combo.setItemText(i, DOMAIN_LABELS[domain][0])
         self.trim_checkbox.setText("Обрезка данных для интегрирования")
         self.trim_min_label.setText("От:")
         self.trim_max_label.setText("До:")
+        self.smoothing_label.setText("Сглаживание:")
+        for i, text in enumerate(["Нет", "Савицкий-Голей", "Медианное", "Уиттекер"]):
+            self.smoothing_combo.setItemText(i, text)
+        self.smoothing_param_label.setText("Окно / λ:")
+        self.bands_label.setText("Разложение полос:")
+        for i, text in enumerate(["Нет"] + [BAND_SHAPE_LABELS[shape][0] for shape in BAND_SHAPES]):
+            self.bands_combo.setItemText(i, text)
+        self.bands_count_label.setText("Полос:")
+        self.band_component_label.setText("Полоса №:")
+        self.band_component_input.setPlaceholderText("основная")
         self.update_btn.setText("Обновить графики")
+        self.auto_trim_btn.setText("Автоопределение границ")
         
         # Загрузка данных
         self.data_group.setTitle("Загрузка данных")
         self.sample_btn.setText("Загрузить данные ОБРАЗЦА")
         self.standard_btn.setText("Загрузить данные СТАНДАРТА")
+        self.remove_dataset_btn.setText("Удалить выбранный набор")
+        self.archive_btn.setText("Загрузить из архива")
+        self.correction_btn.setText("Кривая коррекции")
+        self.clear_correction_btn.setText("Без коррекции")
         if self.sample_label.text() in ["Not uploaded", "Не загружено"]:
             self.sample_label.setText("Не загружено")
+        if self.correction_label.text() in ["Not uploaded", "Не загружено"]:
+            self.correction_label.setText("Не загружено")
         if self.standard_label.text() in ["Not uploaded", "Не загружено"]:
             self.standard_label.setText("Не загружено")
         
         # Расчет
         self.calc_group.setTitle("Расчет")
         self.calculate_btn.setText("Выполнить расчет")
+        self.reuse_qy_checkbox.setText("Использовать сохраненные параметры QY")
+        self.save_session_btn.setText("Сохранить сессию")
+        self.open_session_btn.setText("Открыть сессию")
+        self.refresh_diagnostics_btn.setText("Обновить")
+        self.reset_diagnostics_btn.setText("Сбросить")
+        self.save_trace_btn.setText("Сохранить трассировку (JSON)")
+        self.memory_budget_label.setText("Бюджет, МБ:")
+        self.apply_memory_btn.setText("Применить")
         
         # Результаты
         self.results_group.setTitle("Результаты")
+        self.export_btn.setText("Экспорт результатов")
+        self.report_btn.setText("Отчет PDF")
         
         # Вкладки
         self.tabs.setTabText(0, "Спектры")
         self.tabs.setTabText(1, "Интегралы")
         self.tabs.setTabText(2, "Калибровка")
+        self.tabs.setTabText(3, "Кинетика")
+        self.tabs.setTabText(4, "Диагностика")
+        self.kinetics_interval_label.setText("Интервал между спектрами серии, с:")
         
         # Авторы
         self.authors_label.setText("Разработчик: Шулепов Р.Р.")
@@ -441,32 +5302,65 @@ class SpectroscopyApp(QMainWindow):
         self.method_label.setText("Integration method:")
         self.method_combo.setItemText(0, "Simpson's Method")
         self.method_combo.setItemText(1, "Trapezoidal Method")
+        self.domain_label.setText("Integration axis:")
+        for i, domain in enumerate(SPECTRAL_DOMAINS):
+            self.domain_combo.setItemText(i, DOMAIN_LABELS[domain][1])
         self.trim_checkbox.setText("Trim data for integration")
         self.trim_min_label.setText("From:")
         self.trim_max_label.setText("To:")
+        self.smoothing_label.setText("Smoothing:")
+        for i, text in enumerate(["None", "Savitzky-Golay", "Median", "Whittaker"]):
+            self.smoothing_combo.setItemText(i, text)
+        self.smoothing_param_label.setText("Window / λ:")
+        self.bands_label.setText("Band deconvolution:")
+        for i, text in enumerate(["None"] + [BAND_SHAPE_LABELS[shape][1] for shape in BAND_SHAPES]):
+            self.bands_combo.setItemText(i, text)
+        self.bands_count_label.setText("Bands:")
+        self.band_component_label.setText("Band #:")
+        self.band_component_input.setPlaceholderText("main")
         self.update_btn.setText("Update spectra")
+        self.auto_trim_btn.setText("Auto-detect limits")
         
         
         # Data loading
         self.data_group.setTitle("Data Loading")
         self.sample_btn.setText("Load SAMPLE data")
         self.standard_btn.setText("Load STANDARD data")
+        self.remove_dataset_btn.setText("Remove selected dataset")
+        self.archive_btn.setText("Load from archive")
+        self.correction_btn.setText("Response correction")
+        self.clear_correction_btn.setText("No correction")
         if self.sample_label.text() in ["Not uploaded", "Не загружено"]:
             self.sample_label.setText("Not uploaded")
+        if self.correction_label.text() in ["Not uploaded", "Не загружено"]:
+            self.correction_label.setText("Not uploaded")
         if self.standard_label.text() in ["Not uploaded", "Не загружено"]:
             self.standard_label.setText("Not uploaded")        
         
         # Calculation
         self.calc_group.setTitle("Calculation")
         self.calculate_btn.setText("Perform Calculation")
+        self.reuse_qy_checkbox.setText("Reuse saved QY parameters")
+        self.save_session_btn.setText("Save session")
+        self.open_session_btn.setText("Open session")
+        self.refresh_diagnostics_btn.setText("Refresh")
+        self.reset_diagnostics_btn.setText("Reset")
+        self.save_trace_btn.setText("Save trace (JSON)")
+        self.memory_budget_label.setText("Budget, MB:")
+        self.apply_memory_btn.setText("Apply")
         
         # Results
         self.results_group.setTitle("Results")
+        self.export_btn.setText("Export results")
+        self.report_btn.setText("PDF report")
         
         # Tabs
         self.tabs.setTabText(0, "Spectra")
         self.tabs.setTabText(1, "Integrals")
         self.tabs.setTabText(2, "Calibration")
+        self.tabs.setTabText(3, "Kinetics")
+        self.tabs.setTabText(4, "Diagnostics")
+        self.kinetics_interval_label.setText("Interval between series spectra, s:")
         
         # Authors
         self.authors_label.setText("Developer: Shulepov R.R.")
@@ -482,7 +5376,11 @@ class SpectroscopyApp(QMainWindow):
     
     def show_instructions(self):
         """Показать инструкцию"""
-        dialog = InstructionDialog(self.language, self)
+        # Диалог создается один раз для каждого языка
+        dialog = self.instruction_dialogs.get(self.language)
+        if dialog is None:
+            dialog = InstructionDialog(self.language, self)
+            self.instruction_dialogs[self.language] = dialog
         dialog.exec_()
     
     def toggle_trimming(self, state):
@@ -491,20 +5389,138 @@ class SpectroscopyApp(QMainWindow):
         self.trim_min_input.setEnabled(self.trim_data)
         self.trim_max_input.setEnabled(self.trim_data)
     
+    def on_span_select(self, x_min, x_max):
+        """Диапазон, выделенный мышью, становится диапазоном обрезки"""
+        if x_max - x_min <= 0:
+            return
+        # На графике - шкала интегрирования, диапазон обрезки - в нм
+        x_min, x_max = domain_window((x_min, x_max), self.spectral_domain())
+        self.trim_min_input.setText(f"{x_min:.2f}")
+        self.trim_max_input.setText(f"{x_max:.2f}")
+        self.trim_checkbox.setChecked(True)
+        self.clear_dataset_trims()
+        # Пересчет откладывается, чтобы частые события мыши объединялись
+        self.live_timer.start()
+    
+    def on_trim_edited(self, text):
+        """Границы, введенные вручную, заменяют автоопределенные диапазоны наборов"""
+        self.clear_dataset_trims()
+    
+    def clear_dataset_trims(self):
+        """Сброс собственных (автоопределенных) диапазонов наборов: дальше
+        действует общий диапазон из полей обрезки"""
+        for dataset in self.workspace:
+            dataset.trim = None
+    
+    def auto_detect_limits(self):
+        """Автоопределение границ интегрирования всех наборов по полосе эмиссии"""
+        if not len(self.workspace):
+            error_msg = ("Нет данных для отображения. Сначала загрузите данные." if self.language == 'ru'
+                        else "No data to display. Please load data first.")
+            QMessageBox.warning(self, "Предупреждение" if self.language == 'ru' else "Warning", error_msg)
+            return
+        try:
+            limits = propose_integration_limits(self.workspace)
+            lines = []
+            for dataset in self.workspace:
+                if dataset.name not in limits:
+                    continue
+                low, high, noise = limits[dataset.name]
+                dataset.trim = (low, high)
+                lines.append(f"{dataset.name}: {low:.1f} - {high:.1f} нм, шум {noise:.3g}" if self.language == 'ru'
+                             else f"{dataset.name}: {low:.1f} - {high:.1f} nm, noise {noise:.3g}")
+            
+            # Общий диапазон показывает охват всех наборов
+            if limits:
+                self.trim_min_input.setText(f"{min(v[0] for v in limits.values()):.2f}")
+                self.trim_max_input.setText(f"{max(v[1] for v in limits.values()):.2f}")
+            self.trim_checkbox.setChecked(True)
+            
+            dataset = self.selected_dataset()
+            if dataset is not None:
+                self.plot_spectra(dataset.name)
+            self.update_live_results()
+            
+            info_msg = ("Найденные границы интегрирования:\n" if self.language == 'ru'
+                       else "Detected integration limits:\n") + "\n".join(lines)
+            QMessageBox.information(self, "Успех" if self.language == 'ru' else "Success", info_msg)
+        except Exception as e:
+            error_msg = (f"Ошибка при определении границ: {str(e)}" if self.language == 'ru'
+                        else f"Error detecting limits: {str(e)}")
+            QMessageBox.warning(self, "Ошибка" if self.language == 'ru' else "Error", error_msg)
+    
+    def update_live_results(self):
+        """Пересчет интегралов, регрессий и QY для текущего диапазона без диалогов"""
+        if not self.workspace.by_role('sample'):
+            return
+        try:
+            hv = float(self.wavelength_input.text())
+        except ValueError:
+            return
+        try:
+            self.current_method = 'simpson' if self.method_combo.currentIndex() == 0 else 'trapezoid'
+            with PROFILER.stage('live_update'):
+                self.workspace.compute(hv, self.trim_window(), self.smoothing_parameters(),
+                                       self.deconvolution_parameters(), self.spectral_domain())
+                self.qy_result = self.live_quantum_yield()
+                self.plot_integrals()
+                self.plot_calibration()
+                self.plot_kinetics()
+                self.results_text.setText(self.format_results(hv, self.qy_result))
+        except Exception as e:
+            error_msg = f"Произошла ошибка: {str(e)}" if self.language == 'ru' else f"An error occurred: {str(e)}"
+            self.results_text.setText(error_msg)
+    
+    def live_qy_parameters(self):
+        """Уже введенные (QY стандартов, показатели преломления); None, если они неполны"""
+        qy_standards = self.qy_parameters['qy_standards']
+        refractive = self.qy_parameters['refractive']
+        if (self.workspace.by_role('standard') and
+                all(d.name in qy_standards for d in self.workspace.by_role('standard')) and
+                all(d.name in refractive for d in self.workspace)):
+            return qy_standards, refractive
+        return None
+    
+    def live_quantum_yield(self):
+        """QY по уже введенным параметрам стандартов; None, если они неполны"""
+        parameters = self.live_qy_parameters()
+        if parameters is None:
+            return None
+        return self.workspace.quantum_yield_matrix(self.current_method, *parameters)
+    
+    def refresh_calibration(self):
+        """Пересчет регрессий и QY по уже найденным интегралам (после исключения точек)"""
+        if not any(d.results for d in self.workspace):
+            return
+        try:
+            with PROFILER.stage('calibration_update'):
+                self.qy_result = self.live_quantum_yield()
+                self.plot_calibration()
+                self.plot_kinetics()
+                self.results_text.setText(self.format_results(self.wavelength_input.text(), self.qy_result))
+        except Exception as e:
+            error_msg = f"Произошла ошибка: {str(e)}" if self.language == 'ru' else f"An error occurred: {str(e)}"
+            self.results_text.setText(error_msg)
+    
+    def on_calibration_pick(self, event):
+        """Щелчок по точке калибровки исключает спектр из регрессии или возвращает его"""
+        target = self.calibration_artists.get(event.artist)
+        if target is None or not len(event.ind):
+            return
+        name, names = target
+        dataset = self.workspace.datasets.get(name)
+        if dataset is None:
+            return
+        dataset.toggle_excluded(names[event.ind[0]])
+        self.refresh_calibration()
+    
     def update_spectra_plots(self):
         """Обновление графиков спектров с учетом текущего диапазона обрезки"""
         try:
             # Проверяем, есть ли данные для отображения
-            if (self.data['sample']['emission_x'] or 
-                self.data['standard']['emission_x']):
-                
-                # Обновляем графики для образца
-                if self.data['sample']['emission_x']:
-                    self.plot_spectra('sample')
-                
-                # Обновляем графики для стандарта
-                if self.data['standard']['emission_x']:
-                    self.plot_spectra('standard')
+            dataset = self.selected_dataset()
+            if dataset is not None:
+                self.plot_spectra(dataset.name)
                 
                 # Показываем сообщение об успехе
                 success_msg = ("Графики спектров успешно обновлены с учетом нового диапазона обрезки!" 
@@ -524,108 +5540,126 @@ class SpectroscopyApp(QMainWindow):
             QMessageBox.warning(self, "Ошибка" if self.language == 'ru' else "Error", error_msg)
         
     
-    def trim_spectrum(self, x, y):
-        """Обрезка спектра по заданному диапазону"""
+    def trim_window(self):
+        """Текущий диапазон обрезки (min, max) или None, если обрезка выключена"""
         if not self.trim_data:
-            return x, y
-        
+            return None
         try:
-            min_val = float(self.trim_min_input.text())
-            max_val = float(self.trim_max_input.text())
-            
-            trimmed_x = []
-            trimmed_y = []
-            
-            for i, wavelength in enumerate(x):
-                if min_val <= wavelength <= max_val:
-                    trimmed_x.append(wavelength)
-                    trimmed_y.append(y[i])
-            
-            return trimmed_x, trimmed_y
+            return float(self.trim_min_input.text()), float(self.trim_max_input.text())
+        except ValueError:
+            return None
+    
+    def smoothing_parameters(self):
+        """Текущие параметры сглаживания (метод, окно или lambda) или None"""
+        index = self.smoothing_combo.currentIndex()
+        if index == 0:
+            return None
+        try:
+            parameter = float(self.smoothing_param_input.text())
+        except ValueError:
+            return None
+        if parameter <= 0:
+            return None
+        return SMOOTHING_METHODS[index - 1], parameter
+    
+    def spectral_domain(self):
+        """Выбранная шкала интегрирования (см. SPECTRAL_DOMAINS)"""
+        return SPECTRAL_DOMAINS[max(self.domain_combo.currentIndex(), 0)]
+    
+    def on_domain_changed(self, index):
+        """Смена шкалы: спектры перерисовываются, результаты пересчитываются
+        (пересчитанные спектры кэшируются наборами)"""
+        dataset = self.selected_dataset()
+        if dataset is not None:
+            self.plot_spectra(dataset.name)
+        if any(d.results for d in self.workspace):
+            self.live_timer.start()
+    
+    def deconvolution_parameters(self):
+        """Текущие параметры разложения (форма, число полос, номер полосы или
+        None - основная) или None; номер полосы в интерфейсе считается с 1"""
+        index = self.bands_combo.currentIndex()
+        if index == 0:
+            return None
+        try:
+            n_components = int(self.bands_count_input.text())
+            component = self.band_component_input.text().strip()
+            component = int(component) - 1 if component else None
         except ValueError:
-            return x, y
+            return None
+        if n_components < 1 or component is not None and not 0 <= component < n_components:
+            return None
+        return BAND_SHAPES[index - 1], n_components, component
+    
+    def trim_spectrum(self, x, y, window=None):
+        """Обрезка спектра по заданному (или общему) диапазону"""
+        return trim_spectrum(x, y, window or self.trim_window())
     
     def calculate_ex_pic(self, absorption_x, absorption_y, hv):
         """ВЫЧИСЛЯЕТ интенсивность при заданной длине волны ВОЗБУЖДЕНИЯ"""
-        ex_pic = []
-        for i in range(len(absorption_x)):
-            spectrum_x = absorption_x[i]
-            spectrum_y = absorption_y[i]
-            ex_value = 0
-            # Ищем ближайшее значение к hv в спектре
-            min_diff = float('inf')
-            best_value = 0
-            for j, wavelength in enumerate(spectrum_x):
-                diff = abs(wavelength - hv)
-                if diff < min_diff:
-                    min_diff = diff
-                    best_value = spectrum_y[j]
-            ex_pic.append(best_value)
-        return ex_pic
+        store = SpectrumStore.from_dict({i: (np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+                                         for i, (x, y) in enumerate(zip(absorption_x, absorption_y))})
+        return segment_nearest(store.x, store.y, store.offsets, hv).tolist()
     
     def robust_float_conversion(self, value):
         """Безопасное преобразование в float"""
-        try:
-            # Убираем возможные пробелы и нечисловые символы
-            cleaned_value = ''.join(c for c in str(value) if c.isdigit() or c in '.-eE')
-            return float(cleaned_value)
-        except (ValueError, TypeError):
-            return None
+        return robust_float_conversion(value)
     
     def load_sample_data(self):
         folder = QFileDialog.getExistingDirectory(self, 
             "Выберите папку с данными ОБРАЗЦА" if self.language == 'ru' else "Select folder with SAMPLE data")
         if folder:
-            self.sample_label.setText(os.path.basename(folder))
-            self.process_folder_data(folder, 'sample')
-        self.update_btn.setEnabled(True)
+            self.load_with_scan(folder, 'sample')
+        self.update_btn.setEnabled(len(self.workspace) > 0)
             
     def load_standard_data(self):
         folder = QFileDialog.getExistingDirectory(self,
             "Выберите папку с данными СТАНДАРТА" if self.language == 'ru' else "Select folder with STANDARD data")
         if folder:
-            self.standard_label.setText(os.path.basename(folder))
-            self.process_folder_data(folder, 'standard')
-        self.update_btn.setEnabled(True)
+            self.load_with_scan(folder, 'standard')
+        self.update_btn.setEnabled(len(self.workspace) > 0)
     
-    def process_folder_data(self, folder, data_type):
-        """Обработка данных из папки БЕЗ сохранения ex_pic"""
-        emission_x = []
-        emission_y = []
-        absorption_x = []
-        absorption_y = []
-        
+    def load_archive_data(self):
+        """Загрузка архива zip/tar как образца или стандарта"""
+        ru = self.language == 'ru'
+        patterns = ' '.join('*' + ext for ext in ARCHIVE_EXTENSIONS)
+        path, _ = QFileDialog.getOpenFileName(self, "Выберите архив" if ru else "Select archive",
+                                              "", f"Archives ({patterns})")
+        if not path:
+            return
+        roles = ["Образец", "Стандарт"] if ru else ["Sample", "Standard"]
+        role, ok = QInputDialog.getItem(self, "Архив" if ru else "Archive",
+                                        "Данные архива:" if ru else "Archive contains:", roles, 0, False)
+        if ok:
+            self.load_with_scan(path, 'sample' if role == roles[0] else 'standard')
+        self.update_btn.setEnabled(len(self.workspace) > 0)
+    
+    def load_with_scan(self, folder, data_type):
+        """Быстрый просмотр папки, выбор файлов и чтение только выбранных"""
         try:
-            for root, dirs, files in os.walk(folder):
-                emission_files = [f for f in files if f.endswith('.tit')]
-                absorption_files = [f for f in files if f.endswith('.txt')]
-                
-                # Обрабатываем файлы эмиссии
-                for file in emission_files:
-                    file_path = os.path.join(root, file)
-                    x, y = self.read_emission_file(file_path)
-                    if x and y:
-                        emission_x.append(x)
-                        emission_y.append(y)
-                
-                # Обрабатываем файлы абсорбции
-                for file in absorption_files:
-                    file_path = os.path.join(root, file)
-                    x_a, y_a = self.read_absorption_file(file_path)  # УБРАЛИ параметр hv
-                    if x_a and y_a:
-                        absorption_x.append(x_a)
-                        absorption_y.append(y_a)
-            
-            self.data[data_type]['emission_x'] = emission_x
-            self.data[data_type]['emission_y'] = emission_y
-            self.data[data_type]['absorption_x'] = absorption_x
-            self.data[data_type]['absorption_y'] = absorption_y
-            # НЕ сохраняем ex_pic здесь - он будет вычисляться при каждом расчете
-            
-            self.plot_spectra(data_type)
+            index = scan_folder(folder)
+        except Exception as e:
+            error_msg = (f"Ошибка при просмотре папки: {str(e)}" if self.language == 'ru'
+                        else f"Error scanning folder: {str(e)}")
+            QMessageBox.warning(self, "Ошибка" if self.language == 'ru' else "Error", error_msg)
+            return
+        dialog = ScanDialog(folder, index, self.language, self)
+        if dialog.exec_() == QDialog.Accepted:
+            self.process_folder_data(folder, data_type, dialog.selection())
+    
+    def process_folder_data(self, folder, data_type, selection=None):
+        """Добавление папки в рабочее пространство как образца или стандарта"""
+        try:
+            dataset = self.workspace.add(folder, data_type, selection).load()
+            self.report_problems(dataset.problems)
+            self.confirm_duplicates(dataset)
+            self.refresh_datasets_list(dataset.name)
             
-            success_msg = (f"Данные {data_type} успешно загружены!" if self.language == 'ru' 
-                          else f"{data_type.capitalize()} data successfully loaded!")
+            emission_idx, _ = dataset.pairs()
+            success_msg = (f"Данные {dataset.name} ({data_type}) успешно загружены! "
+                          f"Пар спектров эмиссия/абсорбция: {len(emission_idx)}" if self.language == 'ru' 
+                          else f"{data_type.capitalize()} data {dataset.name} successfully loaded! "
+                          f"Emission/absorption pairs: {len(emission_idx)}")
             QMessageBox.information(self, "Успех" if self.language == 'ru' else "Success", success_msg)
             
         except Exception as e:
@@ -633,202 +5667,237 @@ class SpectroscopyApp(QMainWindow):
                         else f"Error loading data: {str(e)}")
             QMessageBox.warning(self, "Ошибка" if self.language == 'ru' else "Error", error_msg)
     
-    def read_emission_file(self, filepath):
-        """Чтение .tit файлов с улучшенной обработкой ошибок"""
-        x, y = [], []
-        lines_processed = 0
-        
+    def load_correction(self):
+        """Загрузка кривой коррекции спектральной чувствительности прибора"""
+        path, _ = QFileDialog.getOpenFileName(self,
+            "Выберите файл кривой коррекции" if self.language == 'ru' else "Select response correction file",
+            "", "Text (*.txt *.csv *.dat);;All files (*)")
+        if not path:
+            return
         try:
-            with open(filepath, 'r', encoding='utf-8', errors='ignore') as file:
-                for line_num, line in enumerate(file, 1):
-                    line = line.strip()
-                    if not line or line.startswith('#'):
-                        continue
-                    
-                    # Пробуем разные разделители
-                    for separator in [';', ',', '\t', ' ']:
-                        if separator in line:
-                            parts = [part.strip() for part in line.split(separator) if part.strip()]
-                            if len(parts) >= 6:  # Нужно как минимум 6 колонок
-                                try:
-                                    x_val = self.robust_float_conversion(parts[0])
-                                    y_val = self.robust_float_conversion(parts[5])
-                                    
-                                    if x_val is not None and y_val is not None:
-                                        x.append(x_val)
-                                        y.append(y_val)
-                                        lines_processed += 1
-                                        break  # Успешно обработали строку
-                                except (ValueError, IndexError):
-                                    continue
-            
-            if lines_processed == 0:
-                warning_msg = (f"Файл {os.path.basename(filepath)} не содержит числовых данных в ожидаемом формате"
-                              if self.language == 'ru' else
-                              f"File {os.path.basename(filepath)} contains no numeric data in expected format")
-                QMessageBox.warning(self, "Предупреждение" if self.language == 'ru' else "Warning", warning_msg)
-                return [], []
-                
-            return x, y
-            
+            self.workspace.set_correction(ResponseCorrection.from_file(path))
+            self.correction_label.setText(os.path.basename(path))
         except Exception as e:
-            error_msg = (f"Ошибка чтения файла {filepath}: {str(e)}" if self.language == 'ru'
-                        else f"Error reading file {filepath}: {str(e)}")
+            error_msg = (f"Ошибка при загрузке кривой коррекции: {str(e)}" if self.language == 'ru'
+                        else f"Error loading response correction: {str(e)}")
             QMessageBox.warning(self, "Ошибка" if self.language == 'ru' else "Error", error_msg)
-            return [], []
     
-    def read_absorption_file(self, filepath):
-        """Чтение .txt файлов абсорбции с улучшенной обработкой ошибок"""
-        x, y = [], []
-        lines_processed = 0
-        
-        try:
-            with open(filepath, 'r', encoding='utf-8', errors='ignore') as file:
-                for line in file:
-                    line = line.strip()
-                    if not line or line.startswith('#'):
-                        continue
-                    
-                    # Пробуем разные разделители
-                    for separator in [',', ';', '\t', ' ']:
-                        if separator in line:
-                            parts = [part.strip() for part in line.split(separator) if part.strip()]
-                            if len(parts) >= 2:
-                                try:
-                                    x_val = self.robust_float_conversion(parts[0])
-                                    y_val = self.robust_float_conversion(parts[1])
-                                    
-                                    if x_val is not None and y_val is not None:
-                                        x.append(x_val)
-                                        y.append(y_val)
-                                        lines_processed += 1
-                                        break
-                                except (ValueError, IndexError):
-                                    continue
-            
-            if lines_processed == 0:
+    def clear_correction(self):
+        self.workspace.set_correction(None)
+        self.correction_label.setText("Не загружено" if self.language == 'ru' else "Not uploaded")
+    
+    def confirm_duplicates(self, dataset):
+        """Сообщение о пропущенных копиях файлов с выбором: оставить их как
+        отдельные спектры (набор перечитывается, разбор берется из кэша)"""
+        duplicates = dataset.duplicates
+        if not duplicates:
+            return
+        shown = DUPLICATES_SHOWN
+        lines = "\n".join(f"{os.path.basename(path)} = {os.path.basename(original)}"
+                          for path, original in duplicates[:shown])
+        if len(duplicates) > shown:
+            lines += f"\n... (+{len(duplicates) - shown})"
+        question = (f"В наборе {dataset.name} найдены одинаковые по содержимому файлы: {len(duplicates)}.\n"
+                    f"Копии не учитываются, чтобы не считать одно измерение несколько раз:\n\n{lines}\n\n"
+                    "Оставить копии как отдельные спектры?" if self.language == 'ru' else
+                    f"Dataset {dataset.name} contains files with identical content: {len(duplicates)}.\n"
+                    f"The copies are skipped so one measurement is not counted several times:\n\n{lines}\n\n"
+                    "Keep the copies as separate spectra?")
+        answer = QMessageBox.question(self, "Дубликаты" if self.language == 'ru' else "Duplicates",
+                                      question, QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if answer == QMessageBox.Yes:
+            dataset.keep_duplicates = True
+            dataset.reload()
+    
+    def report_problems(self, problems):
+        """Сообщения о файлах, которые не удалось прочитать (копии - см. confirm_duplicates)"""
+        for filepath, error in problems:
+            if isinstance(error, DuplicateSpectrumError):
+                continue
+            if isinstance(error, SpectrumFormatError):
                 warning_msg = (f"Файл {os.path.basename(filepath)} не содержит числовых данных в ожидаемом формате"
                               if self.language == 'ru' else
                               f"File {os.path.basename(filepath)} contains no numeric data in expected format")
                 QMessageBox.warning(self, "Предупреждение" if self.language == 'ru' else "Warning", warning_msg)
-                return [], []
-                
-            return x, y
-            
-        except Exception as e:
-            error_msg = (f"Ошибка чтения файла {filepath}: {str(e)}" if self.language == 'ru'
-                        else f"Error reading file {filepath}: {str(e)}")
-            QMessageBox.warning(self, "Ошибка" if self.language == 'ru' else "Error", error_msg)
-            return [], []
+            else:
+                error_msg = (f"Ошибка чтения файла {filepath}: {str(error)}" if self.language == 'ru'
+                            else f"Error reading file {filepath}: {str(error)}")
+                QMessageBox.warning(self, "Ошибка" if self.language == 'ru' else "Error", error_msg)
+    
+    def refresh_datasets_list(self, current_name=None):
+        """Обновление списка наборов данных и подписей загрузки"""
+        self.datasets_list.blockSignals(True)
+        self.datasets_list.clear()
+        for dataset in self.workspace:
+            role = ("образец" if dataset.role == 'sample' else "стандарт") if self.language == 'ru' else dataset.role
+            item = QListWidgetItem(f"{dataset.name} [{role}]")
+            item.setData(Qt.UserRole, dataset.name)
+            self.datasets_list.addItem(item)
+            if dataset.name == current_name:
+                self.datasets_list.setCurrentItem(item)
+        self.datasets_list.blockSignals(False)
+        
+        not_uploaded = "Не загружено" if self.language == 'ru' else "Not uploaded"
+        for role, label in (('sample', self.sample_label), ('standard', self.standard_label)):
+            names = [d.name for d in self.workspace.by_role(role)]
+            label.setText(", ".join(names) if names else not_uploaded)
+        
+        dataset = self.selected_dataset()
+        if dataset is not None:
+            self.plot_spectra(dataset.name)
+        elif 'spectra' in self.canvases:
+            figure, canvas = self.canvases['spectra']
+            figure.clear()
+            canvas.draw()
+    
+    def selected_dataset(self):
+        """Набор, выбранный в списке (или последний загруженный)"""
+        item = self.datasets_list.currentItem()
+        if item is not None:
+            return self.workspace[item.data(Qt.UserRole)]
+        datasets = list(self.workspace)
+        return datasets[-1] if datasets else None
+    
+    def on_dataset_selected(self, current, previous):
+        if current is not None:
+            self.plot_spectra(current.data(Qt.UserRole))
+    
+    def remove_selected_dataset(self):
+        """Удаление выбранного набора из рабочего пространства"""
+        item = self.datasets_list.currentItem()
+        if item is None:
+            return
+        self.workspace.remove(item.data(Qt.UserRole))
+        self.refresh_datasets_list()
+        self.update_btn.setEnabled(len(self.workspace) > 0)
 
     def simpson_nonuniform(self, x, f):
         """Метод Симпсона для неравномерной сетки"""
-        if len(x) < 2:
-            return 0.0
-            
-        N = len(x) - 1
-        h = [x[i + 1] - x[i] for i in range(N)]
-        assert N > 0
-        result = 0.0
-        for i in range(1, N, 2):
-            h0, h1 = h[i - 1], h[i]
-            hph, hdh, hmh = h1 + h0, h1 / h0, h1 * h0
-            result += (hph / 6) * ((2 - hdh) * f[i - 1] + (hph**2 / hmh) * f[i] + (2 - 1 / hdh) * f[i + 1])
-        if N % 2 == 1:
-            h0, h1 = h[N - 2], h[N - 1]
-            result += f[N] * (2 * h1 ** 2 + 3 * h0 * h1) / (6 * (h0 + h1))
-            result += f[N - 1] * (h1 ** 2 + 3 * h1 * h0) / (6 * h0)
-            result -= f[N - 2] * h1 ** 3 / (6 * h0 * (h0 + h1))
-        return result
+        return simpson_nonuniform(x, f)
     
     def trapezoid_rule(self, x, f):
         """Метод трапеций"""
-        if len(x) < 2:
-            return 0.0
-            
-        N = len(x) - 1
-        dx = [x[i+1] - x[i] for i in range(N)]
-        result = 0.0
-        for i in range(N):
-            result += dx[i] * (f[i+1] + f[i]) / 2
-        return result
+        return trapezoid_rule(x, f)
     
-    def calculate_integrals(self, data_type):
-        """Расчет интегралов с возможностью обрезки"""
-        emission_x = self.data[data_type]['emission_x']
-        emission_y = self.data[data_type]['emission_y']
-        
-        integrals_simpson = []
-        integrals_trapezoid = []
-        
-        for i in range(len(emission_x)):
-            if len(emission_x[i]) > 1:
-                # Применяем обрезку если включена
-                x_trimmed, y_trimmed = self.trim_spectrum(emission_x[i], emission_y[i])
-                
-                if len(x_trimmed) > 1:
-                    integral_s = self.simpson_nonuniform(x_trimmed, y_trimmed)
-                    integral_t = self.trapezoid_rule(x_trimmed, y_trimmed)
-                    integrals_simpson.append(integral_s)
-                    integrals_trapezoid.append(integral_t)
-        
-        self.data[data_type]['integrals_simpson'] = integrals_simpson
-        self.data[data_type]['integrals_trapezoid'] = integrals_trapezoid       
-        
-        return integrals_simpson, integrals_trapezoid
+    def calculate_integrals(self, data_type, hv):
+        """Расчет ex_pic и интегралов набора с возможностью обрезки"""
+        results = self.workspace[data_type].compute(hv, self.trim_window())
+        return results['integrals_simpson'], results['integrals_trapezoid']
     
     def linear_regression(self, x, y):
         """Линейная регрессия МНК"""
-        if len(x) < 2:
-            return 0, 0
-            
-        n = len(x)
-        sum_xy = sum(x_i * y_i for x_i, y_i in zip(x, y))
-        sum_x = sum(x)
-        sum_y = sum(y)
-        sum_x2 = sum(x_i**2 for x_i in x)
-        
-        denominator = n * sum_x2 - sum_x**2
-        if denominator == 0:
-            return 0, 0
-            
-        a = (n * sum_xy - sum_x * sum_y) / denominator
-        b = (sum_y - a * sum_x) / n
-        
-        return a, b
+        return linear_regression(x, y)
     
+    @tab_plot('spectra')
     def plot_spectra(self, data_type):
-        """Построение спектров с учетом обрезки"""
-        self.spectra_figure.clear()
-        
-        emission_x = self.data[data_type]['emission_x']
-        emission_y = self.data[data_type]['emission_y']
-        absorption_x = self.data[data_type]['absorption_x']
-        absorption_y = self.data[data_type]['absorption_y']
-        
-        if emission_x and absorption_x:
-            ax1 = self.spectra_figure.add_subplot(121)
-            for i, (x, y) in enumerate(zip(emission_x, emission_y)):
-                # Применяем обрезку если включена
-                x_trimmed, y_trimmed = self.trim_spectrum(x, y)
-                ax1.plot(x_trimmed, y_trimmed, label=f'Эмиссия {i+1}' if self.language == 'ru' else f'Emission {i+1}')
-            ax1.set_xlabel('Длина волны (нм)' if self.language == 'ru' else "Wavelength (nm)")
-            ax1.set_ylabel('Абсолютная интенсивность' if self.language == 'ru' else "Absolute intensity")
-            ax1.set_title(f'Спектры эмиссии ({data_type})' if self.language == 'ru' else f'Emission spectra ({data_type})')
-            ax1.legend()
-            ax1.grid(True, alpha=0.3)
-            
-            ax2 = self.spectra_figure.add_subplot(122)
-            for i, (x, y) in enumerate(zip(absorption_x, absorption_y)):
-                ax2.plot(x, y, label=f'Абсорбция {i+1}' if self.language == 'ru' else f"Absorption {i+1}")
-            ax2.set_xlabel('Длина волны (нм)' if self.language == 'ru' else "Wavelength (nm)")
-            ax2.set_ylabel('Оптическая плотность' if self.language == 'ru' else "Optical density")
-            ax2.set_title(f'Спектры абсорбции ({data_type})' if self.language == 'ru' else f"Absorption spectra ({data_type})")
-            ax2.legend()
-            ax2.grid(True, alpha=0.3)
+        """Построение спектров набора data_type с учетом обрезки"""
+        figure, canvas = self.plot_canvas('spectra')
+        figure.clear()
+        
+        dataset = self.workspace[data_type]
+        ax1 = draw_spectra(figure, dataset, self.trim_window(), self.smoothing_parameters(), self.language,
+                           self.spectral_domain())
+        if ax1 is not None:
+            # Диапазон интегрирования можно выделить мышью прямо на графике
+            from matplotlib.widgets import SpanSelector
+            self.span_selector = SpanSelector(ax1, self.on_span_select, 'horizontal', useblit=True,
+                                              interactive=True, onmove_callback=self.on_span_select,
+                                              props=dict(alpha=0.2, facecolor='tab:green'))
+            window = domain_window(dataset.effective_trim(self.trim_window()), self.spectral_domain())
+            if window is not None:
+                self.span_selector.extents = window
             
-            self.spectra_figure.tight_layout()
-            self.spectra_canvas.draw()        
+            figure.tight_layout()
+        canvas.draw()        
+    
+    def plot_canvas(self, key):
+        """Фигура и холст вкладки key; создаются при первом обращении"""
+        if key not in self.canvases:
+            Figure, FigureCanvas = load_matplotlib_qt()
+            figure = Figure(figsize=(10, 6))
+            canvas = FigureCanvas(figure)
+            self.plot_tabs[key].layout().addWidget(canvas)
+            self.canvases[key] = (figure, canvas)
+        return self.canvases[key]
+    
+    def defer_plot(self, key, plot, *args):
+        """Откладывает построение графика скрытой вкладки до ее открытия"""
+        if self.tabs.currentWidget() is self.plot_tabs[key]:
+            self.pending_plots.pop(key, None)
+            return False
+        self.pending_plots[key] = functools.partial(plot, *args)
+        return True
+    
+    def on_tab_changed(self, index):
+        """Построение отложенного графика открытой вкладки"""
+        for key, tab in self.plot_tabs.items():
+            if tab is self.tabs.widget(index) and key in self.pending_plots:
+                self.pending_plots.pop(key)()
+        if self.tabs.widget(index) is self.diagnostics_tab:
+            self.refresh_diagnostics()
+    
+    def refresh_diagnostics(self):
+        """Заполнение таблицы диагностики статистикой профилировщика"""
+        if self.language == 'ru':
+            headers = ["Стадия", "Вызовы", "Всего, мс", "Среднее, мс", "Точки", "Точек/с", "Память, МБ (Δ)"]
+        else:
+            headers = ["Stage", "Calls", "Total, ms", "Mean, ms", "Points", "Points/s", "Memory, MB (Δ)"]
+        self.diagnostics_table.setHorizontalHeaderLabels(headers)
+        
+        stats = sorted(PROFILER.stats.items(), key=lambda item: -item[1]['time'])
+        self.diagnostics_table.setRowCount(len(stats))
+        for row, (name, stat) in enumerate(stats):
+            rate = stat['points'] / stat['time'] if stat['time'] > 0 else 0
+            values = [name, str(stat['calls']), f"{1000 * stat['time']:.2f}",
+                      f"{1000 * stat['time'] / stat['calls']:.3f}", str(stat['points']), f"{rate:.0f}",
+                      f"{stat['memory'] / 2**20:.1f} ({stat['memory_delta'] / 2**20:+.1f})"]
+            for column, value in enumerate(values):
+                self.diagnostics_table.setItem(row, column, QTableWidgetItem(value))
+        self.diagnostics_table.resizeColumnsToContents()
+        self.memory_label.setText(self.memory_text())
+    
+    def memory_text(self):
+        """Строка использования памяти спектрами"""
+        usage = MEMORY.usage()
+        mb = lambda value: f"{value / 2**20:.1f}"
+        budget = mb(usage['budget']) if usage['budget'] is not None else "∞"
+        if self.language == 'ru':
+            return (f"Память: {mb(usage['total'])} из {budget} МБ (спектры {mb(usage['raw'])}, "
+                    f"производные {mb(usage['derived'])}, результаты {mb(usage['results'])}, "
+                    f"кэш файлов {mb(usage['parse_cache'])}); выгружено наборов: {usage['spilled']}")
+        return (f"Memory: {mb(usage['total'])} of {budget} MB (spectra {mb(usage['raw'])}, "
+                f"derived {mb(usage['derived'])}, results {mb(usage['results'])}, "
+                f"file cache {mb(usage['parse_cache'])}); datasets spilled: {usage['spilled']}")
+    
+    def apply_memory_settings(self):
+        """Применение бюджета памяти и режима float32"""
+        text = self.memory_budget_input.text().strip()
+        try:
+            budget = int(float(text) * 2**20) if text else None
+        except ValueError:
+            error_msg = "Некорректный бюджет памяти!" if self.language == 'ru' else "Invalid memory budget!"
+            QMessageBox.warning(self, "Ошибка" if self.language == 'ru' else "Error", error_msg)
+            return
+        MEMORY.configure(budget, self.float32_checkbox.isChecked())
+        self.refresh_diagnostics()
+    
+    def reset_diagnostics(self):
+        PROFILER.reset()
+        self.refresh_diagnostics()
+    
+    def save_trace(self):
+        """Сохранение трассировки в формате Chrome trace"""
+        path, _ = QFileDialog.getSaveFileName(self,
+            "Сохранить трассировку" if self.language == 'ru' else "Save trace",
+            "trace.json", "Chrome trace (*.json)")
+        if not path:
+            return
+        try:
+            PROFILER.save_trace(path)
+        except Exception as e:
+            error_msg = (f"Ошибка при сохранении трассировки: {str(e)}" if self.language == 'ru'
+                        else f"Error saving trace: {str(e)}")
+            QMessageBox.warning(self, "Ошибка" if self.language == 'ru' else "Error", error_msg)
     
     def update_plot_labels(self):
         """Обновляет подписи на графиках без перерасчета данных"""
@@ -837,10 +5906,17 @@ class SpectroscopyApp(QMainWindow):
             self.tabs.setTabText(0, "Спектры")
             self.tabs.setTabText(1, "Интегралы")
             self.tabs.setTabText(2, "Калибровка")
+            self.tabs.setTabText(3, "Кинетика")
+            self.tabs.setTabText(4, "Диагностика")
         else:
             self.tabs.setTabText(0, "Spectra")
             self.tabs.setTabText(1, "Integrals")
             self.tabs.setTabText(2, "Calibration")
+            self.tabs.setTabText(3, "Kinetics")
+            self.tabs.setTabText(4, "Diagnostics")
+        
+        # Обновляем подписи ролей в списке наборов
+        self.refresh_datasets_list(getattr(self.selected_dataset(), 'name', None))
         
         # Перерисовываем графики с новыми подписями
         self.redraw_all_plots()
@@ -848,183 +5924,290 @@ class SpectroscopyApp(QMainWindow):
     def redraw_all_plots(self):
         """Перерисовывает все графики с текущими данными и языком"""
         # Перерисовываем спектры если есть данные
-        if self.data['sample']['emission_x']:
-            self.plot_spectra('sample')
-        elif self.data['standard']['emission_x']:
-            self.plot_spectra('standard')
+        dataset = self.selected_dataset()
+        if dataset is not None:
+            self.plot_spectra(dataset.name)
         
-        # Перерисовываем интегралы если есть данные
-        if (self.data['sample']['ex_pic'] and self.data['sample']['integrals_simpson']):
+        # Перерисовываем интегралы и калибровку если есть данные
+        if any(d.results for d in self.workspace):
             self.plot_integrals()
-        
-        # Перерисовываем калибровку если есть данные
-        if (self.data['sample']['ex_pic'] and self.data['sample']['integrals_simpson']):
-            # Временно рассчитываем регрессию для перерисовки
-            x_ob = self.data['sample']['ex_pic']
-            y_ob = (self.data['sample']['integrals_simpson'] if self.current_method == 'simpson' 
-                   else self.data['sample']['integrals_trapezoid'])
-            
-            if len(x_ob) >= 2:
-                a_ob, b_ob = self.linear_regression(x_ob, y_ob)
-                a_st, b_st = 0, 0
-                
-                if self.data['standard']['ex_pic'] and self.data['standard']['integrals_simpson']:
-                    x_st = self.data['standard']['ex_pic']
-                    y_st = (self.data['standard']['integrals_simpson'] if self.current_method == 'simpson' 
-                           else self.data['standard']['integrals_trapezoid'])
-                    
-                    if len(x_st) >= 2:
-                        a_st, b_st = self.linear_regression(x_st, y_st)
-                
-                self.plot_calibration(a_ob, b_ob, a_st, b_st)    
+            self.plot_calibration()
+            self.plot_kinetics()
     
+    @tab_plot('integrals')
     def plot_integrals(self):
         """Построение графиков интегралов"""
-        self.integrals_figure.clear()
-        
-        # Образец
-        if self.data['sample']['ex_pic'] and self.data['sample']['integrals_simpson']:
-            ax1 = self.integrals_figure.add_subplot(121)
-            ex_pic = self.data['sample']['ex_pic']
-            integrals_s = self.data['sample']['integrals_simpson']
-            integrals_t = self.data['sample']['integrals_trapezoid']
-            
-            ax1.plot(ex_pic, integrals_s, 'ro-', label='Метод Симпсона')
-            ax1.plot(ex_pic, integrals_t, 'bo-', label='Метод трапеций')
-            ax1.set_xlabel('Интенсивность поглощения' if self.language == 'ru' else "Absorbtion intensity")
-            ax1.set_ylabel('Интегральная интенсивность эмиссии' if self.language == 'ru' else "Integral emission intensity")
-            ax1.set_title('Образец' if self.language == 'ru' else "Sample")
-            ax1.legend()
-            ax1.grid(True, alpha=0.3)
-        
-        # Стандарт
-        if self.data['standard']['ex_pic'] and self.data['standard']['integrals_simpson']:
-            ax2 = self.integrals_figure.add_subplot(122)
-            ex_pic = self.data['standard']['ex_pic']
-            integrals_s = self.data['standard']['integrals_simpson']
-            integrals_t = self.data['standard']['integrals_trapezoid']
-            
-            ax2.plot(ex_pic, integrals_s, 'ro-', label='Метод Симпсона')
-            ax2.plot(ex_pic, integrals_t, 'bo-', label='Метод трапеций')
-            ax2.set_xlabel('Интенсивность поглощения' if self.language == 'ru' else "Absorbtion intensity")
-            ax2.set_ylabel('Интегральная интенсивность эмиссии' if self.language == 'ru' else "Integral emission intensity")
-            ax2.set_title('Стандарт' if self.language == 'ru' else "Standard")
-            ax2.legend()
-            ax2.grid(True, alpha=0.3)
-        
-        self.integrals_figure.tight_layout()
-        self.integrals_canvas.draw()
-    
-    def plot_calibration(self, a_ob, b_ob, a_st, b_st):
-        """Построение калибровочных кривых"""
-        self.calibration_figure.clear()
-        
-        # Образец
-        if self.data['sample']['ex_pic'] and self.data['sample']['integrals_simpson']:
-            ax1 = self.calibration_figure.add_subplot(121)
-            x_ob = self.data['sample']['ex_pic']
-            y_ob = self.data['sample']['integrals_simpson'] if self.current_method == 'simpson' else self.data['sample']['integrals_trapezoid']
-            
-            ax1.plot(x_ob, y_ob, 'ro', label='Экспериментальные точки' if self.language == 'ru' else "Experimental points")
-            
-            # Линия регрессии
-            x_line = np.array([0, max(x_ob)])
-            y_line = a_ob * x_line + b_ob
-            ax1.plot(x_line, y_line, 'b-', label=f'y = {a_ob:.4f}x + {b_ob:.4f}')
-            
-            ax1.set_xlabel('Интенсивность поглощения' if self.language == 'ru' else "Absorbtion intensity")
-            ax1.set_ylabel('Интегральная интенсивность эмиссии' if self.language == 'ru' else "Integral emission intensity")
-            ax1.set_title('Калибровка: Образец' if self.language == 'ru' else "Calibration: Sample")
-            ax1.legend()
-            ax1.grid(True, alpha=0.3)
-        
-        # Стандарт
-        if self.data['standard']['ex_pic'] and self.data['standard']['integrals_simpson']:
-            ax2 = self.calibration_figure.add_subplot(122)
-            x_st = self.data['standard']['ex_pic']
-            y_st = self.data['standard']['integrals_simpson'] if self.current_method == 'simpson' else self.data['standard']['integrals_trapezoid']
-            
-            ax2.plot(x_st, y_st, 'ro', label='Экспериментальные точки' if self.language == 'ru' else "Experimental points")
-            
-            # Линия регрессии
-            x_line = np.array([0, max(x_st)])
-            y_line = a_st * x_line + b_st
-            ax2.plot(x_line, y_line, 'b-', label=f'y = {a_st:.4f}x + {b_st:.4f}')
-            
-            ax2.set_xlabel('Интенсивность поглощения' if self.language == 'ru' else "Absorbtion intensity")
-            ax2.set_ylabel('Интегральная интенсивность эмиссии' if self.language == 'ru' else "Integral emission intensity")
-            ax2.set_title('Калибровка: Стандарт' if self.language == 'ru' else "Calibration: Standard")
-            ax2.legend()
-            ax2.grid(True, alpha=0.3)
-        
-        self.calibration_figure.tight_layout()
-        self.calibration_canvas.draw()
-    
-    def calculate_quantum_yield(self, a_ob, a_st):
-        """Расчет квантового выхода"""
-        # Диалог для ввода параметров
-        title = "Квантовый выход стандарта" if self.language == 'ru' else "Standard quantum yield"
-        label = "Введите квантовый выход стандарта (%):" if self.language == 'ru' else "Enter standard quantum yield (%):"
+        figure, canvas = self.plot_canvas('integrals')
+        figure.clear()
+        draw_integrals(figure, self.workspace, self.language)
+        figure.tight_layout()
+        canvas.draw()
+    
+    @tab_plot('calibration')
+    def plot_calibration(self):
+        """Построение калибровочных кривых; точки исключаются щелчком (см. on_calibration_pick)"""
+        figure, canvas = self.plot_canvas('calibration')
+        figure.clear()
+        if self.calibration_pick_cid is None:
+            self.calibration_pick_cid = canvas.mpl_connect('pick_event', self.on_calibration_pick)
+        self.calibration_artists = draw_calibration(figure, self.workspace, self.current_method,
+                                                    self.language, picker=5)
+        figure.tight_layout()
+        canvas.draw()
+    
+    @tab_plot('kinetics')
+    def plot_kinetics(self):
+        """Кинетика серий спектров: интегральная интенсивность и QY во времени"""
+        figure, canvas = self.plot_canvas('kinetics')
+        figure.clear()
+        try:
+            hv = float(self.wavelength_input.text())
+        except ValueError:
+            canvas.draw()
+            return
+        kinetics = self.workspace.kinetics(hv, self.current_method, self.trim_window(),
+                                           self.smoothing_parameters(), self.spectral_domain())
+        if not kinetics:
+            figure.text(0.5, 0.5, "Нет файлов с сериями спектров" if self.language == 'ru'
+                        else "No files with spectrum series", ha='center', va='center')
+            canvas.draw()
+            return
+        kinetics_qy = None
+        parameters = self.live_qy_parameters()
+        if parameters is not None:
+            kinetics_qy = self.workspace.kinetics_quantum_yield(kinetics, self.current_method, *parameters)
+        try:
+            interval = float(self.kinetics_interval_input.text())
+        except ValueError:
+            interval = None
+        draw_kinetics(figure, kinetics, kinetics_qy, interval if interval and interval > 0 else None,
+                      self.language)
+        figure.tight_layout()
+        canvas.draw()
+    
+    def ask_refractive_index(self, dataset):
+        """Диалог выбора растворителя набора; возвращает n или None при отмене"""
+        if self.language == 'ru':
+            solvents = {"Вода": 1.348, "Этанол": 1.3688, "Метанол": 1.3284, "Дихлорметан": 1.439, "Другой": "a"}
+            role = "образца" if dataset.role == 'sample' else "стандарта"
+            title = f"Растворитель {role}"
+            label = f"Выберите растворитель для {role} {dataset.name}:"
+            index_title = f"Показатель преломления {role}"
+            index_label = f"Введите показатель преломления {role} {dataset.name}:"
+        else:
+            solvents = {"Water": 1.348, "Ethanol": 1.3688, "Methanol": 1.3284, "Dichloromethane": 1.439, "Another": "a"}
+            role = "sample" if dataset.role == 'sample' else "standard"
+            title = f"Solvent of the {role}"
+            label = f"Choose a solvent for the {role} {dataset.name}:"
+            index_title = f"Refractive index of the {role}"
+            index_label = f"Enter the refractive index of the {role} {dataset.name}:"
         
-        qy_st, ok = QInputDialog.getDouble(self, title, label, 4.2, 0, 100, 2)
+        solvent, ok = QInputDialog.getItem(self, title, label, list(solvents.keys()), 0, False)
         if not ok:
             return None
+        n = solvents[solvent]
+        if n == "a":
+            default = self.qy_parameters['refractive'].get(dataset.name, 1.3333)
+            n, ok = QInputDialog.getDouble(self, index_title, index_label, default, 0, 20, 4)
+            if not ok:
+                return None
+        return n
+    
+    def calculate_quantum_yield(self):
+        """Расчет квантовых выходов для всех пар образец x стандарт"""
+        # Сохраненные параметры используются без диалогов, если они полны
+        if self.reuse_qy_checkbox.isChecked():
+            qy_standards = self.qy_parameters['qy_standards']
+            refractive = self.qy_parameters['refractive']
+            if (all(d.name in qy_standards for d in self.workspace.by_role('standard')) and
+                    all(d.name in refractive for d in self.workspace)):
+                return self.workspace.quantum_yield_matrix(self.current_method, qy_standards, refractive)
+        
+        # Диалог для ввода параметров каждого стандарта
+        title = "Квантовый выход стандарта" if self.language == 'ru' else "Standard quantum yield"
+        qy_standards = {}
+        for standard in self.workspace.by_role('standard'):
+            label = (f"Введите квантовый выход стандарта {standard.name} (%):" if self.language == 'ru'
+                     else f"Enter quantum yield of the standard {standard.name} (%):")
+            default = self.qy_parameters['qy_standards'].get(standard.name, 4.2)
+            qy_st, ok = QInputDialog.getDouble(self, title, label, default, 0, 100, 2)
+            if not ok:
+                return None
+            qy_standards[standard.name] = qy_st
         
-        question = "Образец и стандарт в одном растворителе?" if self.language == 'ru' else "Sample and standard in the same solvent?"
+        question = "Образцы и стандарты в одном растворителе?" if self.language == 'ru' else "Samples and standards in the same solvent?"
         solvent_same = QMessageBox.question(self, "Растворитель" if self.language == 'ru' else "Solvent", 
                                           question, QMessageBox.Yes | QMessageBox.No)
         
-        if solvent_same == QMessageBox.Yes:
-            n_o, n_s = 1, 1
-        else:
-            if self.language == 'ru':
-                solvents = {"Вода": 1.348, "Этанол": 1.3688, "Метанол": 1.3284, "Дихлорметан": 1.439, "Другой": "a"}
-                
-                solvent_ob, ok = QInputDialog.getItem(self, "Растворитель образца", 
-                                                    "Выберите растворитель для образца:", list(solvents.keys()), 0, False)
-                if ok:
-                    n_o = solvents[solvent_ob]
-                    if n_o == "a":
-                        n_o, ok = QInputDialog.getDouble(self, "Показатель преломления образца", 
-                                             "Введите показатель преломления образца (%):", 1.3333, 0, 20, 4)
-                    if not ok:
-                        return None
-                
-                solvent_st, ok = QInputDialog.getItem(self, "Растворитель стандарта", 
-                                                    "Выберите растворитель для стандарта:", list(solvents.keys()), 0, False)
-                if ok:
-                    n_s = solvents[solvent_st]
-                    if n_s == "a":
-                        n_s, ok = QInputDialog.getDouble(self, "Показатель преломления образца", 
-                                             "Введите показатель преломления образца:", 1.3333, 0, 20, 4)                 
+        refractive = {}
+        for dataset in self.workspace.by_role('sample') + self.workspace.by_role('standard'):
+            if solvent_same == QMessageBox.Yes:
+                refractive[dataset.name] = 1
             else:
-                solvents = {"Water": 1.348, "Ethanol": 1.3688, "Methanol": 1.3284, "Dichloromethane": 1.439, "Another": "a"}
-                
-                solvent_ob, ok = QInputDialog.getItem(self, "Sample Solvent", 
-                                                    "Enter the refractive index of the sample:", list(solvents.keys()), 0, False)
-                if ok:
-                    n_o = solvents[solvent_ob]
-                    if n_o == "a":
-                        n_o, ok = QInputDialog.getDouble(self, "Refractive index of the sample", 
-                                             "Enter the refractive index of the sample:", 1.3333, 0, 20, 4)
-                    if not ok:
-                        return None
-                
-                solvent_st, ok = QInputDialog.getItem(self, "Solvent of the standard", 
-                                                    "Choose a solvent for the standard:", list(solvents.keys()), 0, False)
-                if ok:
-                    n_s = solvents[solvent_st]
-                    if n_s == "a":
-                        n_s, ok = QInputDialog.getDouble(self, "Refractive index of the standard", 
-                                             "Enter the refractive index of the standard:", 1.3333, 0, 20, 4)                 
-        
-        # Расчет квантового выхода
-        if a_st != 0:
-            QY = qy_st * (a_ob / a_st) * (n_o / n_s) ** 2
-        else:
-            QY = 0
+                n = self.ask_refractive_index(dataset)
+                if n is None:
+                    return None
+                refractive[dataset.name] = n
+        
+        self.qy_parameters = {'qy_standards': qy_standards, 'refractive': refractive}
         
-        return QY
+        # Расчет квантовых выходов
+        return self.workspace.quantum_yield_matrix(self.current_method, qy_standards, refractive)
+    
+    def format_results(self, hv, qy_result):
+        """Текст результатов расчета"""
+        return format_results(self.workspace, hv, self.current_method, qy_result, self.trim_window(),
+                              self.language, interactive=True)
+    
+    def export_results(self):
+        """Экспорт результатов по каждому спектру, набору и паре образец/стандарт"""
+        if not any(d.results for d in self.workspace):
+            error_msg = ("Нет результатов для экспорта. Сначала выполните расчет." if self.language == 'ru'
+                        else "No results to export. Please perform the calculation first.")
+            QMessageBox.warning(self, "Предупреждение" if self.language == 'ru' else "Warning", error_msg)
+            return
+        path, selected_filter = QFileDialog.getSaveFileName(self,
+            "Экспорт результатов" if self.language == 'ru' else "Export results",
+            "results.csv", "CSV (*.csv);;Parquet (*.parquet);;HDF5 (*.h5)")
+        if not path:
+            return
+        if os.path.splitext(path)[1].lower() not in EXPORT_FORMATS:
+            path += '.' + selected_filter.split('*.')[-1].rstrip(')')
+        try:
+            tables = results_tables(self.workspace, self.trim_window(), self.qy_result, self.current_method)
+            written = export_results(path, tables)
+            success_msg = ("Результаты сохранены:\n" if self.language == 'ru' else "Results saved:\n") + "\n".join(written)
+            QMessageBox.information(self, "Успех" if self.language == 'ru' else "Success", success_msg)
+        except Exception as e:
+            error_msg = (f"Ошибка при экспорте результатов: {str(e)}" if self.language == 'ru'
+                        else f"Error exporting results: {str(e)}")
+            QMessageBox.warning(self, "Ошибка" if self.language == 'ru' else "Error", error_msg)
+    
+    def save_report(self):
+        """Многостраничный PDF-отчет текущих результатов (см. write_report)"""
+        if not any(d.results for d in self.workspace):
+            error_msg = ("Нет результатов для отчета. Сначала выполните расчет." if self.language == 'ru'
+                        else "No results for a report. Please perform the calculation first.")
+            QMessageBox.warning(self, "Предупреждение" if self.language == 'ru' else "Warning", error_msg)
+            return
+        path, _ = QFileDialog.getSaveFileName(self,
+            "Сохранить отчет" if self.language == 'ru' else "Save report", "report.pdf", "PDF (*.pdf)")
+        if not path:
+            return
+        try:
+            write_report(path, self.workspace, self.wavelength_input.text(), self.current_method,
+                         self.qy_result, self.trim_window(), self.smoothing_parameters(), self.language,
+                         domain=self.spectral_domain())
+            success_msg = f"Отчет сохранен:\n{path}" if self.language == 'ru' else f"Report saved:\n{path}"
+            QMessageBox.information(self, "Успех" if self.language == 'ru' else "Success", success_msg)
+        except Exception as e:
+            error_msg = (f"Ошибка при создании отчета: {str(e)}" if self.language == 'ru'
+                        else f"Error creating report: {str(e)}")
+            QMessageBox.warning(self, "Ошибка" if self.language == 'ru' else "Error", error_msg)
+    
+    def session_parameters(self):
+        """Параметры интерфейса и результаты для сохранения в сессии"""
+        return {
+            'hv': self.wavelength_input.text(),
+            'method_index': self.method_combo.currentIndex(),
+            'current_method': self.current_method,
+            'trim_data': self.trim_data,
+            'trim_min': self.trim_min_input.text(),
+            'trim_max': self.trim_max_input.text(),
+            'smoothing_index': self.smoothing_combo.currentIndex(),
+            'smoothing_parameter': self.smoothing_param_input.text(),
+            'domain_index': self.domain_combo.currentIndex(),
+            'bands_index': self.bands_combo.currentIndex(),
+            'bands_count': self.bands_count_input.text(),
+            'band_component': self.band_component_input.text(),
+            'qy_parameters': self.qy_parameters,
+            'qy_result': self.qy_result,
+            'results_text': self.results_text.toPlainText(),
+        }
+    
+    def apply_session_parameters(self, parameters):
+        """Восстановление параметров интерфейса из сессии"""
+        self.wavelength_input.setText(parameters['hv'])
+        self.method_combo.setCurrentIndex(parameters['method_index'])
+        self.current_method = parameters['current_method']
+        self.trim_checkbox.setChecked(parameters['trim_data'])
+        self.trim_min_input.setText(parameters['trim_min'])
+        self.trim_max_input.setText(parameters['trim_max'])
+        self.smoothing_combo.setCurrentIndex(parameters.get('smoothing_index', 0))
+        self.smoothing_param_input.setText(parameters.get('smoothing_parameter', "11"))
+        self.domain_combo.setCurrentIndex(parameters.get('domain_index', 0))
+        self.bands_combo.setCurrentIndex(parameters.get('bands_index', 0))
+        self.bands_count_input.setText(parameters.get('bands_count', "2"))
+        self.band_component_input.setText(parameters.get('band_component', ""))
+        self.qy_parameters = parameters['qy_parameters']
+        qy_result = parameters['qy_result']
+        if qy_result is not None:
+            qy_result = {key: value if key in ('samples', 'standards') else np.array(value)
+                         for key, value in qy_result.items()}
+        self.qy_result = qy_result
+        self.reuse_qy_checkbox.setChecked(bool(self.qy_parameters['refractive']))
+        self.results_text.setText(parameters['results_text'])
+    
+    def save_session(self):
+        """Сохранение текущей сессии в файл"""
+        if not len(self.workspace):
+            error_msg = "Нет данных для сохранения." if self.language == 'ru' else "No data to save."
+            QMessageBox.warning(self, "Предупреждение" if self.language == 'ru' else "Warning", error_msg)
+            return
+        path, _ = QFileDialog.getSaveFileName(self,
+            "Сохранить сессию" if self.language == 'ru' else "Save session",
+            "", f"Session (*{SESSION_EXTENSION})")
+        if not path:
+            return
+        if not path.endswith(SESSION_EXTENSION):
+            path += SESSION_EXTENSION
+        try:
+            save_session(path, self.workspace, self.session_parameters())
+            success_msg = (f"Сессия сохранена: {os.path.basename(path)}" if self.language == 'ru'
+                          else f"Session saved: {os.path.basename(path)}")
+            QMessageBox.information(self, "Успех" if self.language == 'ru' else "Success", success_msg)
+        except Exception as e:
+            error_msg = (f"Ошибка при сохранении сессии: {str(e)}" if self.language == 'ru'
+                        else f"Error saving session: {str(e)}")
+            QMessageBox.warning(self, "Ошибка" if self.language == 'ru' else "Error", error_msg)
+    
+    def open_session(self, path=None):
+        """Открытие сессии; спектры подгружаются только при необходимости"""
+        if not path:
+            path, _ = QFileDialog.getOpenFileName(self,
+                "Открыть сессию" if self.language == 'ru' else "Open session",
+                "", f"Session (*{SESSION_EXTENSION})")
+        if not path:
+            return
+        try:
+            workspace, parameters, changed = load_session(path)
+            self.workspace = workspace
+            self.apply_session_parameters(parameters)
+            correction = workspace.correction
+            self.correction_label.setText(os.path.basename(correction.source or '') if correction is not None
+                                          else "Не загружено" if self.language == 'ru' else "Not uploaded")
+            self.refresh_datasets_list()
+            self.update_btn.setEnabled(len(self.workspace) > 0)
+            self.plot_integrals()
+            self.plot_calibration()
+            
+            if changed:
+                warning_msg = ("Исходные файлы изменились после сохранения сессии:\n" if self.language == 'ru'
+                              else "Source files changed since the session was saved:\n")
+                QMessageBox.warning(self, "Предупреждение" if self.language == 'ru' else "Warning",
+                                    warning_msg + "\n".join(changed[:20]))
+        except Exception as e:
+            error_msg = (f"Ошибка при открытии сессии: {str(e)}" if self.language == 'ru'
+                        else f"Error opening session: {str(e)}")
+            QMessageBox.warning(self, "Ошибка" if self.language == 'ru' else "Error", error_msg)
+    
+    def progress_plan(self, stages, start=20, stop=95):
+        """Значения прогресс-бара после каждой стадии по их средней длительности"""
+        costs = np.array([PROFILER.mean_time(stage, 0.0) for stage in stages])
+        if costs.sum() <= 0:
+            costs = np.ones(len(stages))
+        bounds = start + (stop - start) * np.cumsum(costs) / costs.sum()
+        return dict(zip(stages, bounds.astype(int).tolist()))
     
     def perform_calculation(self):
         """Основная процедура расчета"""
@@ -1032,7 +6215,8 @@ class SpectroscopyApp(QMainWindow):
             self.progress_bar.setValue(10)
             
             # Проверка данных
-            if not self.data['sample']['emission_x']:
+            samples = self.workspace.by_role('sample')
+            if not samples:
                 error_msg = "Сначала загрузите данные образца!" if self.language == 'ru' else "Please load sample data first!"
                 QMessageBox.warning(self, "Ошибка" if self.language == 'ru' else "Error", error_msg)
                 return
@@ -1047,119 +6231,51 @@ class SpectroscopyApp(QMainWindow):
             
             self.progress_bar.setValue(20)
             
-            # ВЫЧИСЛЯЕМ ex_pic для образца с ТЕКУЩЕЙ длиной волны
-            if self.data['sample']['absorption_x']:
-                self.data['sample']['ex_pic'] = self.calculate_ex_pic(
-                    self.data['sample']['absorption_x'], 
-                    self.data['sample']['absorption_y'], 
-                    hv
-                )
-            
-            # ВЫЧИСЛЯЕМ ex_pic для стандарта с ТЕКУЩЕЙ длиной волны
-            if self.data['standard']['absorption_x']:
-                self.data['standard']['ex_pic'] = self.calculate_ex_pic(
-                    self.data['standard']['absorption_x'],
-                    self.data['standard']['absorption_y'],
-                    hv
-                )
-            
-            self.progress_bar.setValue(30)
-            
             # Определение метода
-            self.current_method = 'simpson' if self.method_combo.currentText() == "Метод Симпсона" else 'trapezoid'
-            
-            # Расчет интегралов
-            self.calculate_integrals('sample')
-            if self.data['standard']['emission_x']:
-                self.calculate_integrals('standard')
+            self.current_method = 'simpson' if self.method_combo.currentIndex() == 0 else 'trapezoid'
             
-            self.progress_bar.setValue(50)
+            # Прогресс по стадиям пропорционален их длительности в прошлых расчетах
+            progress = self.progress_plan(CALCULATION_STAGES)
             
-            # Построение графиков
-            self.plot_integrals()
+            # Расчет ex_pic (с ТЕКУЩЕЙ длиной волны) и интегралов для всех наборов
+            with PROFILER.stage('calculation.compute'):
+                self.workspace.compute(hv, self.trim_window(), self.smoothing_parameters(),
+                                       self.deconvolution_parameters(), self.spectral_domain())
             
-            self.progress_bar.setValue(70)
+            self.progress_bar.setValue(progress['calculation.compute'])
             
-            # Линейная регрессия для образца
-            x_ob = self.data['sample']['ex_pic']
-            y_ob = (self.data['sample']['integrals_simpson'] if self.current_method == 'simpson' 
-                   else self.data['sample']['integrals_trapezoid'])
-            
-            if len(x_ob) != len(y_ob) or len(x_ob) < 2:
-                error_msg = "Недостаточно данных для регрессии образца!" if self.language == 'ru' else "Not enough data for sample regression!"
-                QMessageBox.warning(self, "Ошибка" if self.language == 'ru' else "Error", error_msg)
-                return
+            # Построение графиков
+            with PROFILER.stage('calculation.plot_integrals'):
+                self.plot_integrals()
             
-            a_ob, b_ob = self.linear_regression(x_ob, y_ob)
+            self.progress_bar.setValue(progress['calculation.plot_integrals'])
             
-            # Линейная регрессия для стандарта
-            a_st, b_st = 0, 0
-            if self.data['standard']['ex_pic'] and self.data['standard']['integrals_simpson']:
-                x_st = self.data['standard']['ex_pic']
-                y_st = (self.data['standard']['integrals_simpson'] if self.current_method == 'simpson' 
-                       else self.data['standard']['integrals_trapezoid'])
-                
-                if len(x_st) == len(y_st) and len(x_st) >= 2:
-                    a_st, b_st = self.linear_regression(x_st, y_st)
+            # Для регрессии каждого образца нужно минимум две точки
+            with PROFILER.stage('calculation.regression'):
+                for dataset in samples:
+                    if len(dataset.calibration_points(self.current_method)[0]) < 2:
+                        error_msg = (f"Недостаточно данных для регрессии образца {dataset.name}!" if self.language == 'ru'
+                                     else f"Not enough data for sample regression {dataset.name}!")
+                        QMessageBox.warning(self, "Ошибка" if self.language == 'ru' else "Error", error_msg)
+                        return
+                for dataset in self.workspace:
+                    dataset.regression(self.current_method)
             
-            self.progress_bar.setValue(90)
+            self.progress_bar.setValue(progress['calculation.regression'])
             
             # Построение калибровочных кривых
-            self.plot_calibration(a_ob, b_ob, a_st, b_st)
+            with PROFILER.stage('calculation.plot_calibration'):
+                self.plot_calibration()
             
-            # Расчет квантового выхода (если есть стандарт)
-            if self.language == 'ru':
-                results_text = f"=== РЕЗУЛЬТАТЫ РАСЧЕТА ===\n\n"
-                results_text += f"Длина волны возбуждения: {hv} нм\n"
-                results_text += f"Метод интегрирования: {self.method_combo.currentText()}\n"
-                
-                if self.trim_data:
-                    results_text += f"Обрезка данных: {self.trim_min_input.text()} - {self.trim_max_input.text()} нм\n"
-                
-                results_text += f"\nОБРАЗЕЦ:\n"
-                results_text += f"Уравнение регрессии: y = {a_ob:.6f}x + {b_ob:.6f}\n"
-                results_text += f"Коэффициент наклона: {a_ob:.6f}\n\n"
-                
-                if a_st != 0:
-                    results_text += f"СТАНДАРТ:\n"
-                    results_text += f"Уравнение регрессии: y = {a_st:.6f}x + {b_st:.6f}\n"
-                    results_text += f"Коэффициент наклона: {a_st:.6f}\n\n"
-                    
-                    # Расчет квантового выхода
-                    QY = self.calculate_quantum_yield(a_ob, a_st)
-                    if QY is not None:
-                        results_text += f"КВАНТОВЫЙ ВЫХОД:\n"
-                        results_text += f"QY = {QY:.2f} %\n\n"
-                
-                results_text += "Разработчики: Шулепов Ростислав Русланович\n"
-                results_text += "Кафедра общей и неорганической химии СПбГУ"
-            else:
-                results_text = f"=== CALCULATION RESULTS ===\n\n"
-                results_text += f"Excitation wavelength: {hv} nm\n"
-                results_text += f"Integration method: {self.method_combo.currentText()}\n"
-                
-                if self.trim_data:
-                    results_text += f"Data trimming: {self.trim_min_input.text()} - {self.trim_max_input.text()} nm\n"
-                
-                results_text += f"\nSAMPLE:\n"
-                results_text += f"Regression equation: y = {a_ob:.6f}x + {b_ob:.6f}\n"
-                results_text += f"Slope coefficient: {a_ob:.6f}\n\n"
-                
-                if a_st != 0:
-                    results_text += f"STANDARD:\n"
-                    results_text += f"Regression equation: y = {a_st:.6f}x + {b_st:.6f}\n"
-                    results_text += f"Slope coefficient: {a_st:.6f}\n\n"
-                    
-                    # Расчет квантового выхода
-                    QY = self.calculate_quantum_yield(a_ob, a_st)
-                    if QY is not None:
-                        results_text += f"QUANTUM YIELD:\n"
-                        results_text += f"QY = {QY:.2f} %\n\n"
-                
-                results_text += "Developers: Shulepov Rostislav Ruslanovich\n"
-                results_text += "Department of General and Inorganic Chemistry SPbSU"
+            self.progress_bar.setValue(progress['calculation.plot_calibration'])
             
-            self.results_text.setText(results_text)
+            # Расчет квантового выхода (если есть стандарт с ненулевым наклоном)
+            self.qy_result = None
+            if any(d.regression(self.current_method)[0] != 0 for d in self.workspace.by_role('standard')):
+                self.qy_result = self.calculate_quantum_yield()
+            self.plot_kinetics()
+            
+            self.results_text.setText(self.format_results(hv, self.qy_result))
             self.progress_bar.setValue(100)
             
             success_msg = "Все расчеты успешно выполнены!" if self.language == 'ru' else "All calculations completed successfully!"
@@ -1171,9 +6287,93 @@ class SpectroscopyApp(QMainWindow):
             self.progress_bar.setValue(0)
 
 def main():
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description='Spectroscopy Data Analyzer')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='print startup timings after the first event loop iteration and exit')
+    parser.add_argument('--serve', action='store_true',
+                        help='run the local HTTP/JSON API instead of the window')
+    parser.add_argument('--host', default=SERVICE_HOST, help='service address (with --serve)')
+    parser.add_argument('--port', type=int, default=SERVICE_PORT, help='service port (with --serve)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes for the service or batch mode (default: CPU count)')
+    parser.add_argument('--parse-cache', metavar='MB',
+                        help=f'parsed-file cache limit per process, MB or "none" '
+                             f'(default: {PARSE_CACHE_MB}, or ${PARSE_CACHE_ENV})')
+    parser.add_argument('--batch-prepare', metavar='MANIFEST',
+                        help='split a campaign manifest (JSON) into shards in --queue')
+    parser.add_argument('--batch-work', action='store_true',
+                        help='process shards from --queue until none are left')
+    parser.add_argument('--batch-merge', metavar='OUTPUT',
+                        help='merge shard results from --queue into tables (.csv/.parquet/.h5)')
+    parser.add_argument('--queue', metavar='DIR', help='shared batch queue directory')
+    parser.add_argument('--shard-size', type=int, default=BATCH_SHARD_SIZE, help='jobs per shard')
+    parser.add_argument('--stale-after', type=float, default=BATCH_STALE_AFTER,
+                        help='seconds without lock heartbeat before a shard is taken over')
+    parser.add_argument('--report', metavar='MANIFEST',
+                        help='render PDF reports for every job of a campaign manifest without the window')
+    parser.add_argument('--report-dir', metavar='DIR', default='reports',
+                        help='output directory for --report (PDF per job and index.html)')
+    parser.add_argument('--language', choices=('ru', 'en'), default='ru', help='report language (with --report)')
+    parser.add_argument('--memory-budget', type=float, metavar='MB',
+                        help='memory budget for loaded spectra; older datasets are spilled to disk')
+    parser.add_argument('--float32', action='store_true', help='store spectra in single precision')
+    args, qt_args = parser.parse_known_args()
+    
+    if args.parse_cache is not None:
+        # Через окружение предел получают и процессы пулов сервиса и пакетной обработки
+        os.environ[PARSE_CACHE_ENV] = args.parse_cache
+        _spectrum_cache.max_bytes = parse_cache_limit()
+        _spectrum_cache.shrink()
+    if args.memory_budget is not None or args.float32:
+        MEMORY.configure(int(args.memory_budget * 2**20) if args.memory_budget is not None else None,
+                         args.float32)
+    
+    if args.batch_prepare or args.batch_work or args.batch_merge:
+        if not args.queue:
+            parser.error('batch mode requires --queue')
+        if args.batch_prepare:
+            print(f"shards: {prepare_batch(args.batch_prepare, args.queue, args.shard_size)}")
+        if args.batch_work:
+            print(f"processed shards: {run_batch_workers(args.queue, args.workers, args.stale_after)}")
+        if args.batch_merge:
+            status = batch_status(args.queue)
+            if status['done'] < status['shards']:
+                print(f"warning: {status['shards'] - status['done']} of {status['shards']} shards unfinished")
+            for path in merge_batch(args.queue, args.batch_merge):
+                print(path)
+        return
+    
+    if args.report:
+        records = generate_reports(args.report, args.report_dir, args.workers, args.language)
+        failed = [record for record in records if record['status'] != 'done']
+        for record in failed:
+            print(f"job {record['index']} ({record['name']}): {record['error']}")
+        print(f"reports: {len(records) - len(failed)}, failed: {len(failed)}; "
+              f"index: {os.path.join(args.report_dir, 'index.html')}")
+        return
+    
+    if args.serve:
+        serve(args.host, args.port, args.workers)
+        return
+    
+    main_start = time.perf_counter()
+    app = QApplication([sys.argv[0]] + qt_args)
+    app_created = time.perf_counter()
     window = SpectroscopyApp()
     window.show()
+    window_created = time.perf_counter()
+    
+    if args.profile_startup:
+        def report_startup():
+            shown = time.perf_counter()
+            print(f"imports:      {main_start - _IMPORT_START:.3f} s")
+            print(f"QApplication: {app_created - main_start:.3f} s")
+            print(f"main window:  {window_created - app_created:.3f} s")
+            print(f"first paint:  {shown - window_created:.3f} s")
+            print(f"total:        {shown - _IMPORT_START:.3f} s")
+            app.quit()
+        QTimer.singleShot(0, report_startup)
+    
     sys.exit(app.exec_())
 
 if __name__ == '__main__':
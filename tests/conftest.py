@@ -0,0 +1,57 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import spectroscopy_app as app  # noqa: E402
+
+CONCENTRATIONS = (0.02, 0.04, 0.06, 0.08, 0.10)
+
+
+def write_dataset(folder, scale, concentrations=CONCENTRATIONS, center=520.0, width=30.0):
+    """Синтетическая папка: плоская абсорбция = концентрация, гауссова эмиссия
+    с площадью, пропорциональной scale * концентрация (наклон калибровки
+    равен scale * площадь гауссианы единичной высоты)"""
+    os.makedirs(folder, exist_ok=True)
+    x_abs = np.arange(300.0, 601.0)
+    x_em = np.arange(400.0, 701.0)
+    for i, c in enumerate(concentrations):
+        with open(os.path.join(folder, f's{i}.txt'), 'w') as file:
+            file.writelines(f"{x:.1f},{c:.6f}\n" for x in x_abs)
+        y = scale * c * np.exp(-0.5 * ((x_em - center) / width) ** 2)
+        with open(os.path.join(folder, f's{i}.tit'), 'w') as file:
+            file.write("# header\n")
+            file.writelines(f"{x:.2f};1;2;3;4;{v:.10g}\n" for x, v in zip(x_em, y))
+    return str(folder)
+
+
+@pytest.fixture
+def campaign(tmp_path):
+    """Образец с вдвое меньшим наклоном, чем у стандарта: QY = QY стандарта / 2"""
+    return {'sample': write_dataset(tmp_path / 'sample', 500.0),
+            'standard': write_dataset(tmp_path / 'standard', 1000.0)}
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches():
+    app._spectrum_cache.clear()
+    app._content_digests.clear()
+    yield
+
+
+@pytest.fixture
+def window(monkeypatch):
+    """Главное окно без показа и без модальных диалогов"""
+    from PyQt5.QtWidgets import QApplication, QMessageBox
+    qt_app = QApplication.instance() or QApplication([])
+    for name in ('information', 'warning', 'critical'):
+        monkeypatch.setattr(QMessageBox, name, staticmethod(lambda *args, **kwargs: QMessageBox.Ok))
+    monkeypatch.setattr(QMessageBox, 'question', staticmethod(lambda *args, **kwargs: QMessageBox.No))
+    main = app.SpectroscopyApp()
+    yield main
+    main.close()
+    qt_app.processEvents()
@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+import tarfile
+import zipfile
+
+import numpy as np
+import pytest
+
+import spectroscopy_app as app
+
+
+def pack(folder, path):
+    if path.endswith('.zip'):
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for file in sorted(os.listdir(folder)):
+                archive.write(os.path.join(folder, file), file)
+    else:
+        with tarfile.open(path, 'w:gz') as archive:
+            for file in sorted(os.listdir(folder)):
+                archive.add(os.path.join(folder, file), file)
+    return path
+
+
+@pytest.mark.parametrize('name', ['sample.zip', 'sample.tar.gz'])
+def test_archive_matches_folder(campaign, tmp_path, name):
+    archive = pack(campaign['sample'], str(tmp_path / name))
+    folder_emission, folder_absorption, _ = app.load_folder(campaign['sample'])
+    app._spectrum_cache.clear()
+    emission, absorption, problems = app.load_folder(archive)
+    assert not problems
+    for loaded, expected in ((emission, folder_emission), (absorption, folder_absorption)):
+        assert loaded.names == expected.names
+        np.testing.assert_array_equal(loaded.x, expected.x)
+        np.testing.assert_array_equal(loaded.y, expected.y)
+    assert emission.sources[0] == archive + app.ARCHIVE_SEPARATOR + 's0.tit'
+    with open(os.path.join(campaign['sample'], 's0.txt'), 'rb') as file:
+        assert app.read_archive_member(archive, 's0.txt') == file.read()
+
+
+@pytest.mark.parametrize('name, sniffed', [('sample.zip', True), ('sample.tar.gz', False)])
+def test_scan_archive(campaign, tmp_path, name, sniffed):
+    archive = pack(campaign['sample'], str(tmp_path / name))
+    index = app.scan_folder(archive)
+    assert [entry['file'] for entry in index] == sorted(os.listdir(campaign['sample']))
+    assert all(entry['error'] is None for entry in index)
+    # Начало файлов читается только из zip; сжатый tar дает лишь имена и размеры
+    assert all((entry['delimiter'] is not None) == sniffed for entry in index)
+
+
+def test_archive_modules_are_imported_lazily():
+    code = "import sys, spectroscopy_app; print('tarfile' in sys.modules, 'zipfile' in sys.modules)"
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(app.__file__)).stdout
+    assert output.split() == ['False', 'False']
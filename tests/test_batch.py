@@ -0,0 +1,132 @@
+import csv
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import spectroscopy_app as app
+
+
+def write_lock(path, **owner):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(owner, file)
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+@pytest.mark.skipif(os.name != 'posix', reason="liveness probe is POSIX-only")
+def test_lock_of_dead_local_process_is_stale(tmp_path):
+    lock = tmp_path / 'shard.lock'
+    write_lock(lock, host=app._host_name(), pid=dead_pid())
+    assert app._lock_is_stale(str(lock), stale_after=3600)
+    write_lock(lock, host=app._host_name(), pid=os.getpid())
+    assert not app._lock_is_stale(str(lock), stale_after=3600)
+
+
+def test_lock_check_off_posix_never_signals(tmp_path, monkeypatch):
+    lock = tmp_path / 'shard.lock'
+    write_lock(lock, host=app._host_name(), pid=dead_pid())
+    monkeypatch.setattr(app.os, 'name', 'nt')
+    monkeypatch.setattr(app.os, 'kill', lambda *args: pytest.fail("os.kill would terminate the process on Windows"))
+    assert not app._lock_is_stale(str(lock), stale_after=3600)
+    old = time.time() - 7200
+    os.utime(lock, (old, old))
+    assert app._lock_is_stale(str(lock), stale_after=3600)
+
+
+def test_batch_campaign_end_to_end(tmp_path, campaign):
+    manifest = tmp_path / 'campaign.json'
+    manifest.write_text(json.dumps({
+        'defaults': {'standards': [campaign['standard']], 'hv': 350, 'qy_standards': {'standard': 40.0}},
+        'jobs': [campaign['sample'], {'samples': [campaign['sample']], 'method': 'trapezoid'},
+                 str(tmp_path / 'missing')],
+    }))
+    queue = str(tmp_path / 'queue')
+    assert app.prepare_batch(str(manifest), queue, shard_size=2) == 2
+    assert app.batch_worker(queue) == 2
+    assert app.batch_status(queue) == {'shards': 2, 'done': 2, 'locked': 0}
+
+    written = app.merge_batch(queue, str(tmp_path / 'merged.csv'))
+    with open(next(path for path in written if 'quantum_yield' in path), encoding='utf-8') as file:
+        rows = list(csv.DictReader(file))
+    assert sorted(int(row['job']) for row in rows) == [0, 1]
+    assert [float(row['qy_percent']) for row in rows] == pytest.approx([20.0, 20.0], rel=1e-3)
+    with open(next(path for path in written if 'errors' in path), encoding='utf-8') as file:
+        assert [int(row['job']) for row in csv.DictReader(file)] == [2]
+
+
+def single_shard_queue(tmp_path, campaign):
+    manifest = tmp_path / 'campaign.json'
+    manifest.write_text(json.dumps({'defaults': {'hv': 350}, 'jobs': [campaign['sample']]}))
+    queue = str(tmp_path / 'queue')
+    app.prepare_batch(str(manifest), queue)
+    return queue
+
+
+def slow_job(seconds):
+    def run(job, progress=None):
+        time.sleep(seconds)
+        return {'slept': seconds}
+    return run
+
+
+def test_heartbeat_keeps_long_job_from_being_taken_over(tmp_path, campaign, monkeypatch):
+    queue = single_shard_queue(tmp_path, campaign)
+    monkeypatch.setattr(app, 'run_job', slow_job(1.0))
+    lock = app.claim_shard(queue, stale_after=0.4)
+    worker = threading.Thread(target=app.run_shard, args=(queue, lock, {}, 0.4))
+    worker.start()
+    time.sleep(0.7)  # Дольше stale_after, но замок обновляется фоновым потоком
+    assert app.claim_shard(queue, stale_after=0.4) is None
+    worker.join()
+    assert app.batch_status(queue) == {'shards': 1, 'done': 1, 'locked': 0}
+
+
+def test_worker_abandons_shard_whose_lock_was_taken_over(tmp_path, campaign, monkeypatch):
+    queue = single_shard_queue(tmp_path, campaign)
+    monkeypatch.setattr(app, 'run_job', slow_job(0.3))
+    lock = app.claim_shard(queue)
+    # Другой исполнитель перехватил замок
+    write_lock(lock.path, host='other', pid=1, token='other-token')
+    assert app.run_shard(queue, lock, {}, stale_after=0.1) is None
+    with open(lock.path, encoding='utf-8') as file:
+        assert json.load(file)['token'] == 'other-token'
+    assert app.batch_status(queue)['done'] == 0
+
+
+def test_lost_lock_file_does_not_crash_worker(tmp_path, campaign, monkeypatch):
+    queue = single_shard_queue(tmp_path, campaign)
+    monkeypatch.setattr(app, 'run_job', slow_job(0.3))
+    lock = app.claim_shard(queue)
+    os.remove(lock.path)
+    assert app.run_shard(queue, lock, {}, stale_after=0.1) is None
+
+
+def test_reclaimed_shard_resumes_after_last_recorded_job(tmp_path, campaign, monkeypatch):
+    manifest = tmp_path / 'campaign.json'
+    manifest.write_text(json.dumps({'defaults': {'hv': 350}, 'jobs': [campaign['sample']] * 3}))
+    queue = str(tmp_path / 'queue')
+    app.prepare_batch(str(manifest), queue)
+    # Исполнитель успел записать задание 0 и упал посреди записи задания 1
+    partial = os.path.join(queue, 'results', 'shard-00000.partial.jsonl')
+    with open(partial, 'w', encoding='utf-8') as file:
+        file.write(json.dumps({'index': 0, 'samples': None, 'status': 'done', 'result': 'before crash'}) + '\n')
+        file.write('{"index": 1, "samp')
+
+    calls = []
+    monkeypatch.setattr(app, 'run_job', lambda job, progress=None: calls.append(job) or 'resumed')
+    assert app.batch_worker(queue) == 1
+    assert len(calls) == 2
+    with open(os.path.join(queue, 'results', 'shard-00000.json'), encoding='utf-8') as file:
+        results = json.load(file)
+    assert [(r['index'], r['result']) for r in results] == [(0, 'before crash'), (1, 'resumed'), (2, 'resumed')]
+    assert not os.path.exists(partial)
+    assert app.batch_status(queue) == {'shards': 1, 'done': 1, 'locked': 0}
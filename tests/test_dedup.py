@@ -0,0 +1,69 @@
+import os
+import shutil
+import zipfile
+
+import pytest
+
+import spectroscopy_app as app
+
+
+@pytest.fixture
+def folder_with_copies(campaign):
+    folder = campaign['sample']
+    for ext in ('tit', 'txt'):
+        shutil.copy(os.path.join(folder, f's0.{ext}'), os.path.join(folder, f'zcopy.{ext}'))
+    return folder
+
+
+def zip_folder(folder, path):
+    with zipfile.ZipFile(path, 'w') as archive:
+        for file in sorted(os.listdir(folder)):
+            archive.write(os.path.join(folder, file), file)
+    return str(path)
+
+
+def check_duplicates(emission, absorption, problems, source):
+    assert 'zcopy' not in emission.names and 'zcopy' not in absorption.names
+    duplicates = sorted((os.path.basename(path), os.path.basename(error.original))
+                        for path, error in problems if isinstance(error, app.DuplicateSpectrumError))
+    assert duplicates == [(source('zcopy.tit'), source('s0.tit')), (source('zcopy.txt'), source('s0.txt'))]
+    assert len(problems) == 2
+
+
+def test_folder_copies_are_skipped(folder_with_copies):
+    check_duplicates(*app.load_folder(folder_with_copies), source=lambda name: name)
+    emission, absorption, problems = app.load_folder(folder_with_copies, keep_duplicates=True)
+    assert 'zcopy' in emission.names and 'zcopy' in absorption.names and not problems
+
+
+def test_archive_copies_are_skipped(folder_with_copies, tmp_path):
+    archive = zip_folder(folder_with_copies, tmp_path / 'sample.zip')
+    check_duplicates(*app.load_folder(archive), source=lambda name: f'sample.zip{app.ARCHIVE_SEPARATOR}{name}')
+    emission, _, problems = app.load_folder(archive, keep_duplicates=True)
+    assert 'zcopy' in emission.names and not problems
+
+
+def test_copies_share_parse_cache_entries(folder_with_copies):
+    app.load_folder(folder_with_copies, keep_duplicates=True)
+    # Копии совпадают с s0: разобраны 5 спектров эмиссии и 5 абсорбции
+    assert len(app._spectrum_cache) == 10
+
+
+def test_digest_cache_is_bounded(folder_with_copies, tmp_path, monkeypatch):
+    monkeypatch.setattr(app._content_digests, 'max_entries', 3)
+    archive = zip_folder(folder_with_copies, tmp_path / 'sample.zip')
+    for _ in range(2):
+        check_duplicates(*app.load_folder(folder_with_copies), source=lambda name: name)
+        # Хэши архива берутся из текущего чтения, а не из вытесненных записей
+        check_duplicates(*app.load_folder(archive), source=lambda name: f'sample.zip{app.ARCHIVE_SEPARATOR}{name}')
+        assert len(app._content_digests) == 3
+
+
+def test_digest_cache_evicts_least_recently_used():
+    cache = app.DigestCache(max_entries=2)
+    cache['a'] = 1
+    cache['b'] = 2
+    assert cache.get('a') == 1
+    cache['c'] = 3
+    assert list(cache) == ['a', 'c']
+    assert cache.get('b') is None
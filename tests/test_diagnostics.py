@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+import spectroscopy_app as app
+
+
+def brute_force(x, y):
+    """Диагностика n повторными регрессиями по формулам из определений"""
+    n = len(x)
+    X = np.column_stack((x, np.ones(n)))
+    (a, b), *_ = np.linalg.lstsq(X, y, rcond=None)
+    fitted = X @ (a, b)
+    s2 = np.sum((y - fitted) ** 2) / (n - 2)
+    leverage = np.diag(X @ np.linalg.inv(X.T @ X) @ X.T)
+    slope, intercept, studentized, cooks = (np.empty(n) for _ in range(4))
+    for i in range(n):
+        keep = np.arange(n) != i
+        (a_i, b_i), *_ = np.linalg.lstsq(X[keep], y[keep], rcond=None)
+        slope[i], intercept[i] = a_i, b_i
+        s2_i = np.sum((y[keep] - X[keep] @ (a_i, b_i)) ** 2) / (n - 3)
+        variance = 1 + X[i] @ np.linalg.inv(X[keep].T @ X[keep]) @ X[i]
+        studentized[i] = (y[i] - X[i] @ (a_i, b_i)) / np.sqrt(s2_i * variance)
+        cooks[i] = np.sum((fitted - X @ (a_i, b_i)) ** 2) / (2 * s2)
+    return {'leverage': leverage, 'slope': slope, 'intercept': intercept,
+            'studentized': studentized, 'cooks': cooks}
+
+
+def test_closed_form_matches_refits():
+    rng = np.random.default_rng(5)
+    x = np.sort(rng.uniform(0.01, 0.1, 9))
+    y = 3e6 * x + 200 + rng.normal(scale=2e3, size=9)
+    diagnostics = app.regression_diagnostics(x, y)
+    for key, expected in brute_force(x, y).items():
+        np.testing.assert_allclose(diagnostics[key], expected, rtol=1e-8, err_msg=key)
+
+
+def test_outlier_is_flagged():
+    x = np.linspace(0.01, 0.1, 8)
+    y = 1e6 * x + np.array([1, -1, 2, -2, 1, -1, 2, -2]) * 100.0
+    y[4] += 5e4
+    diagnostics = app.regression_diagnostics(x, y)
+    assert diagnostics['flagged'].tolist() == [i == 4 for i in range(8)]
+
+
+def test_degenerate_inputs_give_nan():
+    small = app.regression_diagnostics([1.0, 2.0], [1.0, 2.0])
+    assert np.isnan(small['leverage']).all() and not small['flagged'].any()
+    flat = app.regression_diagnostics([1.0, 1.0, 1.0], [1.0, 2.0, 3.0])
+    assert np.isnan(flat['cooks']).all()
+    three = app.regression_diagnostics([1.0, 2.0, 3.0], [1.0, 2.5, 3.0])
+    assert np.isnan(three['studentized']).all()
+    assert three['slope'] == pytest.approx([0.5, 1.0, 1.5])
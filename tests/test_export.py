@@ -0,0 +1,56 @@
+import csv
+
+import numpy as np
+import pytest
+
+import spectroscopy_app as app
+
+
+@pytest.fixture
+def tables(campaign):
+    job = app.normalize_job({'samples': [campaign['sample']], 'standards': [campaign['standard']],
+                             'hv': 350, 'qy_standards': {'standard': 40.0}})
+    workspace, qy_result = app.solve_job(job)
+    return app.results_tables(workspace, job['trim'], qy_result, job['method'])
+
+
+def test_results_tables_columns(tables):
+    spectra = tables['spectra']
+    assert len({len(column) for column in spectra.values()}) == 1
+    assert sorted(set(spectra['dataset'])) == ['sample', 'standard']
+    assert np.isnan(spectra['integral_simpson_raw']).all()
+    np.testing.assert_allclose(spectra['residual_simpson'], 0, atol=1e-6 * spectra['integral_simpson'].max())
+
+    datasets = tables['datasets']
+    assert datasets['method'].tolist() == ['simpson', 'simpson', 'trapezoid', 'trapezoid']
+    assert datasets['n_points'].tolist() == [5, 5, 5, 5]
+    np.testing.assert_allclose(datasets['r_squared'], 1.0)
+    assert tables['quantum_yield']['qy'] == pytest.approx([20.0])
+
+
+def test_csv_export_writes_one_file_per_table(tables, tmp_path):
+    written = app.export_results(str(tmp_path / 'results.csv'), tables)
+    assert [p.rsplit('.', 2)[1] for p in written] == ['spectra', 'datasets', 'quantum_yield']
+    with open(written[0], newline='', encoding='utf-8') as file:
+        rows = list(csv.DictReader(file))
+    assert len(rows) == len(tables['spectra']['file'])
+    assert float(rows[0]['ex_pic']) == pytest.approx(tables['spectra']['ex_pic'][0])
+
+
+def test_parquet_and_hdf5_round_trip(tables, tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    h5py = pytest.importorskip('h5py')
+    written = app.export_results(str(tmp_path / 'results.parquet'), tables)
+    table = pq.read_table(written[0])
+    np.testing.assert_array_equal(table.column('integral_simpson').to_numpy(),
+                                  tables['spectra']['integral_simpson'])
+
+    path = app.export_results(str(tmp_path / 'results.h5'), tables)[0]
+    with h5py.File(path, 'r') as file:
+        np.testing.assert_array_equal(file['quantum_yield/qy'][()], tables['quantum_yield']['qy'])
+        assert file['spectra/file'].asstr()[()].tolist() == tables['spectra']['file'].tolist()
+
+
+def test_unsupported_export_format(tables, tmp_path):
+    with pytest.raises(ValueError, match="Unsupported export format"):
+        app.export_results(str(tmp_path / 'results.xlsx'), tables)
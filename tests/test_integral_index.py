@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+import spectroscopy_app as app
+
+
+@pytest.fixture
+def store():
+    rng = np.random.default_rng(11)
+    spectra = {}
+    for i, n in enumerate([0, 1, 2, 3, 6, 7, 40, 41, 200]):
+        x = np.cumsum(rng.uniform(0.3, 2.5, n)) + 400
+        spectra[f's{i}'] = (x, rng.normal(size=n) + 5)
+    return app.SpectrumStore.from_dict(spectra)
+
+
+def direct_integrals(store, x_min, x_max):
+    """Обрезка каждого спектра и прямое интегрирование"""
+    simpson, trapezoid = [], []
+    for x, y in store:
+        inside = (x >= x_min) & (x <= x_max)
+        if inside.sum() < 2:
+            simpson.append(np.nan)
+            trapezoid.append(np.nan)
+        else:
+            simpson.append(app.simpson_nonuniform(x[inside], y[inside]))
+            trapezoid.append(app.trapezoid_rule(x[inside], y[inside]))
+    return np.array(simpson), np.array(trapezoid)
+
+
+def test_bounds_match_per_spectrum_search(store):
+    index = app.IntegralIndex(store)
+    assert index.monotonic
+    for x_min, x_max in [(-np.inf, np.inf), (410.0, 450.0), (store.x[10], store.x[20]), (1e4, 2e4), (0.0, 1.0)]:
+        first, last = index.bounds(x_min, x_max)
+        for i, (x, _) in enumerate(store):
+            start = store.offsets[i]
+            assert first[i] == start + np.searchsorted(x, x_min, side='left')
+            assert last[i] == start + np.searchsorted(x, x_max, side='right') - 1
+
+
+def test_integrals_match_direct_trimming(store):
+    index = app.IntegralIndex(store)
+    rng = np.random.default_rng(12)
+    windows = [(-np.inf, np.inf), (store.x[3], store.x[30]), (405.0, 405.5)]
+    windows += [tuple(sorted(rng.uniform(395, 700, 2))) for _ in range(50)]
+    for x_min, x_max in windows:
+        simpson, trapezoid = index.integrals(x_min, x_max)
+        expected_simpson, expected_trapezoid = direct_integrals(store, x_min, x_max)
+        np.testing.assert_allclose(simpson, expected_simpson, rtol=1e-9, atol=1e-9)
+        np.testing.assert_allclose(trapezoid, expected_trapezoid, rtol=1e-9, atol=1e-9)
+
+
+def test_non_monotonic_spectra_are_flagged():
+    store = app.SpectrumStore.from_dict({'a': (np.array([1.0, 3.0, 2.0]), np.ones(3))})
+    assert not app.IntegralIndex(store).monotonic
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+import spectroscopy_app as app
+
+
+def sqz(value, positive='@ABCDEFGHI', negative=' abcdefghi'):
+    digits = str(abs(value))
+    table = positive if value >= 0 else negative
+    return table[int(digits[0])] + digits[1:]
+
+
+def dif(value):
+    return sqz(value, '%JKLMNOPQR', ' jklmnopqr')
+
+
+def dup(count):
+    digits = str(count)
+    return 'STUVWXYZs'[int(digits[0]) - 1] + digits[1:]
+
+
+def encode_difdup(ys, per_line=10):
+    """Кодирование целых ординат в DIFDUP с контрольной ординатой в начале
+    каждой следующей строки"""
+    lines, j = [], 0
+    while j + 1 < len(ys):
+        tokens = [sqz(ys[j])] + [dif(b - a) for a, b in zip(ys[j:j + per_line], ys[j + 1:j + per_line + 1])]
+        compressed, i = [], 0
+        while i < len(tokens):
+            run = 1
+            while i + run < len(tokens) and tokens[i + run] == tokens[i]:
+                run += 1
+            compressed.append(tokens[i] + (dup(run) if run > 1 else ''))
+            i += run
+        lines.append(f"{j} " + ''.join(compressed))
+        j += per_line
+    return '\n'.join(lines)
+
+
+def test_handwritten_asdf_forms():
+    expected = [100, 102, 105, 105, 105, 101, -3]
+    assert app.jcamp_ordinates("0 100 102 105 105 105 101 -3").tolist() == expected
+    assert app.jcamp_ordinates("0 A00A02A05A05A05A01c").tolist() == expected
+    assert app.jcamp_ordinates("0 A00A02A05U A01c").tolist() == expected
+    # DIF с повторением и контрольной ординатой A05 в начале второй строки
+    assert app.jcamp_ordinates("0 A00KL%T\n4 A05mj04").tolist() == expected
+
+
+def test_affn_exponents_decimals_and_missing():
+    y = app.jcamp_ordinates("400 1.5 -2.25E1 ? .5\n404 3")
+    np.testing.assert_array_equal(y[[0, 1, 3, 4]], [1.5, -22.5, 0.5, 3.0])
+    assert np.isnan(y[2])
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_difdup_round_trip(seed):
+    rng = np.random.default_rng(seed)
+    steps = rng.integers(-500, 500, 300) * (rng.random(300) < 0.7)
+    ys = (np.cumsum(steps) + rng.integers(-10 ** 6, 10 ** 6)).tolist()
+    assert app.jcamp_ordinates(encode_difdup(ys, per_line=int(rng.integers(3, 20)))).tolist() == ys
+
+
+def test_dup_without_value_is_rejected():
+    with pytest.raises(app.SpectrumFormatError):
+        app.jcamp_ordinates("0 S5")
+
+
+def test_parse_jcamp_scales_and_converts_to_nanometers():
+    ys = [10, 12, 15, 15, 11]
+    text = (f"##TITLE=test\n##JCAMP-DX=4.24\n##DATA TYPE=FLUORESCENCE SPECTRUM\n"
+            f"##XUNITS=1/CM\n##FIRSTX=20000\n##LASTX=16000\n##XFACTOR=1\n##YFACTOR=0.5\n"
+            f"##NPOINTS=5\n##XYDATA=(X++(Y..Y))\n{encode_difdup(ys, 2)}\n##END=\n")
+    kind, x, y = app.parse_jcamp(text)
+    assert kind == 'emission'
+    np.testing.assert_allclose(x, 1e7 / np.array([20000, 19000, 18000, 17000, 16000]))
+    np.testing.assert_allclose(y, np.array(ys) * 0.5)
+
+    with pytest.raises(app.SpectrumFormatError, match="NPOINTS"):
+        app.parse_jcamp(text.replace("##NPOINTS=5", "##NPOINTS=6"))
+
+
+def test_descending_axis_is_reversed():
+    text = ("##TITLE=abs\n##DATA TYPE=UV/VIS SPECTRUM\n##XUNITS=NANOMETERS\n##FIRSTX=700\n##LASTX=500\n"
+            "##NPOINTS=3\n##XYDATA=(X++(Y..Y))\n700 1 2 3\n##END=\n")
+    kind, x, y = app.parse_jcamp(text)
+    assert kind == 'absorption'
+    assert x.tolist() == [500.0, 600.0, 700.0]
+    assert y.tolist() == [3.0, 2.0, 1.0]
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+import spectroscopy_app as app
+
+
+@pytest.fixture
+def reset_kernels(monkeypatch):
+    """Выбор ядер заново для каждого теста"""
+    monkeypatch.setattr(app, '_jit_kernels', None)
+
+
+def random_segments(seed):
+    rng = np.random.default_rng(seed)
+    lengths = np.array([0, 1, 2, 3, 4, 9, 10, 0, 101, 128])
+    offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+    x = np.concatenate([np.cumsum(rng.uniform(0.1, 3.0, n)) + 250 for n in lengths])
+    y = rng.normal(size=len(x)) * 1e3
+    return x, y, offsets
+
+
+def test_numba_kernels_match_numpy(reset_kernels, monkeypatch):
+    pytest.importorskip('numba')
+    monkeypatch.delenv(app.JIT_ENV, raising=False)
+    assert app.kernel_backend() == 'numba'
+
+    x, y, offsets = random_segments(7)
+    for fast, reference in [
+        (app.segment_simpson(x, y, offsets), app.segment_simpson(x, y, offsets, jit=False)),
+        (app.segment_trapezoid(x, y, offsets), app.segment_trapezoid(x, y, offsets, jit=False)),
+    ]:
+        np.testing.assert_allclose(fast, reference, rtol=app.JIT_TOLERANCE, atol=app.JIT_TOLERANCE)
+
+    for x0 in (x[5], 260.0, 1e6):
+        np.testing.assert_array_equal(app.segment_nearest(x, y, offsets, x0),
+                                      app.segment_nearest(x, y, offsets, x0, jit=False))
+
+    assert app.linear_regression(x, y) == pytest.approx(app.linear_regression(x, y, jit=False),
+                                                        rel=app.JIT_TOLERANCE)
+
+
+def test_nearest_ties_pick_first_point(reset_kernels):
+    x = np.array([1.0, 2.0, 3.0])
+    y = np.array([10.0, 20.0, 30.0])
+    offsets = np.array([0, 3])
+    for jit in (True, False):
+        assert app.segment_nearest(x, y, offsets, 1.5, jit=jit).tolist() == [10.0]
+
+
+@pytest.mark.parametrize('offsets, expected', [
+    ([0, 2, 2, 4], [20.0, np.nan, 40.0]),
+    ([0, 2, 2], [20.0, np.nan]),
+    ([0, 0, 2], [np.nan, 20.0]),
+    ([0, 0], [np.nan]),
+])
+def test_nearest_of_empty_spectrum_is_nan(reset_kernels, offsets, expected):
+    x = np.array([1.0, 2.0, 1.0, 2.0])[:offsets[-1]]
+    y = np.array([10.0, 20.0, 30.0, 40.0])[:offsets[-1]]
+    for jit in (True, False):
+        np.testing.assert_array_equal(app.segment_nearest(x, y, np.array(offsets), 1.9, jit=jit), expected)
+
+
+def test_env_selects_numpy_backend(reset_kernels, monkeypatch):
+    monkeypatch.setenv(app.JIT_ENV, 'numpy')
+    assert app.jit_kernels() is None
+    assert app.kernel_backend() == 'numpy'
+
+
+def test_failed_verification_falls_back_to_numpy(reset_kernels, monkeypatch):
+    pytest.importorskip('numba')
+    monkeypatch.delenv(app.JIT_ENV, raising=False)
+    monkeypatch.setattr(app, '_verify_kernels', lambda kernels: False)
+    assert app.kernel_backend() == 'numpy'
+    x, y, offsets = random_segments(8)
+    np.testing.assert_array_equal(app.segment_simpson(x, y, offsets),
+                                  app.segment_simpson(x, y, offsets, jit=False))
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+import spectroscopy_app as app
+
+
+def baseline_simpson(x, f):
+    """Цикл метода Симпсона из исходной версии программы"""
+    N = len(x) - 1
+    h = [x[i + 1] - x[i] for i in range(N)]
+    result = 0.0
+    for i in range(1, N, 2):
+        h0, h1 = h[i - 1], h[i]
+        hph, hdh, hmh = h1 + h0, h1 / h0, h1 * h0
+        result += (hph / 6) * ((2 - hdh) * f[i - 1] + (hph ** 2 / hmh) * f[i] + (2 - 1 / hdh) * f[i + 1])
+    if N % 2 == 1:
+        h0, h1 = h[N - 2], h[N - 1]
+        result += f[N] * (2 * h1 ** 2 + 3 * h0 * h1) / (6 * (h0 + h1))
+        result += f[N - 1] * (h1 ** 2 + 3 * h1 * h0) / (6 * h0)
+        result -= f[N - 2] * h1 ** 3 / (6 * h0 * (h0 + h1))
+    return result
+
+
+def baseline_trapezoid(x, f):
+    return sum((x[i + 1] - x[i]) * (f[i + 1] + f[i]) / 2 for i in range(len(x) - 1))
+
+
+def random_spectra(seed, lengths):
+    rng = np.random.default_rng(seed)
+    spectra = {}
+    for i, n in enumerate(lengths):
+        x = np.cumsum(rng.uniform(0.2, 2.0, n)) + 300
+        spectra[f's{i}'] = (x, rng.normal(size=n))
+    return app.SpectrumStore.from_dict(spectra)
+
+
+@pytest.mark.parametrize('jit', [True, False])
+def test_segment_kernels_match_baseline_loops(jit):
+    store = random_spectra(0, [3, 4, 5, 8, 11, 50, 51])
+    simpson = app.segment_simpson(store.x, store.y, store.offsets, jit=jit)
+    trapezoid = app.segment_trapezoid(store.x, store.y, store.offsets, jit=jit)
+    for i, (x, y) in enumerate(store):
+        assert simpson[i] == pytest.approx(baseline_simpson(x, y), rel=1e-12, abs=1e-12)
+        assert trapezoid[i] == pytest.approx(baseline_trapezoid(x, y), rel=1e-12, abs=1e-12)
+
+
+@pytest.mark.parametrize('jit', [True, False])
+def test_two_point_simpson_is_trapezoid(jit):
+    # Исходный цикл давал h(2f0 + f1)/3 за счет индексов h[-1] и f[-1];
+    # теперь единственный отрезок интегрируется методом трапеций
+    store = random_spectra(1, [2, 5, 2])
+    simpson = app.segment_simpson(store.x, store.y, store.offsets, jit=jit)
+    for i in (0, 2):
+        x, y = store[i]
+        h = x[1] - x[0]
+        assert simpson[i] == pytest.approx(h * (y[0] + y[1]) / 2)
+        assert simpson[i] != pytest.approx(h * (2 * y[0] + y[1]) / 3)
+    assert app.simpson_nonuniform([0.0, 2.0], [1.0, 3.0]) == pytest.approx(4.0)
+
+
+def test_short_and_empty_spectra_integrate_to_zero():
+    store = random_spectra(2, [0, 1, 4, 0])
+    for jit in (True, False):
+        simpson = app.segment_simpson(store.x, store.y, store.offsets, jit=jit)
+        trapezoid = app.segment_trapezoid(store.x, store.y, store.offsets, jit=jit)
+        assert simpson[[0, 1, 3]].tolist() == [0.0, 0.0, 0.0]
+        assert trapezoid[[0, 1, 3]].tolist() == [0.0, 0.0, 0.0]
+
+
+def test_pairs_match_spectra_by_name():
+    emission = random_spectra(3, [5, 5, 5])
+    emission.names = ['a', 'b', 'c']
+    absorption = random_spectra(4, [4, 4, 4])
+    absorption.names = ['c', 'x', 'a']
+    dataset = app.Dataset('set', 'sample', 'unused', loader=lambda: (emission, absorption, []))
+
+    emission_idx, absorption_idx = dataset.pairs()
+    assert emission_idx.tolist() == [0, 2]
+    assert absorption_idx.tolist() == [2, 0]
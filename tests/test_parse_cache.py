@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+import spectroscopy_app as app
+
+
+@pytest.mark.parametrize('value, expected', [
+    (None, app.PARSE_CACHE_MB * 2**20),
+    ('64', 64 * 2**20),
+    ('0.5', 2**19),
+    ('none', None),
+    ('junk', app.PARSE_CACHE_MB * 2**20),
+])
+def test_parse_cache_limit_from_environment(monkeypatch, value, expected):
+    if value is None:
+        monkeypatch.delenv(app.PARSE_CACHE_ENV, raising=False)
+    else:
+        monkeypatch.setenv(app.PARSE_CACHE_ENV, value)
+    assert app.parse_cache_limit() == expected
+
+
+def test_shared_cache_is_bounded_by_default(monkeypatch):
+    monkeypatch.delenv(app.PARSE_CACHE_ENV, raising=False)
+    assert app._spectrum_cache.max_bytes == app.parse_cache_limit()
+    # Снятие бюджета памяти возвращает предел по умолчанию, а не снимает его
+    monkeypatch.setattr(app.MEMORY, 'budget', app.MEMORY.budget)
+    app.MEMORY.configure(2**20)
+    assert app._spectrum_cache.max_bytes == 2**18
+    app.MEMORY.configure(None)
+    assert app._spectrum_cache.max_bytes == app.parse_cache_limit()
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = app.ParseCache(max_bytes=3 * 800)
+    for key in 'abcd':
+        cache[key] = (np.zeros(50), np.zeros(50))  # 800 байт
+        cache.get('a')
+    assert list(cache) == ['c', 'd', 'a']
+    assert cache.nbytes == 3 * 800
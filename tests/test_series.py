@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+import spectroscopy_app as app
+from conftest import write_dataset
+
+
+def write_series(path, grids, rows):
+    with open(path, 'w') as file:
+        file.write("# header\n")
+        for grid, row in zip(grids, rows):
+            file.writelines(f"{x:.3f};1;2;3;4;{v:.10g}\n" for x, v in zip(grid, row))
+    return str(path)
+
+
+@pytest.mark.parametrize('descending', [False, True])
+def test_repeated_grid_is_reshaped(descending):
+    grid = np.linspace(400, 700, 31)
+    if descending:
+        grid = grid[::-1]
+    Y = np.random.default_rng(0).normal(size=(4, 31))
+    x, series = app.split_series(np.tile(grid, 4), Y.ravel())
+    np.testing.assert_array_equal(x, grid)
+    np.testing.assert_array_equal(series, Y)
+
+
+def test_different_grids_are_interpolated_to_first():
+    first = np.linspace(400, 700, 31)
+    second = np.linspace(401, 699, 50)
+    x, series = app.split_series(np.concatenate((first, second)),
+                                 np.concatenate((2 * first, 2 * second)))
+    np.testing.assert_array_equal(x, first)
+    assert series.shape == (2, 31)
+    np.testing.assert_allclose(series[0], 2 * first)
+    np.testing.assert_allclose(series[1, 1:-1], 2 * first[1:-1])
+
+
+@pytest.mark.parametrize('x', [
+    np.linspace(400, 700, 31),  # один спектр
+    np.r_[np.linspace(400, 550, 16), 549.0, np.linspace(551, 700, 15)],  # сбой порядка точек
+    np.r_[np.linspace(400, 700, 31), np.linspace(400, 410, 3)],  # короткий хвост
+    np.r_[400.0, 401.0, 400.5],  # слишком мало точек
+])
+def test_single_spectrum_is_not_split(x):
+    y = np.arange(len(x), dtype=float)
+    grid, series = app.split_series(x, y)
+    np.testing.assert_array_equal(grid, x)
+    np.testing.assert_array_equal(series, y[None, :])
+
+
+def test_series_file_readers(tmp_path):
+    grid = np.linspace(450, 650, 41)
+    Y = np.outer([1.0, 0.5, 0.25], np.exp(-0.5 * ((grid - 550) / 20) ** 2))
+    path = write_series(tmp_path / 'kinetics.tit', [grid] * 3, Y)
+
+    x, y = app.read_emission_file(path)
+    np.testing.assert_allclose(x, grid)
+    np.testing.assert_allclose(y, Y[0])
+    x, series = app.read_emission_series(path)
+    np.testing.assert_allclose(series, Y)
+
+
+def test_kinetics_integrates_every_spectrum_of_series(tmp_path):
+    folder = write_dataset(tmp_path / 'kinetics', 1000.0, concentrations=(0.05, 0.1))
+    grid = np.linspace(400, 700, 301)
+    band = np.exp(-0.5 * ((grid - 520) / 30) ** 2)
+    decay = np.array([1.0, 0.6, 0.3, 0.1])
+    write_series(tmp_path / 'kinetics' / 's1.tit', [grid] * 4, np.outer(decay, band))
+
+    dataset = app.Workspace().add(folder, 'sample')
+    kinetics = dataset.kinetics(350)
+    assert list(kinetics) == ['s1']
+    integrals = kinetics['s1']['integrals']
+    np.testing.assert_allclose(integrals / integrals[0], decay)
+    assert integrals[0] == pytest.approx(30 * np.sqrt(2 * np.pi), rel=1e-3)
+    assert kinetics['s1']['ex_pic'] == pytest.approx(0.1)
+
+
+def test_kinetics_quantum_yield_without_absorbance_is_nan(campaign):
+    workspace = app.Workspace()
+    workspace.add(campaign['sample'], 'sample')
+    standard = workspace.add(campaign['standard'], 'standard')
+    workspace.compute(350)
+    slope = standard.regression('simpson')[0]
+    integrals = np.array([0.1, 0.05]) * slope
+    kinetics = {'sample': {'absorbing': {'integrals': integrals, 'ex_pic': 0.1},
+                           'zero': {'integrals': integrals, 'ex_pic': 0.0},
+                           'missing': {'integrals': integrals, 'ex_pic': np.nan}}}
+    with np.errstate(all='raise'):
+        result = workspace.kinetics_quantum_yield(kinetics, 'simpson', {'standard': 40.0},
+                                                  {'sample': 1.0, 'standard': 1.0})
+    np.testing.assert_allclose(result['qy']['sample', 'absorbing'], [[40.0], [20.0]])
+    assert np.isnan(result['qy']['sample', 'zero']).all()
+    assert np.isnan(result['qy']['sample', 'missing']).all()
@@ -0,0 +1,212 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import urllib.error
+import urllib.request
+
+import pytest
+
+import spectroscopy_app as app
+
+
+def job(campaign, **changes):
+    payload = {'samples': [campaign['sample']], 'standards': [campaign['standard']], 'hv': 350,
+               'qy_standards': {'standard': 40.0}}
+    payload.update(changes)
+    return payload
+
+
+@pytest.mark.parametrize('changes, message', [
+    ({'samples': []}, "at least one folder"),
+    ({'samples': ['/nonexistent/folder']}, "not a folder"),
+    ({'hv': None}, "invalid job parameters"),
+    ({'method': 'midpoint'}, "unknown method"),
+    ({'smoothing': ['boxcar', 5]}, "unknown smoothing method"),
+    ({'trim': [400]}, "invalid job parameters"),
+    ({'domain': 'frequency'}, "unknown spectral domain"),
+    ({'deconvolution': {'shape': 'voigt'}}, "unknown band shape"),
+    ({'correction': '/nonexistent/curve.txt'}, "not a file"),
+    ({'samples': 5}, "must be a folder or a list of folders"),
+    ({'qy_standards': [1]}, "'qy_standards' must be a JSON object"),
+    ({'deconvolution': 'gaussian'}, "'deconvolution' must be a JSON object"),
+])
+def test_normalize_job_rejects_invalid_fields(campaign, changes, message):
+    with pytest.raises(app.JobError, match=message):
+        app.normalize_job(job(campaign, **changes))
+
+
+def test_normalize_job_requires_hv(campaign):
+    payload = job(campaign)
+    del payload['hv']
+    with pytest.raises(app.JobError, match="missing field: hv"):
+        app.normalize_job(payload)
+
+
+def test_normalize_job_rejects_non_object():
+    with pytest.raises(app.JobError, match="JSON object"):
+        app.normalize_job(['not', 'an', 'object'])
+
+
+@pytest.mark.parametrize('method', ['simpson', 'trapezoid'])
+def test_run_job_quantum_yield(campaign, method):
+    result = app.run_job(app.normalize_job(job(campaign, method=method)))
+    # Наклон образца вдвое меньше наклона стандарта
+    assert result['quantum_yield']['qy'][0] == pytest.approx([20.0], rel=1e-3)
+    datasets = {d['name']: d for d in result['datasets']}
+    assert datasets['sample']['points'] == 5
+    assert datasets['standard']['slope'] == pytest.approx(2 * datasets['sample']['slope'])
+
+
+def test_run_job_without_standard_qy_fails(campaign):
+    with pytest.raises(app.JobError, match="missing standard QY"):
+        app.run_job(app.normalize_job(job(campaign, qy_standards={})))
+
+
+def test_local_client_status_and_events(campaign):
+    client = app.LocalQYClient()
+    job_id = client.submit(job(campaign))
+    status = client.status(job_id)
+    assert status['status'] == 'done'
+    assert status['result']['quantum_yield']['qy'][0] == pytest.approx([20.0], rel=1e-3)
+
+    events = list(client.events(job_id))
+    assert [event['stage'] for event in events[:-1]] == ['load', 'load', 'load', 'compute',
+                                                         'regression', 'quantum_yield']
+    assert [event['version'] for event in events] == sorted({event['version'] for event in events})
+    assert events[-1]['status'] == 'done' and events[-1]['progress'] == 1.0
+    assert client.wait(job_id) == events[-1]
+    assert client.calculate(job(campaign)) == status['result']
+
+
+def test_local_client_failed_job(campaign):
+    client = app.LocalQYClient()
+    job_id = client.submit(job(campaign, qy_standards={}))
+    assert client.status(job_id)['status'] == 'failed'
+    assert "missing standard QY" in client.status(job_id)['error']
+    with pytest.raises(app.JobError, match="missing standard QY"):
+        client.calculate(job(campaign, qy_standards={}))
+
+
+def test_local_client_rejects_invalid_job_and_unknown_id(campaign):
+    client = app.LocalQYClient()
+    with pytest.raises(app.JobError):
+        client.submit(job(campaign, method='midpoint'))
+    with pytest.raises(app.JobError, match="unknown job"):
+        client.status('missing')
+    with pytest.raises(app.JobError, match="unknown job"):
+        client.events('missing')
+
+
+def test_service_modules_are_imported_lazily():
+    modules = ('multiprocessing', 'urllib.request', 'http.server', 'concurrent.futures.process')
+    code = f"import sys, spectroscopy_app; print([m for m in {modules!r} if m in sys.modules])"
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(app.__file__)).stdout
+    assert output.strip() == '[]'
+
+
+def start_server(tag=''):
+    code = f'import spectroscopy_app as a; a.serve(port=0, workers=1)  # {tag}'
+    server = subprocess.Popen([sys.executable, '-c', code], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              text=True, cwd=os.path.dirname(app.__file__))
+    url = re.search(r'http://\S+', server.stdout.readline()).group().rstrip('/')
+    return server, url
+
+
+def processes_with(tag):
+    """Процессы, в командной строке которых есть метка (включая дочерние fork-процессы)"""
+    found = []
+    for pid in filter(str.isdigit, os.listdir('/proc')):
+        try:
+            with open(f'/proc/{pid}/cmdline', 'rb') as f:
+                if tag.encode() in f.read():
+                    found.append(int(pid))
+        except OSError:
+            pass
+    return found
+
+
+@pytest.fixture(scope='module')
+def service_url():
+    server, url = start_server()
+    try:
+        yield url
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+
+
+def test_http_service_round_trip(campaign, service_url):
+    client = app.QYServiceClient(service_url)
+    result = client.calculate(job(campaign))
+    assert result['quantum_yield']['qy'][0] == pytest.approx([20.0], rel=1e-3)
+    with pytest.raises(app.JobError, match="unknown job"):
+        client.status('missing')
+    with pytest.raises(app.JobError, match="unknown method"):
+        client.submit(job(campaign, method='midpoint'))
+
+
+@pytest.mark.parametrize('changes', [
+    {'deconvolution': 'gaussian'},
+    {'qy_standards': [1]},
+    {'refractive': 'n'},
+    {'samples': 5},
+    {'samples': [5]},
+    {'standards': {'standard': 1}},
+    {'correction': [1]},
+])
+def test_http_service_rejects_wrong_types(campaign, service_url, changes):
+    request = urllib.request.Request(service_url + '/jobs', data=json.dumps(job(campaign, **changes)).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'})
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(request, timeout=30)
+    assert error.value.code == 400
+    assert json.loads(error.value.read().decode('utf-8'))['error']
+    # Сервис продолжает принимать задания
+    assert app.QYServiceClient(service_url).calculate(job(campaign))['quantum_yield'] is not None
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc'), reason="needs /proc")
+def test_sigterm_stops_worker_processes(campaign):
+    tag = f'qy-sigterm-{os.getpid()}'
+    server, url = start_server(tag)
+    try:
+        app.QYServiceClient(url).calculate(job(campaign))
+        assert len(processes_with(tag)) > 1
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+    assert processes_with(tag) == []
+
+
+def test_job_affinity_depends_on_folder_set_only(campaign):
+    first = app.normalize_job(job(campaign))
+    swapped = app.normalize_job(job(campaign, samples=[campaign['standard']], standards=[campaign['sample']],
+                                    qy_standards={'sample': 40.0}, hv=420))
+    assert app.job_affinity(first, 7) == app.job_affinity(swapped, 7)
+    assert 0 <= app.job_affinity(first, 7) < 7
+
+
+def test_service_routes_jobs_by_folders(campaign):
+    service = app.QYService(workers=3)
+    try:
+        normalized = app.normalize_job(job(campaign))
+        home = app.job_affinity(normalized, 3)
+        assert service._choose_worker(normalized) == home
+        service.pending[home] = 1
+        other = service._choose_worker(normalized)
+        assert other != home and service.pending[other] == 0
+        service.pending = [1, 1, 1]
+        assert service._choose_worker(normalized) == home
+        service.pending = [0, 0, 0]
+
+        for _ in range(2):
+            snapshot = service.submit(job(campaign))
+            *_, last = service.events(snapshot['id'], timeout=60)
+            assert last['status'] == 'done'
+            assert last['result']['quantum_yield']['qy'][0] == pytest.approx([20.0], rel=1e-3)
+        assert service.pending == [0, 0, 0]
+    finally:
+        service.shutdown()
@@ -0,0 +1,106 @@
+import os
+import zipfile
+
+import pytest
+
+import spectroscopy_app as app
+
+
+def zip_folder(folder, path):
+    with zipfile.ZipFile(path, 'w') as archive:
+        for file in sorted(os.listdir(folder)):
+            archive.write(os.path.join(folder, file), file)
+    return str(path)
+
+
+def workspace_of(*folders):
+    workspace = app.Workspace()
+    for folder, role in folders:
+        workspace.add(folder, role).load()
+    workspace.compute(350)
+    return workspace
+
+
+@pytest.fixture
+def counted_hashing(monkeypatch):
+    calls = []
+    original = app.content_hasher
+
+    def hasher():
+        calls.append(1)
+        return original()
+    monkeypatch.setattr(app, 'content_hasher', hasher)
+    return calls
+
+
+def test_save_reuses_content_digests(campaign, tmp_path, counted_hashing):
+    workspace = workspace_of((campaign['sample'], 'sample'), (campaign['standard'], 'standard'))
+    loaded = len(counted_hashing)
+    app.save_session(str(tmp_path / 's.qysession'), workspace, {})
+    assert len(counted_hashing) == loaded
+    manifest = workspace['sample'].manifest()
+    assert manifest[0]['hash'] == app.content_digest(manifest[0]['path'])
+
+
+def test_changed_folder_file_is_reported(campaign, tmp_path):
+    path = str(tmp_path / 's.qysession')
+    app.save_session(path, workspace_of((campaign['sample'], 'sample')), {})
+    assert app.load_session(path)[2] == []
+
+    changed = os.path.join(campaign['sample'], 's1.txt')
+    with open(changed, 'a') as file:
+        file.write("601.0,0.5\n")
+    assert app.load_session(path)[2] == [changed]
+
+
+def test_changed_archive_member_is_reported(campaign, tmp_path):
+    archive = zip_folder(campaign['sample'], tmp_path / 'sample.zip')
+    path = str(tmp_path / 's.qysession')
+    workspace = workspace_of((archive, 'sample'))
+    manifest = workspace['sample'].manifest()
+    assert all('hash' in entry for entry in manifest)
+    app.save_session(path, workspace, {})
+    assert app.load_session(path)[2] == []
+
+    # Другой архив с теми же файлами, кроме s2.txt
+    os.remove(archive)
+    with zipfile.ZipFile(archive, 'w') as rewritten:
+        for file in sorted(os.listdir(campaign['sample'])):
+            if file == 's2.txt':
+                rewritten.writestr(file, b"400,0.5\n")
+            else:
+                rewritten.write(os.path.join(campaign['sample'], file), file)
+    stat = os.stat(archive)
+    os.utime(archive, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert app.load_session(path)[2] == [archive + app.ARCHIVE_SEPARATOR + 's2.txt']
+
+
+def test_missing_archive_member_is_reported(campaign, tmp_path):
+    source = zip_folder(campaign['sample'], tmp_path / 'sample.zip') + app.ARCHIVE_SEPARATOR + 'gone.txt'
+    entry = {'path': source, 'size': -1, 'mtime_ns': 0, 'hash': 'x'}
+    assert app.Dataset('d', 'sample', None).changed_files([entry]) == [source]
+
+
+def open_handles(path):
+    fds = '/proc/self/fd'
+    return sum(os.path.realpath(os.path.join(fds, fd)) == os.path.realpath(path)
+               for fd in os.listdir(fds) if os.path.exists(os.path.join(fds, fd)))
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason="needs /proc")
+def test_session_file_is_not_kept_open(campaign, tmp_path):
+    path = str(tmp_path / 's.qysession')
+    original = workspace_of((campaign['sample'], 'sample'), (campaign['standard'], 'standard'))
+    app.save_session(path, original, {'hv': 350})
+
+    workspace, parameters, _ = app.load_session(path)
+    assert parameters == {'hv': 350}
+    assert open_handles(path) == 0
+    sample = workspace['sample']
+    assert not sample.loaded
+    # Сохранение поверх открытой сессии (спектры читаются из нее же)
+    app.save_session(path, workspace, parameters)
+    assert sample.emission.names == original['sample'].emission.names
+    assert (sample.emission.y == original['sample'].emission.y).all()
+    assert open_handles(path) == 0
+    assert (sample.results['integrals_simpson'] == original['sample'].results['integrals_simpson']).all()
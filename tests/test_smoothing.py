@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+import spectroscopy_app as app
+
+
+def reference_filter(row, window, reduce):
+    """Окно вокруг каждой точки с зеркальным продолжением краев"""
+    half = window // 2
+    padded = np.pad(row, half, mode='reflect')
+    return np.array([reduce(padded[i:i + window]) for i in range(len(row))])
+
+
+def test_savgol_matches_local_polynomial_fits():
+    rng = np.random.default_rng(3)
+    Y = rng.normal(size=(4, 40))
+    smoothed = app.smooth_rows(Y, 'savgol', 7)
+    positions = np.arange(-3, 4)
+
+    def fit_center(values):
+        return np.polyval(np.polyfit(positions, values, app.SAVGOL_ORDER), 0)
+
+    for row, result in zip(Y, smoothed):
+        np.testing.assert_allclose(result, reference_filter(row, 7, fit_center), atol=1e-10)
+
+
+def test_median_matches_per_row_filter():
+    rng = np.random.default_rng(4)
+    Y = rng.normal(size=(3, 25))
+    for window, used in [(5, 5), (4, 5), (100, 25)]:
+        smoothed = app.smooth_rows(Y, 'median', window)
+        for row, result in zip(Y, smoothed):
+            np.testing.assert_array_equal(result, reference_filter(row, used, np.median))
+
+
+def test_whittaker_solves_penalized_system():
+    rng = np.random.default_rng(5)
+    Y = rng.normal(size=(2, 30))
+    D = np.diff(np.eye(30), 2, axis=0)
+    expected = np.linalg.solve(np.eye(30) + 50.0 * D.T @ D, Y.T).T
+    np.testing.assert_allclose(app.smooth_rows(Y, 'whittaker', 50.0), expected, atol=1e-10)
+    # Прямая не штрафуется вторыми разностями
+    line = np.linspace(0, 1, 30)[None, :]
+    np.testing.assert_allclose(app.smooth_rows(line, 'whittaker', 1e4), line, atol=1e-8)
+
+
+def test_smooth_store_groups_spectra_by_length():
+    rng = np.random.default_rng(6)
+    spectra = {f's{i}': (np.arange(n, dtype=float), rng.normal(size=n)) for i, n in enumerate([2, 9, 12, 9, 30])}
+    store = app.SpectrumStore.from_dict(spectra)
+    smoothed = app.smooth_store(store, 'savgol', 5)
+    for (x, y), (_, result) in zip(store, smoothed):
+        np.testing.assert_allclose(result, app.smooth_rows(y[None, :], 'savgol', 5)[0])
+    np.testing.assert_array_equal(smoothed.x, store.x)
+
+
+def test_unknown_smoothing_method():
+    with pytest.raises(ValueError, match="Unknown smoothing method"):
+        app.smooth_rows(np.zeros((1, 10)), 'boxcar', 3)
@@ -0,0 +1,35 @@
+import spectroscopy_app as app
+
+
+def test_manual_trim_replaces_auto_detected_limits(window, campaign):
+    window.process_folder_data(campaign['sample'], 'sample')
+    window.process_folder_data(campaign['standard'], 'standard')
+    window.wavelength_input.setText("350")
+
+    window.auto_detect_limits()
+    dataset = window.workspace['sample']
+    assert dataset.trim is not None
+    assert dataset.effective_trim(window.trim_window()) == tuple(dataset.trim)
+
+    # Ввод границ вручную (textEdited посылается только при правке пользователем)
+    window.trim_min_input.setText("500")
+    window.trim_min_input.textEdited.emit("500")
+    window.trim_max_input.setText("540")
+    window.trim_max_input.textEdited.emit("540")
+    assert all(d.trim is None for d in window.workspace)
+
+    window.workspace.compute(350.0, window.trim_window())
+    assert dataset.results['trim'] == [500.0, 540.0]
+    direct = dataset.emission.trimmed(500.0, 540.0)
+    expected = app.segment_simpson(direct.x, direct.y, direct.offsets)
+    assert abs(dataset.results['integrals_simpson'] - expected).max() < 1e-9 * abs(expected).max()
+
+
+def test_trim_checkbox_click_replaces_auto_detected_limits(window, campaign):
+    window.process_folder_data(campaign['sample'], 'sample')
+    window.auto_detect_limits()
+    assert window.workspace['sample'].trim is not None
+    window.trim_checkbox.click()
+    window.trim_checkbox.click()
+    assert window.workspace['sample'].trim is None
+    assert window.trim_window() == (float(window.trim_min_input.text()), float(window.trim_max_input.text()))